@@ -1,3 +1,33 @@
-from .dispatch import Command, Group, helptext, command, subcommand, handle
-from .flags import Option, FlagSet
-from .exceptions import UserException
+# Everything is imported the first time it is used so that short lived
+# processes only pay for what they need.
+_exports = {
+    'Command': 'dispatch',
+    'Group': 'dispatch',
+    'helptext': 'dispatch',
+    'command': 'dispatch',
+    'subcommand': 'dispatch',
+    'handle': 'dispatch',
+    'Option': 'flags',
+    'FlagSet': 'flags',
+    'UserException': 'exceptions',
+    'CommandTimeout': 'exceptions',
+    'resource': 'resource',
+    'InvocationResult': 'invocation',
+    'lazy': 'types',
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    mod = _exports.get(name)
+    if mod is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    module = __import__(f'{__name__}.{mod}', fromlist=[name])
+    val = getattr(module, name)
+    globals()[name] = val
+    return val
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports))
@@ -1,8 +1,7 @@
+import os
 import sys
-import jinja2
-from .exceptions import UserException
-
-from typing import Tuple, Any
+from .exceptions import UserException, BadFlagError
+from .types import lazy
 
 HELP_TMPL = '''{%- if main_doc -%}
 {{ main_doc }}
@@ -25,33 +24,244 @@ Options:
 
 class _CliBase:
 
+    # whether $DISPATCH_MEMPROFILE profiles building the command
+    _profile_build = True
+
     def __init__(self, **kwrgs):
         self.help_template = kwrgs.pop('help_template', HELP_TMPL)
         self.doc_help = kwrgs.pop('doc_help', False)
+        self._metrics = kwrgs.pop('metrics', None)
+        self._observer = None
+        self._audit = kwrgs.pop('audit', None)
+        self._watch = kwrgs.pop('watch', ())
+        self._audited = None
+        self._flag_index = None
+        self._memprof = None
+        # sub-commands are built while their group's profile is running
+        if self._profile_build and os.environ.get('DISPATCH_MEMPROFILE'):
+            from .memprofile import _from_env
+            self._memprof = _from_env(self.__class__.__name__)
 
-    def help(self, file=sys.stdout):
-        print(self.helptext(), file=file)
+    @property
+    def _help(self) -> str:
+        if self._helpstr is None:
+            return self._meta.helpstr
+        return self._helpstr
+
+    def help(self, file=None):
+        print(self.helptext(), file=file or sys.stdout)
 
     @staticmethod
-    def process_arg(raw) -> Tuple[str, Any]:
+    def process_arg(raw) -> tuple:
         arg = raw.lstrip('-')
         arg, _, val = arg.partition('=')
         return arg.replace('-', '_'), val or None
 
+    @staticmethod
+    def _pop_option(argv: list, name: str, takes_value: bool = False) -> tuple:
+        '''
+        Remove a framework option given as --name or --name=value from argv.
+        Returns the remaining arguments and the option's value which is True
+        when given without a value and None when it was not given at all.
+        With takes_value, the argument after --name is used as its value.
+        '''
+        opt = '--' + name
+        rest = []
+        val = None
+        it = iter(argv)
+        for arg in it:
+            if arg == opt:
+                val = next(it, True) if takes_value else True
+            elif arg.startswith(opt + '='):
+                val = arg[len(opt) + 1:]
+            else:
+                rest.append(arg)
+        return rest, val
+
+    def _call(self, argv: list):
+        '''
+        Run the command within the deadline given with --dispatch-timeout
+        (see dispatch.deadline), or keep running it with --dispatch-watch
+        (see dispatch.watch).
+        '''
+        argv, watch = _CliBase._pop_option(argv, 'dispatch-watch')
+        if watch is not None:
+            return self._watch_loop(argv, watch)
+        argv, timeout = _CliBase._pop_option(argv, 'dispatch-timeout', True)
+        if self._metrics is None and self._audit is None:
+            run = self._profiled
+        else:
+            run = self._observed
+        if timeout is None:
+            return run(argv)
+        from . import deadline
+        secs = deadline.seconds(timeout)
+        return deadline.run(lambda: run(argv), secs)
+
+    def _watch_loop(self, argv: list, watch):
+        from .watch import Watch
+        globs = list(self._watch)
+        if watch is not True:
+            globs.extend(g for g in watch.split(',') if g)
+        try:
+            Watch(self._call, argv, globs).loop()
+        except KeyboardInterrupt:
+            print(file=sys.stderr)
+
+    def _observed(self, argv: list):
+        '''
+        Run the command and record it in the metrics registry and the
+        audit log.
+        '''
+        obs = entry = None
+        if self._metrics is not None:
+            obs = self._observer = self._metrics.observer(self.name)
+        if self._audit is not None:
+            entry = self._audited = self._audit.entry(
+                self.name, self.flags, argv, self._all_flagsets)
+        try:
+            ret = self._profiled(argv)
+        except BaseException as e:
+            if obs is not None:
+                obs.finish(e)
+            if entry is not None:
+                entry.finish(exc=e)
+            raise
+        finally:
+            self._observer = self._audited = None
+        if obs is not None:
+            obs.finish()
+        if entry is not None:
+            entry.finish(ret)
+        return ret
+
+    def _profiled(self, argv: list):
+        '''
+        Run the command, profiling its memory use when asked to with
+        --dispatch-memprofile or $DISPATCH_MEMPROFILE (see
+        dispatch.memprofile).
+        '''
+        argv, out = _CliBase._pop_option(argv, 'dispatch-memprofile')
+        if out is None:
+            out = os.environ.get('DISPATCH_MEMPROFILE') or None
+        if out is None:
+            return self._main(argv)
+
+        from .memprofile import MemProfile
+        prof = self._memprof or MemProfile()
+        prof.name = self.name
+        self._memprof = prof
+        try:
+            return self._main(argv)
+        finally:
+            self._memprof = None
+            prof.finish()
+            prof.report(out)
+
+    def _phase(self, name: str):
+        if self._memprof is not None:
+            self._memprof.begin(name)
+        if self._observer is not None:
+            self._observer.begin(name)
+
+    def _all_flagsets(self) -> list:
+        '''The flag sets of every sub-command, see Group.'''
+        return []
+
+    def _started(self, cmd):
+        '''Called by groups with every sub-command that is parsed.'''
+        if self._observer is not None:
+            self._observer.subcommands.append(cmd.name)
+        if self._audited is not None:
+            self._audited.commands.append(cmd)
+
+    def _built(self):
+        '''Called at the end of __init__.'''
+        if self._memprof is not None:
+            self._memprof.end()
+        metrics = self._metrics
+        if metrics or (metrics is None and os.environ.get('DISPATCH_METRICS_DIR')):
+            from .metrics import _new_registry
+            self._metrics = _new_registry(metrics, self.name)
+        else:
+            self._metrics = None
+        if self._audit is not None:
+            from .audit import _new_audit_log
+            self._audit = _new_audit_log(self._audit)
+
+    def invoke(self, argv: list = (), *, capture: bool = True):
+        '''
+        Run the command in-process without exiting. Returns an
+        InvocationResult with the return value, exit code, exception and
+        (when capture is True) everything printed to stdout and stderr.
+        '''
+        from .invocation import _invoke
+        return _invoke(lambda: self._call(list(argv)), capture)
+
+    def invoke_kwargs(self, *args, capture: bool = True, **flags):
+        '''
+        Like invoke but the flags are given as keyword arguments and the
+        positional arguments (for groups, starting with the sub-command's
+        name) as arguments. No command line parsing is done, string values
+        are converted to the flag's type and anything else is used as is.
+        '''
+        from .invocation import _invoke
+        return _invoke(lambda: self._main_kwargs(args, flags), capture)
+
+    def _set_flags(self, flags: dict):
+        for name, val in flags.items():
+            flag = self.flags.get(name)
+            if flag is None:
+                raise BadFlagError(
+                    f'--{name} is not a flag for {self.name!r}' +
+                    self._flag_hint(name))
+            flag.setval(val)
+
+    def _flag_hint(self, name: str) -> str:
+        '''
+        The end of the error message for an unknown flag, suggests the
+        closest flags of the command (and of its group).
+        '''
+        from ._suggest import flag_index, hint
+        if self._flag_index is None:
+            group = getattr(self, 'group', None)
+            flagsets = (self.flags,) if group is None else (self.flags, group.flags)
+            self._flag_index = flag_index(*flagsets)
+        return hint(self._flag_index.suggest(name))
+
+    def _reset_values(self):
+        '''Put every flag back to its default before parsing.'''
+        for f in self.flags.values():
+            f._value = f._default
+
+    def _load_config(self, argv: list) -> list:
+        '''
+        Set flag defaults from the config files and return argv without
+        the --config option.
+        '''
+        path = None
+        if 'config' not in self.flags:
+            argv, path = _CliBase._pop_option(argv, 'config', True)
+            if path is True:
+                raise UserException('no value given for --config')
+        self._config_values = self._config.load(path)
+        self._config.apply(self.flags, self._config_values)
+        return argv
+
     def helptext(self, template=None):
         if self.doc_help:
             return self._meta.doc
 
-        flags = list(self.flags.visible_flags())
+        from .flags import _Padded
         fmt_len = self.flags.format_len
-        for f in flags:
-            f.f_len = fmt_len
+        flags = [_Padded(f, fmt_len) for f in self.flags.visible_flags()]
 
         if hasattr(self, '_command_help'):
             command_help = self._command_help()
         else:
             command_help = None
 
+        import jinja2
         tmpl = jinja2.Template(template or self.help_template)
         return tmpl.render({
             'main_doc': self._help,
@@ -60,7 +270,15 @@ class _CliBase:
             'command_help': command_help,
         })
 
-    def _setflag_from_args(self, args: list, arg: str, val: Any, flag):
+    def manifest(self) -> dict:
+        '''
+        Describe the command, its flags and sub-commands in a dict of JSON
+        values, see dispatch.launcher.
+        '''
+        from .launcher import manifest
+        return manifest(self)
+
+    def _setflag_from_args(self, args: list, arg: str, val, flag):
         '''
         Do not use this.
 
@@ -82,7 +300,39 @@ class _CliBase:
             # catch the case where '=' has been used
             if val:
                 raise UserException(f'cannot give {flag.name!r} flag a value')
-            elif flag.has_default:
+            elif flag.has_default and not isinstance(flag._default, lazy):
                 flag.value = not flag._default
             else:
-                flag.value = True
\ No newline at end of file
+                flag.value = True
+
+
+async def _as_coroutine(aw):
+    return await aw
+
+
+def _run_callback(fn, timeout: float = None, loop=None):
+    '''
+    Call fn and await its result, within timeout and the deadline of the
+    command that is running.
+    '''
+    if timeout is None and not _in_deadline():
+        res = fn()
+        if hasattr(res, '__await__'):
+            res = _await(res, loop)
+        return res
+    from .deadline import run
+    return run(fn, timeout, loop)
+
+
+def _in_deadline() -> bool:
+    # dispatch.deadline is only imported once a deadline has been set
+    mod = sys.modules.get(__package__ + '.deadline')
+    return mod is not None and mod._current.get() is not None
+
+
+def _await(aw, loop=None):
+    '''Run an awaitable to completion, on loop if one is given.'''
+    if loop is not None:
+        return loop.run_until_complete(aw)
+    import asyncio
+    return asyncio.run(_as_coroutine(aw))
@@ -0,0 +1,192 @@
+'''
+Opening input files that may be compressed.
+
+The format is found from the first bytes of the file, not its name, so
+stdin and files without an extension work too. Decompression can be done
+by a background thread: zlib, bz2 and lzma release the GIL while they work,
+so the file is decompressed while the callback processes the data that has
+already been read.
+'''
+import io
+import os
+import sys
+import threading
+import time
+
+BUFFER_SIZE = 1 << 20
+
+# magic bytes: module name
+MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'lzma'),
+)
+
+
+def detect(head: bytes):
+    '''Returns the name of the module that decompresses head or None.'''
+    for magic, name in MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_input(path, *, text: bool = False, encoding: str = None,
+               errors: str = None, buffer_size: int = BUFFER_SIZE,
+               threaded: bool = False):
+    '''
+    Open path ('-' for stdin) for reading, decompressing gzip, bzip2 and xz
+    files. Returns a buffered binary reader, or a text reader with text.
+    '''
+    path = os.fspath(path)
+    if path == '-':
+        # don't close stdin when the reader is closed
+        raw = open(sys.stdin.fileno(), 'rb', buffering=buffer_size,
+                   closefd=False)
+    else:
+        raw = open(path, 'rb', buffering=buffer_size)
+
+    try:
+        kind = detect(raw.peek(6)[:6])
+        if kind is None:
+            stream = raw
+        else:
+            stream = _decompressor(kind, raw)
+            if threaded:
+                stream = _ThreadedReader(stream)
+            stream = io.BufferedReader(stream, buffer_size)
+    except BaseException:
+        raw.close()
+        raise
+
+    if text:
+        stream = io.TextIOWrapper(stream, encoding=encoding, errors=errors)
+    try:
+        stream.compression = kind
+        stream.path = path
+    except AttributeError:
+        pass
+    return stream
+
+
+def _decompressor(kind: str, raw):
+    if kind == 'gzip':
+        import gzip
+        return _Owning(gzip.GzipFile(fileobj=raw, mode='rb'), raw)
+    elif kind == 'bz2':
+        import bz2
+        return _Owning(bz2.BZ2File(raw, 'rb'), raw)
+    import lzma
+    return _Owning(lzma.LZMAFile(raw, 'rb'), raw)
+
+
+class _Owning(io.RawIOBase):
+    '''
+    Reads from a decompressor and closes the underlying file with it
+    (the decompressors leave file objects they are given open).
+    '''
+
+    def __init__(self, stream, raw):
+        self._stream = stream
+        self._raw = raw
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._stream.readinto(b)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self._stream.close()
+            finally:
+                self._raw.close()
+        super().close()
+
+
+class _ThreadedReader(io.RawIOBase):
+    '''
+    Reads a stream in a background thread, the chunks are handed over
+    through a bounded queue.
+    '''
+
+    CHUNK = 1 << 18
+    DEPTH = 8  # chunks read ahead
+    CLOSE_TIMEOUT = 1.0  # seconds to wait for the thread on close
+
+    def __init__(self, stream):
+        import queue
+        self._stream = stream
+        self._queue = queue.Queue(self.DEPTH)
+        self._stop = threading.Event()
+        self._buf = memoryview(b'')
+        self._done = False
+        self._thread = threading.Thread(
+            target=_read_ahead,
+            args=(stream, self._queue, self._stop, self.CHUNK),
+            daemon=True,
+        )
+        self._thread.start()
+
+    def readable(self):
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._buf:
+            if self._done:
+                return 0
+            chunk = self._queue.get()
+            if isinstance(chunk, BaseException):
+                self._done = True
+                raise chunk
+            if not chunk:
+                self._done = True
+                return 0
+            self._buf = memoryview(chunk)
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            # unblock the thread if it is waiting on a full queue, but don't
+            # wait for a read that may never return (a tty or a pipe)
+            end = time.monotonic() + self.CLOSE_TIMEOUT
+            while self._thread.is_alive() and time.monotonic() < end:
+                try:
+                    self._queue.get(timeout=0.01)
+                except Exception:
+                    pass
+            if not self._thread.is_alive():
+                self._stream.close()
+            # otherwise the thread closes the stream when its read returns
+        super().close()
+
+
+def _read_ahead(stream, q, stop, size: int):
+    # this only references the stream and queue so that the reader can be
+    # garbage collected (and closed) while the thread is running
+    import queue
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    try:
+        while not stop.is_set():
+            chunk = stream.read(size)
+            put(chunk)
+            if not chunk:
+                return
+    except BaseException as e:
+        put(e)
+    finally:
+        if stop.is_set():
+            stream.close()
@@ -0,0 +1,276 @@
+'''
+Running the sub-commands of a group as a dependency graph.
+
+    @command
+    class make:
+        def fetch(self): ...
+        def build(self): ...
+
+        @subcommand(needs=['fetch', 'build'])
+        def test(self): ...
+
+        @subcommand(needs=['test'])
+        def release(self): ...
+
+    $ make run release --jobs 4
+
+When a sub-command declares what it needs the group gets a 'run'
+sub-command (unless it has one of its own) that runs its targets after
+everything they need. Sub-commands that don't depend on each other run at
+the same time in a pool of threads, processes or an event loop, with at
+most --jobs of them running at once. Every sub-command runs with its
+default flags (and config file values) against the group's instance and
+runs once, even when several others need it. With reuse=True (or in a
+shell) sub-commands that already ran on the instance are skipped unless
+--force is given.
+
+The thread and async pools share the instance, the process pool forks a
+copy of it for each sub-command.
+'''
+import os
+import sys
+import contextvars
+from concurrent import futures
+
+from .exceptions import DeveloperException, UserException
+
+POOLS = ('thread', 'process', 'async')
+CO_COROUTINE = 0x80
+
+
+def _name(name: str) -> str:
+    return name.replace('-', '_')
+
+
+def graph(commands: dict) -> dict:
+    '''
+    Returns {name: needs} for every command and checks that the needs
+    exist and have no cycles.
+    '''
+    res = {
+        name: tuple(_name(n) for n in getattr(cmd, 'needs', ()))
+        for name, cmd in commands.items()
+    }
+    for name, needs in res.items():
+        for n in needs:
+            if n not in res:
+                raise DeveloperException(
+                    f'{name!r} needs {n!r} which is not a command')
+
+    # depth first search for a cycle
+    state: dict = {}  # name: 1 while visiting, 2 when done
+    def visit(name, path):
+        if state.get(name) == 2:
+            return
+        if state.get(name) == 1:
+            cycle = path[path.index(name):] + [name]
+            raise DeveloperException(
+                'sub-commands need each other: ' + ' -> '.join(cycle))
+        state[name] = 1
+        for n in res[name]:
+            visit(n, path + [name])
+        state[name] = 2
+    for name in res:
+        visit(name, [])
+    return res
+
+
+def plan(graph: dict, targets, done=()) -> dict:
+    '''
+    Returns {name: set of needs} of the targets and everything they need,
+    without the steps that are already done.
+    '''
+    steps: dict = {}
+    todo = [_name(t) for t in targets]
+    while todo:
+        name = todo.pop()
+        if name in steps or name in done:
+            continue
+        needs = {n for n in graph[name] if n not in done}
+        steps[name] = needs
+        todo.extend(needs)
+    return steps
+
+
+def _runner(group):
+    '''Create the 'run' sub-command of a group.'''
+    def run(self, *targets, jobs: int = 0, pool: str = 'thread',
+            force: bool = False):
+        '''
+        Run sub-commands after everything they need.
+
+        Args:
+            jobs: the most sub-commands to run at once, defaults to the
+                number of cpus
+            pool: run sub-commands in 'thread', 'process' or 'async' workers
+            force: also run the sub-commands that already ran
+        '''
+        return _execute(group, self, targets, jobs, pool, force)
+    return run
+
+
+def _execute(group, inst, targets, jobs: int, pool: str, force: bool) -> int:
+    if not targets:
+        raise UserException('no sub-commands given to run')
+    if pool not in POOLS:
+        raise UserException(f'--pool should be one of {POOLS}, got {pool!r}')
+    if pool == 'process':
+        from ._parallel import can_fork
+        if not can_fork():
+            raise UserException(
+                "--pool process needs the fork start method, which this "
+                "platform doesn't have")
+    for t in targets:
+        if not group.iscommand(t) or _name(t) == 'run':
+            raise UserException(f'{t!r} is not a command')
+
+    # the steps that already ran on this instance
+    if group._done[0] is not inst:
+        group._done = (inst, set())
+    done = group._done[1]
+    if force:
+        done.clear()
+
+    steps = plan(group._graph, targets, done)
+    jobs = jobs or os.cpu_count() or 1
+    if pool == 'async':
+        failed = _run_async(group, steps, done, jobs)
+    else:
+        failed = _run_pool(group, steps, done, jobs, pool)
+    for name, err in failed:
+        print(f'Error: {name}: {err}', file=sys.stderr)
+    return 1 if failed else 0
+
+
+def _prepare(group, name: str):
+    '''Get a sub-command ready to run with its default flags.'''
+    cmd = group._get_command(name)
+    cmd._reset_values()
+    cmd.args = []
+    cmd._loop = None  # steps don't run on the group's event loop thread
+    section = group._config_values.get(cmd.name)
+    if section:
+        group._config.apply(cmd.flags, section, reset=False)
+    return cmd, cmd._flag_values()
+
+
+def _step(cmd, fn_args: dict):
+    res = cmd._execute(fn_args)
+    sys.stdout.flush()
+    if isinstance(res, int) and not isinstance(res, bool) and res:
+        raise UserException(f'exit code {res}')
+    return None
+
+
+def _ready(steps: dict) -> list:
+    return sorted(name for name, needs in steps.items() if not needs)
+
+
+def _finish(steps: dict, name: str):
+    del steps[name]
+    for needs in steps.values():
+        needs.discard(name)
+
+
+def _run_pool(group, steps: dict, done: set, jobs: int, kind: str) -> list:
+    if kind == 'thread':
+        pool = futures.ThreadPoolExecutor(max_workers=jobs)
+        # each step sees the group's deadline, in a context of its own
+        submit = lambda name: pool.submit(
+            contextvars.copy_context().run, _step, *_prepare(group, name))
+        keys = []
+    else:
+        # the steps have to be registered before the workers are forked
+        from ._parallel import fork_context, register, run_registered
+        keys = [
+            (name, register(lambda args=_prepare(group, name): _step(*args)))
+            for name in steps
+        ]
+        key_of = dict(keys)
+        pool = futures.ProcessPoolExecutor(
+            max_workers=jobs, mp_context=fork_context())
+        submit = lambda name: pool.submit(run_registered, key_of[name])
+
+    failed = []
+    running: dict = {}
+    ok = False
+    try:
+        while True:
+            if not failed:
+                for name in _ready(steps):
+                    if len(running) >= jobs:
+                        break
+                    if name not in running.values():
+                        running[submit(name)] = name
+            if not running:
+                break
+            finished, _ = futures.wait(
+                running, return_when=futures.FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                err = fut.exception()
+                if err is not None:
+                    failed.append((name, err))
+                    continue
+                done.add(name)
+                _finish(steps, name)
+        ok = True
+    finally:
+        # don't wait for the steps still running after a timeout
+        pool.shutdown(wait=ok, cancel_futures=True)
+        if keys:
+            from ._parallel import unregister
+            for _, key in keys:
+                unregister(key)
+    return failed
+
+
+def _run_async(group, steps: dict, done: set, jobs: int) -> list:
+    import asyncio
+
+    async def main():
+        sem = asyncio.Semaphore(jobs)
+        failed = []
+        tasks: dict = {}
+
+        async def run(name):
+            needs = [tasks[n] for n in steps[name]]
+            if needs:
+                await asyncio.wait(needs)
+                if not all(t.result() for t in needs):
+                    return False  # something it needs failed
+            async with sem:
+                cmd, fn_args = _prepare(group, name)
+                try:
+                    if cmd._meta.code.co_flags & CO_COROUTINE:
+                        res = await cmd._callback([], fn_args)
+                        if isinstance(res, int) and not isinstance(res, bool) and res:
+                            raise UserException(f'exit code {res}')
+                        if res and isinstance(res, str):
+                            print(res)
+                    else:
+                        await asyncio.to_thread(_step, cmd, fn_args)
+                except Exception as e:
+                    failed.append((name, e))
+                    return False
+            done.add(name)
+            return True
+
+        # create the tasks of the needs before the steps that need them
+        order = []
+        left = {n: set(needs) for n, needs in steps.items()}
+        while left:
+            ready = _ready(left)
+            order.extend(ready)
+            for name in ready:
+                _finish(left, name)
+        for name in order:
+            tasks[name] = asyncio.ensure_future(run(name))
+        if tasks:
+            await asyncio.wait(tasks.values())
+        return failed
+
+    loop = group._loop
+    if loop is not None:
+        return loop.run_until_complete(main())
+    return asyncio.run(main())
@@ -0,0 +1,149 @@
+'''
+Parameters annotated with a dataclass.
+
+Each field of the dataclass becomes a flag of its own (named <prefix><field>)
+and the dataclass is built from the parsed flag values when the command
+runs. The function that builds it is generated once per dataclass and
+prefix, so creating the dataclass costs no more than calling it directly.
+'''
+import sys
+import dataclasses
+
+from . import _docs
+from .flags import Option
+from .exceptions import DeveloperException
+
+# {(dataclass, prefix): build function}
+_builders: dict = {}
+
+
+class _DataclassParam:
+
+    __slots__ = ('name', 'cls', 'prefix', 'fields', 'build')
+
+    def __init__(self, name: str, cls: type, prefix: str = ''):
+        self.name = name
+        self.cls = cls
+        self.prefix = prefix
+        self.fields = [f for f in dataclasses.fields(cls) if f.init]
+        self.build = builder(cls, prefix)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.name!r}, {self.cls.__name__})'
+
+    def options(self, fallback, shorthands: dict = None, docs: dict = None,
+                defaults: dict = None, hidden: set = ()) -> list:
+        '''
+        Create the flags for the dataclass fields. The shorthands, docs,
+        defaults and hidden settings are the command's and use flag names.
+        '''
+        shorthands = shorthands or {}
+        docs = docs or {}
+        defaults = defaults or {}
+        mod = sys.modules.get(self.cls.__module__)
+        ns = getattr(mod, '__dict__', None)
+        own_doc = _has_docstring(self.cls)
+        doc_shorts = _docs.shorthands(self.cls, self.cls.__doc__) \
+            if own_doc else {}
+        field_docs = _FieldDocs(self.cls if own_doc else None,
+                                self.prefix, fallback)
+
+        opts = []
+        for f in self.fields:
+            name = self.prefix + f.name
+            if name in defaults:
+                value = defaults[name]
+            elif f.default is not dataclasses.MISSING:
+                value = f.default
+            else:
+                value = None  # required or uses a default_factory
+            opts.append(Option(
+                name, f.type,
+                shorthand=shorthands.get(name) or doc_shorts.get(f.name),
+                help=docs.get(name),
+                docs=field_docs,
+                value=value,
+                hidden=name in hidden,
+                namespace=ns,
+            ))
+        return opts
+
+
+class _FieldDocs:
+    '''
+    Finds the help text of a field flag in the command's docstring and
+    then in the dataclass's docstring.
+    '''
+
+    __slots__ = ('cls', 'prefix', 'fallback')
+
+    def __init__(self, cls, prefix: str, fallback):
+        self.cls = cls
+        self.prefix = prefix
+        self.fallback = fallback
+
+    def flagdoc(self, name: str) -> str:
+        doc = self.fallback.flagdoc(name) if self.fallback else ''
+        if not doc and self.cls is not None:
+            field = name[len(self.prefix):]
+            flags = _docs.parse(self.cls, self.cls.__doc__)[1]
+            doc = flags.get(field, {}).get('doc') or ''
+        return doc
+
+
+def _has_docstring(cls) -> bool:
+    # dataclasses without a docstring get their signature as a docstring
+    doc = cls.__doc__
+    return bool(doc) and not doc.startswith(cls.__name__ + '(')
+
+
+def builder(cls: type, prefix: str = ''):
+    '''
+    Returns a function that pops the field flags out of a dict of flag
+    values and creates the dataclass from them.
+    '''
+    key = (cls, prefix)
+    fn = _builders.get(key)
+    if fn is not None:
+        return fn
+
+    ns = {'cls': cls}
+    lines = ['def build(values):']
+    kwargs = []
+    for i, f in enumerate(dataclasses.fields(cls)):
+        if not f.init:
+            continue
+        lines.append(f'    v{i} = values.pop({prefix + f.name!r})')
+        if f.default_factory is not dataclasses.MISSING:
+            ns[f'factory{i}'] = f.default_factory
+            lines.append(f'    if v{i} is None:')
+            lines.append(f'        v{i} = factory{i}()')
+        kwargs.append(f'{f.name}=v{i}')
+    lines.append(f'    return cls({", ".join(kwargs)})')
+    exec('\n'.join(lines), ns)
+    fn = _builders[key] = ns['build']
+    return fn
+
+
+def _expand(fset, meta, params: dict, prefix=None, **settings) -> tuple:
+    '''
+    Add flags for the fields of every dataclass parameter to fset. prefix
+    is True to use '<param>_', a string, or a dict of {param: prefix}.
+    '''
+    res = []
+    for name, cls in params.items():
+        if isinstance(prefix, dict):
+            pre = prefix.get(name, '')
+        elif prefix is True:
+            pre = name + '_'
+        else:
+            pre = prefix or ''
+        param = _DataclassParam(name, cls, pre)
+        for opt in param.options(meta, **settings):
+            if opt.name in fset._flags:
+                raise DeveloperException(
+                    f'flag --{opt.name} of {cls.__name__} is already a flag, '
+                    'use a prefix')
+            fset[opt.name] = opt
+        res.append(param)
+    return tuple(res)
@@ -0,0 +1,496 @@
+'''
+Fan-out of a command's positional arguments to worker processes over TCP.
+
+A command created with parallel='tcp' is run as the coordinator on one
+host and as a worker on any number of hosts:
+
+    $ export DISPATCH_TOKEN=...                             # on every host
+    $ backfill --dispatch-listen 0.0.0.0:7600 --day 2024-01-01 shard-*.csv
+    $ backfill --dispatch-worker coordinator-host:7600      # on each host
+
+The coordinator sends its flag values to every worker and then hands out
+chunks of positional arguments. Workers ask for the next chunk when they
+are done with the last one, so fast workers do more of the work. Once
+there is nothing left to hand out, idle workers get a copy of the chunk
+that has been running the longest and whichever copy finishes first is
+used, so one slow or stuck worker doesn't hold up the end of the run.
+Chunks of a worker that goes away, and items that raise, are retried.
+
+Results are printed in the order of the arguments (unless ordered=False)
+like the other parallel modes. They are sent back as JSON, anything that
+is not JSON is sent as its str.
+
+The coordinator and its workers prove to each other that they know the
+same token (the token option or $DISPATCH_TOKEN) before any flag values
+are sent. Without a token the coordinator only listens on loopback
+addresses. The token is not sent but the messages are not encrypted, use
+a tunnel on untrusted networks. Hidden flags are never sent, give them to
+every worker on its command line:
+
+    $ backfill --dispatch-worker coordinator-host:7600 --api-key "$KEY"
+
+The coordinator fails with an error once it has had no workers for
+connect_timeout seconds.
+
+Messages are JSON objects, each one sent as a 4 byte big-endian length
+followed by the UTF-8 encoded JSON.
+'''
+import os
+import sys
+import hmac
+import json
+import time
+import socket
+import secrets
+import ipaddress
+import itertools
+import threading
+from collections import deque
+
+from ._base import _await
+from .exceptions import DeveloperException, UserException
+
+DEFAULT_ADDRESS = '127.0.0.1:7600'
+TOKEN_ENV = 'DISPATCH_TOKEN'
+MAX_FRAME = 64 << 20
+# the most copies of one chunk that run at the same time
+MAX_COPIES = 2
+
+
+def _send(sock, msg: dict):
+    data = json.dumps(msg).encode()
+    sock.sendall(len(data).to_bytes(4, 'big') + data)
+
+
+def _recv(f):
+    '''Read one message from a file made by socket.makefile, None at EOF.'''
+    head = f.read(4)
+    if len(head) < 4:
+        return None
+    size = int.from_bytes(head, 'big')
+    if size > MAX_FRAME:
+        raise ConnectionError(f'message of {size} bytes is too large')
+    data = f.read(size)
+    if len(data) < size:
+        return None
+    return json.loads(data)
+
+
+def _address(addr: str) -> tuple:
+    host, sep, port = str(addr).rpartition(':')
+    if not sep:
+        raise UserException(f'expected HOST:PORT, got {addr!r}')
+    try:
+        return host, int(port)
+    except ValueError:
+        raise UserException(f'invalid port in {addr!r}') from None
+
+
+def _loopback(host: str) -> bool:
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _sign(token, nonce: str, name: str) -> str:
+    '''Proof that the sender knows token, '' without one.'''
+    if not token:
+        return ''
+    msg = f'{nonce}\0{name}'.encode()
+    return hmac.new(token.encode(), msg, 'sha256').hexdigest()
+
+
+def _jsonable(val):
+    try:
+        json.dumps(val)
+    except (TypeError, ValueError):
+        return str(val)
+    return val
+
+
+def _run_item(fn, item, kwargs: dict) -> tuple:
+    try:
+        res = fn(item, **kwargs)
+        if hasattr(res, '__await__'):
+            res = _await(res)
+    except Exception as e:
+        return False, [e.__class__.__name__, str(e)]
+    return True, _jsonable(res)
+
+
+class _Chunk:
+
+    __slots__ = ('id', 'items', 'attempts', 'runners', 'started')
+
+    def __init__(self, id: int, items: list):
+        self.id = id
+        self.items = items  # [(index, item)]
+        self.attempts = 0
+        self.runners: set = set()
+        self.started = 0.0
+
+
+class _Cluster:
+    '''
+    _Cluster runs a command's callback over its positional arguments on
+    workers connected over TCP. It has the same run method as _FanOut.
+    '''
+
+    mode = 'tcp'
+
+    def __init__(self, command, chunksize: int = 1, ordered: bool = True,
+                 errors: str = 'raise', retries: int = 2,
+                 address: str = DEFAULT_ADDRESS, connect_timeout: float = 30,
+                 token: str = None):
+        if errors not in ('raise', 'continue'):
+            raise DeveloperException(
+                f"errors should be one of ('raise', 'continue'), got {errors!r}")
+        if chunksize < 1:
+            raise DeveloperException('chunksize must be at least 1')
+        self.command = command
+        self.chunksize = chunksize
+        self.ordered = ordered
+        self.errors = errors
+        self.retries = retries
+        self.address = address
+        self.connect_timeout = connect_timeout
+        self._token = token
+        self.worker = None  # the coordinator's address in worker mode
+        self.bound = None  # (host, port) the coordinator is listening on
+        self.listening = threading.Event()
+
+    @property
+    def token(self):
+        return self._token or os.environ.get(TOKEN_ENV) or None
+
+    def options(self, argv: list) -> list:
+        '''Pop --dispatch-listen and --dispatch-worker out of argv.'''
+        from ._base import _CliBase
+        argv, listen = _CliBase._pop_option(argv, 'dispatch-listen', True)
+        argv, worker = _CliBase._pop_option(argv, 'dispatch-worker', True)
+        for name, val in (('listen', listen), ('worker', worker)):
+            if val is True:
+                raise UserException(f'no address given for --dispatch-{name}')
+        if listen is not None:
+            self.address = listen
+        self.worker = worker
+        return argv
+
+    def run(self, fn, items: list, kwargs: dict, out=None) -> tuple:
+        '''
+        Coordinate a run over items. Returns the list of results (in input
+        order) and the exit code, see _FanOut.run.
+        '''
+        out = out or sys.stdout
+        results: list = [None] * len(items)
+        if not items:
+            return results, 0
+        coord = _Coordinator(self, items)
+        code = 0
+        try:
+            coord.start()
+            for i, ok, res in coord.completed():
+                if not ok:
+                    name, msg = res
+                    res = RuntimeError(f'{name}: {msg}')
+                results[i] = res
+                if not ok:
+                    if self.errors == 'raise':
+                        raise res
+                    print(f'Error: {items[i]}: {res}', file=sys.stderr)
+                    code = max(code, 1)
+                elif isinstance(res, bool):
+                    continue
+                elif isinstance(res, int):
+                    code = max(code, res)
+                elif res and isinstance(res, str):
+                    print(res, file=out)
+        finally:
+            coord.stop()
+        return results, code
+
+    def _flags(self) -> dict:
+        flags = {}
+        for name, flag in self.command.flags.items():
+            val = flag.value
+            if val is not None and not flag.hidden:
+                flags[name] = _jsonable(val)
+        return flags
+
+    def work(self, argv: list = ()) -> int:
+        '''
+        Run as a worker for the coordinator at self.worker. argv has the
+        values of the hidden flags, which the coordinator doesn't send.
+        '''
+        cmd = self.command
+        cmd.parse_args(list(argv))
+        token = self.token
+        sock = _connect(_address(self.worker), self.connect_timeout)
+        with sock, sock.makefile('rb') as f:
+            try:
+                challenge = _recv(f)
+                if challenge is None:
+                    raise UserException('the coordinator closed the connection')
+                nonce = secrets.token_hex(16)
+                _send(sock, {'type': 'hello', 'command': cmd.name,
+                             'pid': os.getpid(), 'host': socket.gethostname(),
+                             'nonce': nonce,
+                             'auth': _sign(token, challenge['nonce'], cmd.name)})
+                setup = _recv(f)
+                if setup is None:
+                    raise UserException('the coordinator closed the connection')
+                if setup['type'] == 'error':
+                    raise UserException(setup['message'])
+                if not hmac.compare_digest(
+                        setup.get('auth', ''), _sign(token, nonce, cmd.name)):
+                    raise UserException(
+                        'the coordinator did not prove it has the token')
+
+                cmd.args = []
+                cmd._set_flags(setup['flags'])
+                kwargs = cmd._flag_values()
+                fn = cmd._meta.run
+
+                _send(sock, {'type': 'ready'})
+                while True:
+                    msg = _recv(f)
+                    if msg is None or msg['type'] == 'done':
+                        return 0
+                    res = [
+                        (i, *_run_item(fn, item, kwargs))
+                        for i, item in msg['items']
+                    ]
+                    _send(sock, {'type': 'result', 'id': msg['id'],
+                                 'results': res})
+            except (ConnectionError, BrokenPipeError):
+                return 0  # the coordinator finished without this worker
+
+
+def _connect(addr: tuple, timeout: float):
+    '''Connect to the coordinator, waiting for it to start listening.'''
+    end = time.monotonic() + timeout
+    while True:
+        try:
+            return socket.create_connection(addr, timeout=None)
+        except OSError:
+            if time.monotonic() >= end:
+                raise UserException(
+                    f'could not connect to a coordinator at {addr[0]}:{addr[1]}')
+            time.sleep(0.1)
+
+
+class _Coordinator:
+    '''The state of one coordinated run, shared by the connection threads.'''
+
+    def __init__(self, cluster: _Cluster, items: list):
+        self.cluster = cluster
+        self.name = cluster.command.name
+        self.flags = cluster._flags()
+        self._ids = itertools.count()
+        self._workers = itertools.count()
+        pairs = list(enumerate(items))
+        n = cluster.chunksize
+        self.chunks = {}
+        for i in range(0, len(pairs), n):
+            c = _Chunk(next(self._ids), pairs[i:i + n])
+            self.chunks[c.id] = c
+        self.pending = deque(self.chunks)
+        self.left = len(items)
+        self.results: dict = {}  # {index: (ok, value)}
+        self.finished = False
+        self.token = cluster.token
+        self.workers = 0  # connected
+        self._idle = time.monotonic()  # since there have been no workers
+        self._done: list = []  # indexes in the order they completed
+        self._cond = threading.Condition()
+        self._sock = None
+
+    def start(self):
+        host, port = _address(self.cluster.address)
+        if not self.token and not _loopback(host):
+            raise UserException(
+                f'set ${TOKEN_ENV} to listen on {host}:{port}, without a '
+                'token the coordinator only listens on loopback addresses')
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen()
+        self._sock = sock
+        self.cluster.bound = sock.getsockname()[:2]
+        self.cluster.listening.set()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def stop(self):
+        with self._cond:
+            self.finished = True
+            self._cond.notify_all()
+        self.cluster.listening.clear()
+        if self._sock is not None:
+            self._sock.close()
+
+    def completed(self):
+        '''
+        Yield (index, ok, result) for every item, in input order when the
+        run is ordered.
+        '''
+        nxt = 0
+        yielded = 0
+        total = len(self.results) + self.left
+        timeout = self.cluster.connect_timeout
+        while yielded < total:
+            with self._cond:
+                while not self._done:
+                    left = None
+                    if not self.workers:
+                        left = self._idle + timeout - time.monotonic()
+                        if left <= 0:
+                            host, port = self.cluster.bound
+                            raise UserException(
+                                f'no workers connected to {host}:{port} '
+                                f'for {timeout:g}s')
+                    self._cond.wait(left)
+                done, self._done = self._done, []
+            if not self.cluster.ordered:
+                for i in done:
+                    yielded += 1
+                    yield (i, *self.results[i])
+                continue
+            while nxt in self.results:
+                yielded += 1
+                yield (nxt, *self.results[nxt])
+                nxt += 1
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return  # closed by stop
+            threading.Thread(
+                target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        wid = next(self._workers)
+        joined = False
+        try:
+            with conn, conn.makefile('rb') as f:
+                nonce = secrets.token_hex(16)
+                _send(conn, {'type': 'challenge', 'nonce': nonce})
+                hello = _recv(f)
+                if hello is None:
+                    return
+                # checked before anything about the run is sent
+                if not hmac.compare_digest(
+                        str(hello.get('auth', '')),
+                        _sign(self.token, nonce, self.name)):
+                    _send(conn, {'type': 'error',
+                                 'message': 'the worker has the wrong token'})
+                    return
+                if hello.get('command') != self.name:
+                    _send(conn, {
+                        'type': 'error',
+                        'message': f'the coordinator is running {self.name!r}, '
+                                   f'not {hello.get("command")!r}',
+                    })
+                    return
+                _send(conn, {
+                    'type': 'setup', 'flags': self.flags,
+                    'auth': _sign(self.token, str(hello.get('nonce')), self.name),
+                })
+                with self._cond:
+                    self.workers += 1
+                    joined = True
+                while True:
+                    msg = _recv(f)
+                    if msg is None:
+                        return
+                    if msg['type'] == 'result':
+                        self._record(wid, msg)
+                    chunk = self._next(wid)
+                    if chunk is None:
+                        _send(conn, {'type': 'done'})
+                        return
+                    _send(conn, {'type': 'task', 'id': chunk.id,
+                                 'items': chunk.items})
+        except (OSError, ValueError, AttributeError):
+            pass  # the worker went away or sent something else
+        finally:
+            self._lost(wid, joined)
+
+    def _next(self, wid: int):
+        '''Wait for a chunk for the worker, None when the run is over.'''
+        with self._cond:
+            while not self.finished:
+                while self.pending:
+                    chunk = self.chunks.get(self.pending.popleft())
+                    if chunk is not None and not chunk.runners:
+                        return self._assign(chunk, wid)
+                # steal the chunk that has been running the longest
+                running = [
+                    c for c in self.chunks.values()
+                    if c.runners and wid not in c.runners and
+                    len(c.runners) < MAX_COPIES
+                ]
+                if running:
+                    return self._assign(
+                        min(running, key=lambda c: c.started), wid)
+                self._cond.wait()
+            return None
+
+    def _assign(self, chunk: _Chunk, wid: int) -> _Chunk:
+        if not chunk.runners:
+            chunk.attempts += 1
+            chunk.started = time.monotonic()
+        chunk.runners.add(wid)
+        return chunk
+
+    def _record(self, wid: int, msg: dict):
+        with self._cond:
+            chunk = self.chunks.pop(msg['id'], None)
+            if chunk is None:
+                return  # another copy finished first
+            items = dict(chunk.items)
+            failed = []
+            for i, ok, res in msg['results']:
+                if not ok and chunk.attempts <= self.cluster.retries:
+                    failed.append((i, items[i]))
+                    continue
+                self._complete(i, ok, res)
+            if failed:
+                retry = _Chunk(next(self._ids), failed)
+                retry.attempts = chunk.attempts
+                self.chunks[retry.id] = retry
+                self.pending.append(retry.id)
+            self._cond.notify_all()
+
+    def _complete(self, i: int, ok: bool, res):
+        self.results[i] = (ok, res)
+        self.left -= 1
+        self._done.append(i)
+        if not self.left:
+            self.finished = True
+
+    def _lost(self, wid: int, joined: bool = True):
+        '''Put back the chunks of a worker that went away.'''
+        with self._cond:
+            if joined:
+                self.workers -= 1
+                if not self.workers:
+                    self._idle = time.monotonic()
+            for chunk in list(self.chunks.values()):
+                if wid not in chunk.runners:
+                    continue
+                chunk.runners.discard(wid)
+                if chunk.runners:
+                    continue  # a copy is still running elsewhere
+                if chunk.attempts > self.cluster.retries:
+                    del self.chunks[chunk.id]
+                    for i, _ in chunk.items:
+                        self._complete(
+                            i, False, ['ConnectionError', 'worker was lost'])
+                else:
+                    self.pending.appendleft(chunk.id)
+            self._cond.notify_all()
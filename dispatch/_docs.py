@@ -0,0 +1,253 @@
+'''
+Docstring parsing for command help text.
+
+Three styles of flag documentation are understood:
+
+    reST (the original style)    :v verbose: print more things
+
+    Google                       Args:
+                                     verbose (bool, -v): print more things
+
+    NumPy                        Parameters
+                                 ----------
+                                 verbose : bool, -v
+                                     print more things
+
+Shorthands are needed for every run of a command but the help text is only
+needed for --help, so the two are parsed and cached separately.
+'''
+
+ARG_SECTIONS = {
+    'args', 'arguments', 'parameters', 'params', 'keyword args',
+    'keyword arguments', 'other parameters', 'options', 'flags',
+}
+OTHER_SECTIONS = {
+    'returns', 'return', 'yields', 'yield', 'raises', 'warns', 'example',
+    'examples', 'note', 'notes', 'see also', 'references', 'attributes',
+    'methods', 'todo', 'warning', 'warnings',
+}
+SECTIONS = ARG_SECTIONS | OTHER_SECTIONS
+
+# Results are cached per (function or class, docstring). The cache holds a
+# reference to the object which is fine for the long lived functions and
+# classes that commands are made from.
+_short_cache: dict = {}
+_full_cache: dict = {}
+
+
+def shorthands(obj, doc: str) -> dict:
+    '''
+    Returns a {flag name: shorthand} dict for the flags documented in doc.
+    This skips all of the work needed for the help text.
+    '''
+    key = (getattr(obj, '__func__', obj), doc)
+    res = _short_cache.get(key)
+    if res is None:
+        if key in _full_cache:
+            flags = _full_cache[key][1]
+        else:
+            flags = _parse(doc, with_docs=False)[1]
+        res = {
+            name: f['shorthand'] for name, f in flags.items()
+            if f['shorthand']
+        }
+        _short_cache[key] = res
+    return res
+
+
+def parse(obj, doc: str) -> tuple:
+    '''
+    Returns the description part of the docstring and a dict of
+    {flag name: {'doc': help text, 'shorthand': shorthand}}.
+    '''
+    key = (getattr(obj, '__func__', obj), doc)
+    res = _full_cache.get(key)
+    if res is None:
+        res = _full_cache[key] = _parse(doc, with_docs=True)
+    return res
+
+
+def _parse(doc: str, with_docs: bool) -> tuple:
+    if not doc:
+        return '', {}
+    lines = doc.split('\n')
+    style, start = _find_style(lines)
+    if style is None:
+        return _parse_rest(doc)
+
+    flags: dict = {}
+    desc = '\n'.join(lines[:start]).strip() if with_docs else ''
+    i = start
+    while i < len(lines):
+        kind, name, body = _section_at(lines, i)
+        if kind is None:
+            i += 1
+            continue
+        end = _section_end(lines, body, kind)
+        if name in ARG_SECTIONS:
+            _parse_entries(lines[body:end], flags, kind, with_docs)
+        i = end
+    return desc, flags
+
+
+def _find_style(lines) -> tuple:
+    '''
+    Returns the style of a docstring with a Google or NumPy argument section
+    and the index of its first section header, or (None, None) for reST
+    docstrings.
+    '''
+    first = None
+    for i in range(len(lines)):
+        kind, name, _ = _section_at(lines, i)
+        if kind is None:
+            continue
+        if first is None:
+            first = i
+        if name in ARG_SECTIONS:
+            return kind, first
+    return None, None
+
+
+def _section_at(lines, i) -> tuple:
+    '''
+    If line i is a section header, returns the style of the header, the
+    section name and the index of the first line in the section.
+    '''
+    line = lines[i].strip()
+    if not line:
+        return None, None, None
+    low = line.lower()
+    if (
+        i + 1 < len(lines) and
+        low in SECTIONS and
+        len(lines[i + 1].strip()) >= 3 and
+        not lines[i + 1].strip().strip('-')
+    ):
+        return 'numpy', low, i + 2
+    if line.endswith(':') and low[:-1] in SECTIONS:
+        return 'google', low[:-1], i + 1
+    return None, None, None
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def _section_end(lines, body: int, kind: str) -> int:
+    '''Index of the first line after the section that starts at body.'''
+    base = None
+    i = body
+    while i < len(lines):
+        line = lines[i]
+        if not line.strip():
+            i += 1
+            continue
+        if _section_at(lines, i)[0] is not None:
+            return i
+        if base is None:
+            base = _indent(line)
+        elif kind == 'google' and _indent(line) < base:
+            return i
+        i += 1
+    return i
+
+
+def _parse_entries(lines, flags: dict, kind: str, with_docs: bool):
+    base = None
+    current = None
+    for line in lines:
+        if not line.strip():
+            continue
+        if base is None:
+            base = _indent(line)
+        if _indent(line) > base:
+            if current is not None and with_docs:
+                current['lines'].append(line.strip())
+            continue
+
+        if kind == 'google':
+            head, _, rest = line.strip().partition(':')
+        else:
+            head, rest = line.strip(), ''
+        name, shorthand = _parse_head(head)
+        if not name:
+            current = None
+            continue
+        current = {'shorthand': shorthand, 'lines': []}
+        if rest.strip() and with_docs:
+            current['lines'].append(rest.strip())
+        flags[name] = current
+
+    for f in flags.values():
+        lines = f.pop('lines', None)
+        if lines is not None:
+            f['doc'] = ' '.join(lines)
+
+
+def _parse_head(head: str) -> tuple:
+    '''
+    Parse the first line of an entry: 'name (type, -v)' for Google style,
+    'name : type, -v' for NumPy style or '-v, --name' for either.
+    '''
+    if ' : ' in head or head.endswith(' :'):
+        names, _, spec = head.partition(' :')
+    elif '(' in head:
+        names, _, spec = head.partition('(')
+        spec = spec.rstrip(')')
+    else:
+        names, spec = head, ''
+
+    name = None
+    shorthand = None
+    for tok in names.replace(',', ' ').split():
+        if tok.startswith('--'):
+            name = tok[2:]
+        elif tok.startswith('-') and len(tok) == 2:
+            shorthand = tok[1]
+        elif not tok.startswith('*'):
+            name = name or tok
+    for tok in spec.replace(',', ' ').split():
+        if tok.startswith('-') and len(tok) == 2:
+            shorthand = tok[1]
+    if name is None:
+        return None, None
+    return name.replace('-', '_'), shorthand
+
+
+def _parse_rest(docstr: str) -> tuple:
+    if docstr.count(':') < 2:
+        desc = docstr
+        flags = {}
+    else:
+        i = docstr.index(':')
+        desc = docstr[:i]
+        flags = _parse_flags_doc(docstr[i:])
+    return desc.strip(), flags
+
+
+def _parse_flags_doc(doc: str) -> dict:
+    res: dict = {}
+    s = doc[doc.index(':'):]
+
+    for line in s.split('\n'):
+        line = line.strip()
+
+        if not line.startswith(':'):
+            continue
+
+        parsed = [l for l in line.split(':') if l]
+        if not parsed:
+            continue
+        names = [n for n in parsed[0].split(' ')
+                 if n and not n == 'param']
+
+        if len(parsed) >= 2:
+            tmpdoc = parsed[1].strip()
+        else:
+            tmpdoc = ''
+
+        if len(names) == 2:
+            res[names[1].replace('-', '_')] = {'doc': tmpdoc, 'shorthand': names[0][0]}
+        else:
+            res[names[0].replace('-', '_')] = {'doc': tmpdoc, 'shorthand': None}
+    return res
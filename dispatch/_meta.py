@@ -1,17 +1,21 @@
 import sys
-import inspect
 from abc import ABC, abstractmethod
-from dataclasses import is_dataclass
-
 from types import FunctionType, MethodType
-from typing import Dict, Set, Any
 
 from .exceptions import UserException
 from ._base import _CliBase
+from .resource import resource
+from .types import lazy
+from . import _docs
+from ._docs import _parse_flags_doc
+
+# code object flags, see the inspect module
+CO_VARARGS = 0x04
+CO_VARKEYWORDS = 0x08
 
 
 class _CliMeta(ABC):
-    flagdocs: dict
+    doc: str
 
     @abstractmethod
     def run(self, *args, **kwrgs): ...
@@ -25,45 +29,29 @@ class _CliMeta(ABC):
     @abstractmethod
     def annotations(self): ...
 
-    def _parse_doc(self, docstr: str) -> tuple:
-        if docstr is None:
-            return '', {}
-        if docstr.count(':') < 2:
-            desc = docstr
-            flags = {}
-        else:
-            i = docstr.index(':')
-            desc = docstr[:i]
-            flags = _parse_flags_doc(docstr[i:])
-
-        doc = '\n'.join([l for l in desc.split('\n')])
-        return doc.strip(), flags
+    def namespace(self) -> dict:
+        '''
+        Returns the global namespace used to resolve string annotations.
+        '''
+        mod = sys.modules.get(getattr(self.obj, '__module__', None))
+        return getattr(mod, '__dict__', None)
 
+    # The docstring is only parsed for help text when help is
+    # shown, regular runs only need the flag shorthands.
 
-def _parse_flags_doc(doc: str) -> Dict[str, Any]:
-    res: Dict[str, Any] = {}
-    s = doc[doc.index(':'):]
+    @property
+    def helpstr(self) -> str:
+        return _docs.parse(self.obj, self.doc)[0]
 
-    for line in s.split('\n'):
-        line = line.strip()
+    @property
+    def flagdocs(self) -> dict:
+        return _docs.parse(self.obj, self.doc)[1]
 
-        if not line.startswith(':'):
-            continue
+    def shorthands(self) -> dict:
+        return _docs.shorthands(self.obj, self.doc)
 
-        parsed = [l for l in line.split(':') if l]
-        names = [n for n in parsed[0].split(' ')
-                 if n and not n == 'param']
-
-        if len(parsed) >= 2:
-            tmpdoc = parsed[1].strip()
-        else:
-            tmpdoc = ''
-
-        if len(names) == 2:
-            res[names[1].replace('-', '_')] = {'doc': tmpdoc, 'shorthand': names[0][0]}
-        else:
-            res[names[0].replace('-', '_')] = {'doc': tmpdoc, 'shorthand': None}
-    return res
+    def flagdoc(self, name: str) -> str:
+        return self.flagdocs.get(name, {}).get('doc') or ''
 
 
 class _FunctionMeta(_CliMeta):
@@ -77,20 +65,20 @@ class _FunctionMeta(_CliMeta):
             self.obj = obj
 
         self.code = code or obj.__code__
-        self.signature = inspect.signature(self.obj)
         self.name = name or obj.__name__
         self.doc = doc or obj.__doc__
         self._annotations = annotations or obj.__annotations__
         self._defaults = defaults or obj.__defaults__
         self.instance = instance
-        self.helpstr, self.flagdocs = self._parse_doc(self.doc)
 
-        fn_params = self.signature.parameters
+        # checking the code object is much cheaper than inspect.signature
+        argnames = self.code.co_varnames[
+            :self.code.co_argcount + self.code.co_kwonlyargcount]
         if (
             self.instance or
             isinstance(self.obj, MethodType) or
-            fn_params.get('self') is not None or
-            fn_params.get('cls') is not None
+            'self' in argnames or
+            'cls' in argnames
         ):
             self.needs_self = True
         else:
@@ -110,18 +98,27 @@ class _FunctionMeta(_CliMeta):
     def annotations(self):
         return self._annotations
 
+    def namespace(self) -> dict:
+        return getattr(self.obj, '__globals__', None) or super().namespace()
+
+    @property
+    def signature(self):
+        import inspect
+        return inspect.signature(self.obj)
+
     def has_variadic_param(self) -> bool:
-        params = list(self.signature.parameters.values())
-        if not params:
-            return False
-        for p in params:
-            if p.kind == inspect.Parameter.VAR_POSITIONAL:
-                return True
-        return False
+        return bool(self.code.co_flags & CO_VARARGS)
 
     def has_params(self) -> bool:
-        params = list(self.signature.parameters)
-        return bool(params)
+        c = self.code
+        n = c.co_argcount + c.co_kwonlyargcount
+        if c.co_flags & CO_VARARGS:
+            n += 1
+        if c.co_flags & CO_VARKEYWORDS:
+            n += 1
+        if isinstance(self.obj, MethodType):
+            n -= 1  # bound methods don't count self
+        return n > 0
 
     def defaults(self) -> dict:
         names = reversed(self.params())
@@ -132,35 +129,41 @@ class _FunctionMeta(_CliMeta):
         return defs
 
     def has_dataclass_param(self) -> bool:
-        for typ in self._annotations.values():
-            if is_dataclass(typ):
-                return True
-        return False
+        return bool(self.dataclass_params())
 
     def get_dataclass(self) -> tuple:
-        for name, typ in self._annotations.items():
-            if is_dataclass(typ):
-                return name, typ
+        for name, typ in self.dataclass_params().items():
+            return name, typ
         return '', None
 
+    def dataclass_params(self) -> dict:
+        '''
+        Returns {param name: dataclass} for every parameter annotated with
+        a dataclass.
+        '''
+        res = {}
+        ns = None
+        for name in self.params():
+            typ = self._annotations.get(name)
+            if isinstance(typ, str):
+                # only plain names can be dataclasses, anything else is
+                # left for the flag to resolve lazily
+                if not typ.replace('.', '').isidentifier():
+                    continue
+                if ns is None:
+                    ns = self.namespace() or {}
+                try:
+                    typ = eval(typ, ns)
+                except Exception:
+                    continue
+            if _is_dataclass(typ):
+                res[name] = typ
+        return res
+
     def set_instance(self, inst):
         self.instance = inst
         self.needs_self = True
 
-    def _parse_doc(self, docstr: str) -> tuple:
-        if docstr is None:
-            return '', {}
-        if docstr.count(':') < 2:
-            desc = docstr
-            flags = {}
-        else:
-            i = docstr.index(':')
-            desc = docstr[:i]
-            flags = _parse_flags_doc(docstr[i:])
-
-        doc = '\n'.join([l for l in desc.split('\n')])
-        return doc.strip(), flags
-
 
 class _GroupMeta(_CliMeta):
     def __init__(self, obj, instance=None):
@@ -184,9 +187,13 @@ class _GroupMeta(_CliMeta):
             if (
                 not name.startswith('_') and
                 not _isfunc(attr) and
-                not isinstance(attr, _CliBase)  # for subcommands
+                # subcommands and lazy resources are not flags
+                not isinstance(attr, (_CliBase, resource))
             ):
-                self._annotations[name] = type(attr)
+                if isinstance(attr, lazy):
+                    self._annotations.setdefault(name, str)
+                else:
+                    self._annotations[name] = type(attr)
                 self._defaults[name] = attr
 
         attrs = self.obj.__class__.__dict__
@@ -196,15 +203,14 @@ class _GroupMeta(_CliMeta):
                 continue
             elif (
                 not _isfunc(attr) and
-                not isinstance(attr, _CliBase) and
+                not isinstance(attr, (_CliBase, resource)) and
                 attr != type.mro
             ):
                 self._annotations[name] = type(attr)
                 self._defaults[name] = attr
-        self.helpstr, self.flagdocs = self._parse_doc(self.doc)
 
     def flagnames(self) -> set:
-        names: Set[str] = set()
+        names: set = set()
         names.update(self._annotations.keys(), self._defaults.keys())
         return names
 
@@ -227,6 +233,10 @@ def _isgroup(obj) -> bool:
         FunctionType, MethodType
     ))
 
+def _is_dataclass(obj) -> bool:
+    # same as dataclasses.is_dataclass for classes without the import
+    return isinstance(obj, type) and hasattr(obj, '__dataclass_fields__')
+
 def _isfunc(obj) -> bool:
     return isinstance(obj, (
         classmethod, staticmethod,
@@ -0,0 +1,244 @@
+'''
+Fan-out execution of a command's callback over its positional arguments.
+'''
+import os
+import sys
+import pickle
+import itertools
+import contextvars
+from concurrent import futures
+
+from ._base import _await
+from .exceptions import DeveloperException
+
+# Results that are bytes-like and at least this large are handed back from
+# worker processes through shared memory instead of being pickled.
+SHM_THRESHOLD = 1 << 20
+
+# Callbacks are registered here before the worker processes are forked so
+# that they never have to be pickled. The module level name of a decorated
+# function is the Command, not the function, so pickle could not find it.
+_registry: dict = {}
+_keys = itertools.count()
+
+
+def can_fork() -> bool:
+    import multiprocessing as mp
+    return 'fork' in mp.get_all_start_methods()
+
+
+def fork_context():
+    '''
+    The multiprocessing context of process pools that run registered
+    callbacks. The callbacks are only in the workers' _registry if they
+    are forked.
+    '''
+    import multiprocessing as mp
+    if not can_fork():
+        raise DeveloperException(
+            'process pools need the fork start method, which this platform '
+            "doesn't have, use threads instead")
+    return mp.get_context('fork')
+
+
+def register(fn) -> int:
+    '''Add fn to the registry before forking, returns its key.'''
+    key = next(_keys)
+    _registry[key] = fn
+    return key
+
+
+def unregister(key: int):
+    _registry.pop(key, None)
+
+
+def run_registered(key: int, *args):
+    '''Call a registered callback in a worker.'''
+    return _registry[key](*args)
+
+
+class _ShmRef:
+    __slots__ = ('name', 'size', 'type')
+
+    def __init__(self, name, size, typ):
+        self.name = name
+        self.size = size
+        self.type = typ
+
+    def load(self):
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(name=self.name)
+        try:
+            data = bytes(shm.buf[:self.size])
+        finally:
+            shm.close()
+            shm.unlink()
+        if self.type is bytearray:
+            return bytearray(data)
+        return data
+
+
+def _to_shm(res) -> _ShmRef:
+    from multiprocessing import shared_memory
+    view = memoryview(res).cast('B')
+    shm = shared_memory.SharedMemory(create=True, size=max(view.nbytes, 1))
+    try:
+        shm.buf[:view.nbytes] = view
+    finally:
+        shm.close()
+    return _ShmRef(shm.name, view.nbytes, type(res))
+
+
+def _picklable(exc: BaseException) -> BaseException:
+    try:
+        pickle.dumps(exc)
+    except Exception:
+        return RuntimeError(f'{exc.__class__.__name__}: {exc}')
+    return exc
+
+
+def _run_chunk(fn, chunk, kwargs, inproc):
+    '''
+    Run the callback once for every (index, item) pair in the chunk and
+    return a list of (index, ok, result) tuples. Errors are returned rather
+    than raised so that one bad item does not lose the rest of the chunk.
+    '''
+    if isinstance(fn, int):
+        fn = _registry[fn]
+    out = []
+    for i, item in chunk:
+        try:
+            res = fn(item, **kwargs)
+            if hasattr(res, '__await__'):
+                res = _await(res)  # a loop for every item
+        except Exception as e:
+            out.append((i, False, e if inproc else _picklable(e)))
+            continue
+        if (
+            not inproc and
+            isinstance(res, (bytes, bytearray, memoryview)) and
+            memoryview(res).nbytes >= SHM_THRESHOLD
+        ):
+            res = _to_shm(res)
+        out.append((i, True, res))
+    return out
+
+
+class _FanOut:
+    '''
+    _FanOut maps a command callback over the command's positional arguments
+    using a pool of processes or threads.
+    '''
+
+    MODES = ('process', 'thread')
+    ERRORS = ('raise', 'continue')
+
+    def __init__(self, mode, workers=None, chunksize=1,
+                 ordered=True, errors='raise'):
+        if mode not in self.MODES:
+            raise DeveloperException(
+                f'parallel should be one of {self.MODES}, got {mode!r}')
+        if errors not in self.ERRORS:
+            raise DeveloperException(
+                f'errors should be one of {self.ERRORS}, got {errors!r}')
+        if chunksize < 1:
+            raise DeveloperException('chunksize must be at least 1')
+        if mode == 'process' and not can_fork():
+            raise DeveloperException(
+                "parallel='process' needs the fork start method, which this "
+                "platform doesn't have, use parallel='thread'")
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.ordered = ordered
+        self.errors = errors
+
+    def _executor(self):
+        if self.mode == 'thread':
+            return futures.ThreadPoolExecutor(max_workers=self.workers)
+
+        from multiprocessing import resource_tracker
+        # start the tracker before forking so the workers share it, otherwise
+        # each worker would clean up its shared memory when it exits.
+        resource_tracker.ensure_running()
+        return futures.ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=fork_context())
+
+    def _submit(self, pool, *args):
+        if self.mode == 'thread':
+            # the items see the command's deadline, a context per item
+            # because a context can only be entered by one thread at a time
+            return pool.submit(contextvars.copy_context().run, *args)
+        return pool.submit(*args)
+
+    def run(self, fn, items: list, kwargs: dict, out=None) -> tuple:
+        '''
+        Call fn(item, **kwargs) for every item. String results are printed
+        as they come back, either in input order or in order of completion.
+
+        Returns the list of results (in input order) and the aggregated exit
+        code which is the largest integer result, or 1 if an item failed.
+        '''
+        out = out or sys.stdout
+        results: list = [None] * len(items)
+        code = 0
+        if not items:
+            return results, code
+
+        inproc = self.mode == 'thread'
+        key = None
+        if inproc:
+            target = fn
+        else:
+            key = register(fn)
+            target = key
+
+        pairs = list(enumerate(items))
+        chunks = [
+            pairs[i:i + self.chunksize]
+            for i in range(0, len(pairs), self.chunksize)
+        ]
+        pool = self._executor()
+        futs: list = []
+        seen = set()
+        finished = False
+        try:
+            futs.extend(
+                self._submit(pool, _run_chunk, target, c, kwargs, inproc)
+                for c in chunks
+            )
+            done = futs if self.ordered else futures.as_completed(futs)
+            for fut in done:
+                seen.add(fut)
+                for i, ok, res in fut.result():
+                    if isinstance(res, _ShmRef):
+                        res = res.load()
+                    results[i] = res
+                    if not ok:
+                        if self.errors == 'raise':
+                            raise res
+                        print(f'Error: {items[i]}: {res}', file=sys.stderr)
+                        code = max(code, 1)
+                    elif isinstance(res, bool):
+                        continue
+                    elif isinstance(res, int):
+                        code = max(code, res)
+                    elif res and isinstance(res, str):
+                        print(res, file=out)
+            finished = True
+        finally:
+            # after an error or a timeout don't wait for the items that
+            # are still running
+            pool.shutdown(wait=finished, cancel_futures=True)
+            if key is not None:
+                unregister(key)
+            # release shared memory held by chunks that were never read
+            # because an earlier item raised.
+            for fut in futs:
+                if fut in seen or not fut.done() or fut.cancelled() or \
+                        fut.exception():
+                    continue
+                for _, _, res in fut.result():
+                    if isinstance(res, _ShmRef):
+                        res.load()
+        return results, code
@@ -0,0 +1,155 @@
+'''
+"Did you mean" suggestions for mistyped command and flag names.
+
+    $ mycli deplyo
+    Error: 'deplyo' is not a command, did you mean 'deploy'?
+
+The names of a group's sub-commands (or of a command's flags) are indexed
+by their bigrams the first time a name is not found. Only the names that
+share enough bigrams with the mistyped word are compared with it, so
+suggestions stay fast for groups with thousands of sub-commands. Names
+are compared without case and with '-' and '_' treated the same.
+'''
+
+# the most names suggested at once
+MAX_SUGGESTIONS = 3
+
+
+def distance(a: str, b: str, limit: int = None) -> int:
+    '''
+    The optimal string alignment distance between two strings, the number
+    of insertions, deletions, substitutions and swaps of two neighbouring
+    letters that turn one into the other. Stops early and returns limit + 1
+    once the distance is known to be more than limit.
+    '''
+    if limit is None:
+        limit = len(a) + len(b)
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        ca = a[i - 1]
+        cur = [i]
+        for j in range(1, len(b) + 1):
+            cb = b[j - 1]
+            d = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                d = min(d, prev2[j - 2] + 1)
+            cur.append(d)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return min(prev[-1], limit + 1)
+
+
+def _key(name: str) -> str:
+    return name.lower().replace('-', '_')
+
+
+def _grams(key: str) -> set:
+    key = f'^{key}$'
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+
+class Index:
+    '''
+    Index maps names to the name that is suggested for them. Names are
+    found through the pairs of letters (bigrams) they have in common with
+    the word, only the names that share enough of them are compared with
+    the word letter by letter.
+    '''
+
+    __slots__ = ('names', 'grams')
+
+    def __init__(self, names: dict):
+        self.names: dict = {}  # {key: [suggested names]}
+        for name, shown in names.items():
+            shown_as = self.names.setdefault(_key(name), [])
+            if shown not in shown_as:
+                shown_as.append(shown)
+        self.grams: dict = {}  # {bigram: [keys]}
+        for key in self.names:
+            for g in _grams(key):
+                self.grams.setdefault(g, []).append(key)
+
+    def __len__(self):
+        return len(self.names)
+
+    def candidates(self, key: str, limit: int) -> list:
+        '''
+        The keys that might be within limit edits of key. An edit changes
+        at most two bigrams and a swap at most three, so a key that is
+        close enough shares all but 3 * limit of the bigrams of key.
+        '''
+        grams = _grams(key)
+        need = len(grams) - 3 * limit
+        size = len(key)
+        if need <= 0:
+            # a short word might not share any bigram with a close name
+            keys = self.names
+        else:
+            counts: dict = {}
+            for g in grams:
+                for k in self.grams.get(g, ()):
+                    counts[k] = counts.get(k, 0) + 1
+            keys = [k for k, n in counts.items() if n >= need]
+        return [k for k in keys if abs(len(k) - size) <= limit]
+
+    def suggest(self, word: str) -> list:
+        '''The closest names to word, an empty list if none are close.'''
+        key = _key(word)
+        # about one mistake for every three letters, a single letter (a
+        # shorthand) only matches with a different case
+        limit = 0 if len(key) < 2 else min(max(len(key) // 3, 1), 3)
+        best = limit + 1
+        matches = []
+        for k in self.candidates(key, limit):
+            d = distance(key, k, min(best, limit))
+            if d < best:
+                best, matches = d, [k]
+            elif d == best:
+                matches.append(k)
+        if best > limit:
+            return []
+        res = []
+        for k in sorted(matches):
+            for name in self.names[k]:
+                if name not in res:
+                    res.append(name)
+        return res[:MAX_SUGGESTIONS]
+
+
+def hint(suggestions: list) -> str:
+    '''The end of an error message for suggestions.'''
+    if not suggestions:
+        return ''
+    quoted = [repr(s) for s in suggestions]
+    if len(quoted) > 1:
+        quoted[-2:] = [f'{quoted[-2]} or {quoted[-1]}']
+    return f", did you mean {', '.join(quoted)}?"
+
+
+def command_index(group) -> Index:
+    '''An index of a group's visible sub-commands and their aliases.'''
+    names = {}
+    for name, cmd in group.commands.items():
+        if name.startswith('_') or name in group._hidden:
+            continue
+        names[name] = name
+    return Index(names)
+
+
+def flag_index(*flagsets) -> Index:
+    '''An index of the visible flags of the flag sets and their shorthands.'''
+    names = {}
+    for fset in flagsets:
+        for name, flag in fset.items():
+            if flag.hidden:
+                continue
+            shown = '--' + name.replace('_', '-')
+            names.setdefault(name, shown)
+            if flag.shorthand:
+                names.setdefault(flag.shorthand, '-' + flag.shorthand)
+    names.setdefault('help', '--help')
+    return Index(names)
@@ -0,0 +1,274 @@
+'''
+An audit log of command runs.
+
+    @command(audit='/var/log/mycli/audit.jsonl')
+    class mycli:
+        ...
+
+Every run is written as one line of JSON:
+
+    {"time": 1760000000.12, "command": "mycli deploy",
+     "argv": ["deploy", "--region", "eu", "--token", "***"],
+     "flags": {"region": "eu", "token": "***"}, "duration": 0.0123,
+     "exit_code": 0, "error": null, "pid": 4242, "user": "deploy"}
+
+The values of hidden flags are replaced with '***', so are the values given
+as --flag=value of flags that none of the sub-commands have. Records are handed to a
+background thread that serializes and writes them in batches, so a run
+only pays for putting a dict on a queue. The file is rotated once it grows
+past max_bytes (<path>.1 is the newest old file) and any records that are
+still queued are written when the interpreter exits.
+'''
+import os
+import sys
+import time
+import json
+import queue
+import threading
+
+REDACTED = '***'
+
+# {path: AuditLog} so that commands logging to the same file share a writer
+_logs: dict = {}
+
+# tells the writer thread to stop once everything before it is written
+_STOP = object()
+
+
+def _user() -> str:
+    try:
+        import getpass
+        return getpass.getuser()
+    except Exception:  # no user name in the environment or passwd
+        return None
+
+
+class AuditLog:
+    '''
+    AuditLog writes records to a file of JSON lines from a background
+    thread. Records are collected for up to flush_interval seconds or
+    until there are batch_size of them and then written at once.
+    '''
+
+    def __init__(self, path, *, max_bytes: int = 10 << 20, backups: int = 5,
+                 batch_size: int = 256, flush_interval: float = 1.0):
+        self.path = os.fspath(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.user = _user()
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path!r})'
+
+    def entry(self, name: str, flags, argv: list, more=None) -> '_Entry':
+        '''
+        Start the record of a run. more returns the flag sets of the
+        sub-commands that might not have been reached.
+        '''
+        return _Entry(self, name, flags, argv, more)
+
+    def write(self, record: dict):
+        '''Queue a record to be written.'''
+        if self._thread is None:
+            self._start()
+        self._queue.put(record)
+
+    def flush(self, timeout: float = None) -> bool:
+        '''Wait until the records queued so far have been written.'''
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        '''Write the queued records and stop the writer thread.'''
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._writer, name='dispatch-audit', daemon=True)
+            self._thread.start()
+        import atexit
+        atexit.register(self.close)
+
+    def _writer(self):
+        get = self._queue.get
+        while True:
+            item = get()
+            batch, waiters = [], []
+            end = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                wait = end - time.monotonic()
+                if wait <= 0:
+                    break
+                try:
+                    item = get(timeout=wait)
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for w in waiters:
+                w.set()
+            if item is _STOP:
+                return
+
+    def _write(self, batch: list):
+        data = ''.join(
+            json.dumps(rec, default=str) + '\n' for rec in batch).encode()
+        try:
+            self._rotate(len(data))
+            # one write per batch with O_APPEND so that processes sharing
+            # the file don't interleave their lines
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f'dispatch: could not write the audit log: {e}',
+                  file=sys.stderr)
+
+    def _rotate(self, incoming: int):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if not size or size + incoming <= self.max_bytes:
+            return
+        if self.backups < 1:
+            os.remove(self.path)
+            return
+        for i in range(self.backups - 1, 0, -1):
+            src = f'{self.path}.{i}'
+            if os.path.exists(src):
+                os.replace(src, f'{self.path}.{i + 1}')
+        os.replace(self.path, self.path + '.1')
+
+
+class _Entry:
+    '''The record of one run, sub-commands are added as they are parsed.'''
+
+    __slots__ = ('log', 'name', 'flags', 'more', 'argv', 'commands', 'time',
+                 'start')
+
+    def __init__(self, log: AuditLog, name: str, flags, argv: list,
+                 more=None):
+        self.log = log
+        self.name = name
+        self.flags = flags
+        self.more = more
+        self.argv = list(argv)
+        self.commands: list = []
+        self.time = time.time()
+        self.start = time.perf_counter()
+
+    def finish(self, ret=None, exc: BaseException = None):
+        duration = time.perf_counter() - self.start
+        flagsets = [self.flags] + [c.flags for c in self.commands]
+        argv, flags = _redact(self.argv, flagsets, self.more)
+        name = self.name
+        if self.commands:
+            name += ' ' + ' + '.join(c.name for c in self.commands)
+        self.log.write({
+            'time': self.time,
+            'command': name,
+            'argv': argv,
+            'flags': flags,
+            'duration': duration,
+            'exit_code': _exit_code(ret, exc),
+            'error': None if exc is None or isinstance(exc, SystemExit)
+                     else exc.__class__.__name__,
+            'pid': os.getpid(),
+            'user': self.log.user,
+        })
+
+
+def _exit_code(ret, exc) -> int:
+    if isinstance(exc, SystemExit):
+        code = exc.code
+        return code if isinstance(code, int) else int(code is not None)
+    if exc is not None:
+        return 1
+    if isinstance(ret, int) and not isinstance(ret, bool):
+        return ret
+    return 0
+
+
+def _find(flagsets: list, name: str):
+    for fset in flagsets:
+        flag = fset.get(name)
+        if flag is not None:
+            return flag
+    return None
+
+
+def _redact(argv: list, flagsets: list, more=None) -> tuple:
+    '''
+    Returns argv with the values of hidden flags replaced and a dict of the
+    flags that were given, {name: value as given}. Flags that are not in
+    flagsets are looked up in the flag sets returned by more (the
+    sub-commands that parsing didn't get to), the values of flags that
+    are not found anywhere are replaced when they are given with '='.
+    '''
+    args, flags = [], {}
+    it = iter(argv)
+    for raw in it:
+        if raw[:1] != '-' or raw == '-':
+            args.append(raw)
+            continue
+        opt, eq, val = raw.partition('=')
+        name = opt.lstrip('-').replace('-', '_')
+        flag = _find(flagsets, name)
+        if flag is None and more is not None:
+            flagsets = flagsets + more()
+            more = None
+            flag = _find(flagsets, name)
+        if flag is None:
+            args.append(f'{opt}={REDACTED}' if eq else raw)
+            continue
+        hidden = flag.hidden
+        if eq:
+            flags[flag.name] = REDACTED if hidden else val
+            args.append(f'{opt}={REDACTED}' if hidden else raw)
+            continue
+        args.append(raw)
+        if flag.type is bool:
+            flags[flag.name] = True
+            continue
+        val = next(it, None)
+        if val is not None:
+            val = REDACTED if hidden else val
+            args.append(val)
+        flags[flag.name] = val
+    return args, flags
+
+
+def _new_audit_log(setting):
+    if isinstance(setting, AuditLog):
+        return setting
+    path = os.path.abspath(os.fspath(setting))
+    log = _logs.get(path)
+    if log is None:
+        log = _logs[path] = AuditLog(path)
+    return log
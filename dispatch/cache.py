@@ -0,0 +1,211 @@
+'''
+An on-disk result cache for commands that are pure functions of their
+flags, positional arguments and input files.
+'''
+import os
+import time
+import pickle
+import hashlib
+import tempfile
+from pathlib import PurePath
+
+
+def default_dir(name: str) -> str:
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'dispatch', name)
+
+
+def _hash_code(h, code):
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            _hash_code(h, const)
+        else:
+            h.update(repr(const).encode())
+
+
+def _hash_file(h, path):
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                h.update(chunk)
+    except OSError:
+        # a missing file is still part of the key, its
+        # contents just can't be
+        h.update(b'\0missing')
+
+
+def _input_path(val):
+    '''The path of an input file or of a reader opened for one.'''
+    if hasattr(val, 'read'):
+        return getattr(val, 'path', None)
+    return os.fspath(val)
+
+
+def _flag_type(fset, name):
+    if fset is None:
+        return None
+    try:
+        return fset[name].type
+    except Exception:
+        # unresolvable string annotations can't be file types
+        return None
+
+
+class Cache:
+    '''
+    Cache stores command results in a directory, one pickle file per
+    result. Entries are evicted least recently used first once there are
+    more than max_entries or they take up more than max_bytes, and entries
+    older than ttl seconds are never returned.
+    '''
+
+    SUFFIX = '.pickle'
+
+    def __init__(self, path: str = None, *, max_entries: int = None,
+                 max_bytes: int = None, ttl: float = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path!r})'
+
+    def key(self, code, flags: dict, args: list, fset=None,
+            files=()) -> str:
+        '''
+        Create a key from the callback's code object, the parsed flags,
+        the positional arguments and the contents of any file flags and
+        of the input files in files. Returns None if an input can't be
+        hashed (stdin), those results are not cached.
+        '''
+        h = hashlib.sha256()
+        _hash_code(h, code)
+        # open files are part of the key by path and contents
+        readers = {k: v for k, v in flags.items() if hasattr(v, 'read')}
+        h.update(repr(sorted(
+            (k, v) for k, v in flags.items() if k not in readers)).encode())
+        h.update(repr(list(args)).encode())
+        for name in sorted(flags):
+            val = flags[name]
+            typ = _flag_type(fset, name)
+            if name in readers:
+                path = _input_path(val)
+            elif isinstance(val, os.PathLike) or (
+                isinstance(typ, type) and issubclass(typ, PurePath) and val
+            ):
+                path = os.fspath(val)
+            else:
+                continue
+            if path is None or path == '-':
+                return None
+            h.update(name.encode())
+            h.update(repr(path).encode())
+            _hash_file(h, path)
+        for f in files:
+            path = _input_path(f)
+            if path is None or path == '-':
+                return None
+            h.update(repr(path).encode())
+            _hash_file(h, path)
+        return h.hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key + self.SUFFIX)
+
+    def get(self, key: str) -> tuple:
+        '''Returns a tuple of (hit, result).'''
+        fname = self._file(key)
+        try:
+            with open(fname, 'rb') as f:
+                created, res = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        if self.ttl is not None and time.time() - created > self.ttl:
+            self._remove(fname)
+            return False, None
+        try:
+            os.utime(fname)  # mtime is the last time the entry was used
+        except OSError:
+            pass
+        return True, res
+
+    def set(self, key: str, res):
+        try:
+            data = pickle.dumps((time.time(), res))
+        except Exception:
+            return  # unpicklable results are not cached
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self._file(key))
+        except OSError:
+            self._remove(tmp)
+            return
+        self.evict()
+
+    def evict(self):
+        '''
+        Remove expired entries and then the least recently used ones until
+        the cache is within its limits.
+        '''
+        if self.max_entries is None and self.max_bytes is None \
+                and self.ttl is None:
+            return
+        entries = []
+        now = time.time()
+        with os.scandir(self.path) as it:
+            for e in it:
+                if not e.name.endswith(self.SUFFIX):
+                    continue
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                if self.ttl is not None and now - st.st_mtime > self.ttl:
+                    self._remove(e.path)
+                    continue
+                entries.append((st.st_mtime, st.st_size, e.path))
+
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        while entries and (
+            (self.max_entries is not None and len(entries) > self.max_entries)
+            or (self.max_bytes is not None and total > self.max_bytes)
+        ):
+            _, size, path = entries.pop(0)
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.path):
+            return
+        for name in os.listdir(self.path):
+            if name.endswith(self.SUFFIX):
+                self._remove(os.path.join(self.path, name))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _new_cache(setting, name: str):
+    if setting is None or setting is False:
+        return None
+    if setting is True:
+        cache = Cache()
+    elif isinstance(setting, (str, os.PathLike)):
+        cache = Cache(os.fspath(setting))
+    else:
+        cache = setting
+    if cache.path is None:
+        cache.path = default_dir(name)
+    return cache
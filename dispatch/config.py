@@ -0,0 +1,268 @@
+'''
+Flag defaults from layered config files.
+
+Files are read from these layers, each one overriding the last:
+
+    system     /etc/<name>/config.{toml,ini,json}
+    user       $XDG_CONFIG_HOME/<name>/config.{toml,ini,json}
+    project    ./.<name>.{toml,ini,json}
+    --config   the file given on the command line
+
+Top level keys set the flags of the command (or group) and a table, section
+or object named after a sub-command sets that sub-command's flags:
+
+    verbose = true
+
+    [deploy]
+    region = "us-east-1"
+
+INI files have no top level so the group's flags go in a section with the
+group's name. Values are converted with the same converters that are used
+for command line arguments.
+
+Parsing a large config file on every run adds up for commands that run
+thousands of times a day, so the parsed files are kept in a marshal cache
+keyed by the file's path, mtime and size.
+'''
+import os
+import marshal
+import hashlib
+
+from .cache import default_dir
+from .exceptions import UserException, DeveloperException
+
+EXTENSIONS = ('.toml', '.ini', '.json')
+
+# parsed files for the life of the process: {path: (mtime, size, data)}
+_parsed: dict = {}
+
+
+def search_paths(name: str) -> list:
+    '''
+    Returns the config file locations for an application in order of
+    increasing precedence. The files do not need to exist.
+    '''
+    home = os.getenv('XDG_CONFIG_HOME') or os.path.join(
+        os.path.expanduser('~'), '.config')
+    paths = []
+    for d in (os.path.join('/etc', name), os.path.join(home, name)):
+        paths.extend(os.path.join(d, 'config' + ext) for ext in EXTENSIONS)
+    paths.extend('.' + name + ext for ext in EXTENSIONS)
+    return paths
+
+
+class Config:
+    '''
+    Config finds, reads and merges the config files of a command. Use paths
+    to replace the default layers with a list of files.
+    '''
+
+    def __init__(self, name: str, paths: list = None, *,
+                 cache_dir: str = None):
+        self.name = name
+        self.paths = paths
+        self.cache_dir = cache_dir
+        # flags that have had their defaults changed, so that they can be
+        # put back when a different set of files is used: {id: (flag, default)}
+        self._applied: dict = {}
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.name!r})'
+
+    def files(self, extra: str = None) -> list:
+        '''The config files that exist, lowest precedence first.'''
+        paths = self.paths if self.paths is not None else search_paths(self.name)
+        files = [p for p in paths if os.path.isfile(p)]
+        if extra:
+            if not os.path.isfile(extra):
+                raise UserException(f'config file {extra!r} does not exist')
+            files.append(extra)
+        return files
+
+    def load(self, extra: str = None) -> dict:
+        '''Read and merge every config file.'''
+        res: dict = {}
+        for path in self.files(extra):
+            _merge(res, _normalize(self._read(path), self.name, path))
+        return res
+
+    def _read(self, path: str) -> dict:
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+
+        hit = _parsed.get(path)
+        if hit is not None and hit[0] == stamp:
+            return hit[1]
+
+        cached = self._cache_file(path)
+        data = _read_cached(cached, path, stamp)
+        if data is None:
+            data = parse_file(path)
+            _write_cached(cached, path, stamp, data)
+        _parsed[path] = (stamp, data)
+        return data
+
+    def _cache_file(self, path: str) -> str:
+        key = hashlib.sha1(path.encode()).hexdigest()
+        return os.path.join(
+            self.cache_dir or default_dir('config'), key + '.marshal')
+
+    def apply(self, fset, values: dict, *, reset: bool = True):
+        '''
+        Set the defaults of the flags in fset from values. With reset, the
+        defaults set by a previous call are put back first.
+        '''
+        if reset:
+            self.reset()
+        for key, val in values.items():
+            if isinstance(val, dict):
+                continue  # a sub-command's section
+            flag = fset.get(key)
+            if flag is None:
+                raise UserException(f'unknown flag {key!r} in config file')
+            self._applied.setdefault(
+                id(flag), (flag, flag._default, flag.has_default))
+            flag.setval(_to_arg(flag, val))
+            flag._default = flag._value
+            flag.has_default = True
+
+    def reset(self):
+        '''Put back the defaults changed by apply.'''
+        for flag, default, has_default in self._applied.values():
+            flag._default = default
+            flag.has_default = has_default
+            flag._value = default
+        self._applied.clear()
+
+
+def parse_file(path: str) -> dict:
+    '''Parse a TOML, INI or JSON file based on its extension.'''
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext == '.toml':
+            return _load_toml(path)
+        elif ext in ('.ini', '.cfg'):
+            return _load_ini(path)
+        elif ext == '.json':
+            import json
+            with open(path) as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError('expected an object')
+            return data
+    except (OSError, ValueError) as e:
+        # tomllib, configparser and json errors are all ValueErrors
+        raise UserException(f'could not read config file {path!r}: {e}') from e
+    raise UserException(f'unknown config file type {path!r}')
+
+
+def _load_toml(path: str) -> dict:
+    try:
+        import tomllib
+    except ImportError:  # python < 3.11
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise DeveloperException(
+                'reading TOML config files needs python 3.11 or tomli')
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+
+def _load_ini(path: str) -> dict:
+    import configparser
+    parser = configparser.ConfigParser(interpolation=None)
+    with open(path) as f:
+        parser.read_file(f)
+    return {s: dict(parser.items(s, raw=True)) for s in parser.sections()}
+
+
+def _read_cached(cached: str, path: str, stamp: tuple):
+    try:
+        with open(cached, 'rb') as f:
+            cpath, cstamp, data = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if cpath != path or tuple(cstamp) != stamp:
+        return None
+    return data
+
+
+def _write_cached(cached: str, path: str, stamp: tuple, data: dict):
+    try:
+        raw = marshal.dumps((path, stamp, data))
+    except ValueError:
+        return  # TOML dates and times can't be marshaled
+    import tempfile
+    d = os.path.dirname(cached)
+    try:
+        os.makedirs(d, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=d, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(raw)
+        os.replace(tmp, cached)
+    except OSError:
+        pass  # not being able to cache the file is not an error
+
+
+def _normalize(data: dict, name: str, path: str) -> dict:
+    '''
+    Use flag names for keys and move the top level section of INI files to
+    the top level.
+    '''
+    res: dict = {}
+    for key, val in data.items():
+        if isinstance(val, dict):
+            section = {k.replace('-', '_'): v for k, v in val.items()}
+            if path.endswith(('.ini', '.cfg')) and key == name:
+                res.update(section)
+                continue
+            val = section
+        res[key.replace('-', '_')] = val
+    return res
+
+
+def _merge(base: dict, new: dict):
+    for key, val in new.items():
+        if isinstance(val, dict) and isinstance(base.get(key), dict):
+            base[key].update(val)
+        else:
+            base[key] = val
+
+
+def _to_arg(flag, val):
+    '''
+    Turn a config value into what Option.setval expects. Strings (all INI
+    values) are converted like command line arguments, lists and tables
+    are joined into the command line form first.
+    '''
+    typ = flag.type
+    if isinstance(val, str):
+        if typ is bool:
+            low = val.lower()
+            if low in ('1', 'true', 'yes', 'on'):
+                return True
+            if low in ('0', 'false', 'no', 'off'):
+                return False
+            raise UserException(f'{val!r} is not a boolean for --{flag.name}')
+        return val
+    if isinstance(val, (list, tuple)):
+        return ','.join(str(v) for v in val)
+    if isinstance(val, dict):
+        return ','.join(f'{k}:{v}' for k, v in val.items())
+    if isinstance(typ, type) and not isinstance(val, typ):
+        return str(val)
+    return val
+
+
+def _new_config(setting, name: str):
+    if setting is None or setting is False:
+        return None
+    if setting is True:
+        return Config(name)
+    if isinstance(setting, str):
+        return Config(setting)
+    if isinstance(setting, (list, tuple)):
+        return Config(name, [os.fspath(p) for p in setting])
+    return setting
@@ -0,0 +1,181 @@
+'''
+Deadlines for commands.
+
+    @command(timeout=30)
+    def sync(...):
+        ...
+
+    $ mycli sync --dispatch-timeout 10
+
+A callback that runs past its deadline is stopped with CommandTimeout.
+Async callbacks are cancelled through the event loop and sync callbacks
+running in the main thread are interrupted with SIGALRM. Anywhere else
+(other threads, platforms without SIGALRM) cancellation is cooperative:
+long running callbacks should call check() every so often or hand the
+Deadline from current() to the code doing the work.
+
+Deadlines nest, a command with a timeout run with --dispatch-timeout stops
+at whichever comes first. stdout and stderr are flushed before the error
+is raised so the output of a command that timed out is not lost.
+'''
+import sys
+import time
+import signal
+import threading
+import contextvars
+
+from ._base import _await
+from .exceptions import CommandTimeout, UserException
+
+_current = contextvars.ContextVar('dispatch_deadline', default=None)
+
+
+class Deadline:
+    '''
+    A point in time that a command has to finish by. A deadline created
+    inside another one never expires after it.
+    '''
+
+    __slots__ = ('seconds', 'expires', '_cancelled')
+
+    def __init__(self, seconds: float, parent: 'Deadline' = None):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+        self._cancelled = False
+        if parent is not None and parent.expires <= self.expires:
+            self.seconds = parent.seconds
+            self.expires = parent.expires
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(remaining={self.remaining():.3f})'
+
+    def remaining(self) -> float:
+        '''Seconds left before the deadline, 0 once it has passed.'''
+        return max(self.expires - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self._cancelled or time.monotonic() >= self.expires
+
+    def cancel(self):
+        '''Ask the code checking this deadline to stop now.'''
+        self._cancelled = True
+
+    def check(self):
+        '''Raise CommandTimeout if the deadline has passed.'''
+        if self.expired:
+            raise self.error()
+
+    def error(self) -> CommandTimeout:
+        if self._cancelled:
+            return CommandTimeout('cancelled')
+        return CommandTimeout(f'timed out after {self.seconds:g}s')
+
+
+def current():
+    '''The deadline of the command that is running, or None.'''
+    return _current.get()
+
+
+def check():
+    '''Raise CommandTimeout if the running command is past its deadline.'''
+    d = _current.get()
+    if d is not None:
+        d.check()
+
+
+def seconds(val) -> float:
+    '''Read a timeout given on the command line.'''
+    try:
+        secs = float(val)
+    except (TypeError, ValueError):
+        raise UserException(f'invalid timeout {val!r}') from None
+    if secs <= 0:
+        raise UserException(f'timeout must be more than 0, got {val!r}')
+    return secs
+
+
+def run(fn, timeout: float = None, loop=None):
+    '''
+    Call fn and await its result (on loop if it is given) within timeout
+    seconds and the deadline that is already running, if any.
+    '''
+    parent = _current.get()
+    if timeout is None and parent is None:
+        res = fn()
+        if hasattr(res, '__await__'):
+            res = _await(res, loop)
+        return res
+
+    d = Deadline(timeout, parent) if timeout is not None else Deadline(
+        parent.seconds, parent)
+    token = _current.set(d)
+    prev = _arm(d)
+    try:
+        res = fn()
+        if hasattr(res, '__await__'):
+            # the event loop cancels the callback, not the signal
+            _pause(prev)
+            res = _await(_limit(res, d), loop)
+        d.check()
+        return res
+    except CommandTimeout:
+        _flush()
+        raise
+    finally:
+        _current.reset(token)
+        _disarm(prev, parent)
+
+
+async def _limit(aw, d: Deadline):
+    import asyncio
+    try:
+        return await asyncio.wait_for(aw, d.remaining())
+    except asyncio.TimeoutError:
+        raise d.error() from None
+
+
+# the previous SIGALRM handler when the alarm is not used
+_NOT_ARMED = object()
+
+
+def _on_alarm(signum, frame):
+    d = _current.get()
+    if d is not None:
+        raise d.error()
+
+
+def _arm(d: Deadline):
+    '''Start the alarm for d if this is the main thread.'''
+    if (
+        not hasattr(signal, 'setitimer') or
+        threading.current_thread() is not threading.main_thread()
+    ):
+        return _NOT_ARMED
+    prev = signal.signal(signal.SIGALRM, _on_alarm)
+    # a timer of 0 turns the alarm off, so an expired deadline gets a tiny one
+    signal.setitimer(signal.ITIMER_REAL, max(d.remaining(), 1e-6))
+    return prev
+
+
+def _pause(prev):
+    if prev is not _NOT_ARMED:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _disarm(prev, parent: Deadline):
+    if prev is _NOT_ARMED:
+        return
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    signal.signal(signal.SIGALRM, prev)
+    if parent is not None and prev is _on_alarm:
+        # still inside an outer deadline
+        signal.setitimer(signal.ITIMER_REAL, max(parent.remaining(), 1e-6))
+
+
+def _flush():
+    for f in (sys.stdout, sys.stderr):
+        try:
+            f.flush()
+        except (OSError, ValueError):
+            pass
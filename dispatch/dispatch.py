@@ -1,22 +1,36 @@
 import sys, os
-import inspect
 from types import FunctionType, MethodType
 
 from .flags import FlagSet
 from ._meta import _FunctionMeta, _GroupMeta, _isgroup
-from ._base import _CliBase
+from ._base import _CliBase, _run_callback
+from .resource import close_resources
+from .types import File
 from .exceptions import (
     UserException, DeveloperException,
     RequiredFlagError, BadFlagError,
     CommandNotFound,
 )
 
-from typing import Optional, List, Generator, Callable, Any
+
+# the options each parallel mode takes
+_FANOUT_OPTIONS = {
+    'process': ('workers', 'chunksize', 'ordered', 'errors'),
+    'thread': ('workers', 'chunksize', 'ordered', 'errors'),
+    'tcp': ('chunksize', 'ordered', 'errors', 'retries', 'address',
+            'token', 'connect_timeout'),
+}
 
 
 class Command(_CliBase):
 
-    def __init__(self, callback: Callable, **kwrgs):
+    # name of the parameter that gets the result of the previous command in
+    # a pipeline, see SubCommand
+    pipe = None
+    # set when --no-cache is given to a sub-command, see Group.parse_args
+    _no_cache = False
+
+    def __init__(self, callback, **kwrgs):
         # note: docs are modified at runtime
         '''
         Initialze a new Command
@@ -42,6 +56,65 @@ class Command(_CliBase):
             help_template (str): template used for the help text
                 to have a value of None. This would mean that none of the
                 command's flags are required.
+
+            parallel (str): Either 'process' or 'thread'. Call the callback
+                once for each positional argument using a pool of workers.
+                The callback must take a variadic (*args) parameter.
+                'tcp' sends the arguments to worker processes on any
+                number of hosts instead, started with --dispatch-worker
+                HOST:PORT (see dispatch._distributed).
+            workers (int): Number of workers used by parallel='process' or
+                'thread', defaults to the number of cpus.
+            chunksize (int): Number of positional arguments sent to a worker
+                at a time.
+            ordered (bool): If False, print parallel results as they finish
+                instead of in the order the arguments were given.
+            errors (str): Either 'raise' (default) to stop at the first
+                failed argument or 'continue' to report it and move on.
+            retries (int): With parallel='tcp', how many more times an
+                argument is tried after it fails or its worker is lost.
+            address (str): HOST:PORT the parallel='tcp' coordinator listens
+                on, defaults to 127.0.0.1:7600. Use --dispatch-listen to
+                change it when running the command.
+            token (str): With parallel='tcp', the secret shared by the
+                coordinator and its workers, defaults to $DISPATCH_TOKEN.
+                Needed to listen on an address that is not loopback.
+            connect_timeout (float): With parallel='tcp', seconds a worker
+                waits for the coordinator and the coordinator waits without
+                any workers before failing, defaults to 30.
+            cache: True, a directory, or a dispatch.cache.Cache. Store the
+                command's results on disk and return the stored result when
+                the command is run again with the same flags, arguments,
+                file contents and code. Skip the cache with --no-cache.
+                Commands reading stdin are not cached.
+            config: True, an application name, a list of paths or a
+                dispatch.config.Config. Read flag defaults from layered
+                config files (see dispatch.config), a file given with
+                --config is read last.
+            dataclass_prefix: Parameters annotated with a dataclass get a
+                flag for each field. Use True to name the flags
+                <param>_<field>, a string to use as the prefix for every
+                dataclass parameter or a dict of {<param>: <prefix>}.
+            decompress: True or a dispatch.types.File type. Open each
+                positional argument as an input file, decompressing
+                gzip, bzip2 and xz files as they are read. Use
+                TextFile for text or File.options(threaded=True) to
+                decompress in a background thread. Not supported with
+                parallel.
+            timeout (float): Seconds the callback may run for before it is
+                stopped with CommandTimeout (see dispatch.deadline). Any
+                command can also be given --dispatch-timeout.
+            metrics: True, a directory or a dispatch.metrics.Registry.
+                Count runs, errors and the time spent in each phase and
+                write them for the Prometheus node exporter (see
+                dispatch.metrics). On by default when
+                $DISPATCH_METRICS_DIR is set, False turns it off.
+            audit: A path or a dispatch.audit.AuditLog. Log every run
+                (command, flags, duration and exit code) as a line of
+                JSON, hidden flags are redacted (see dispatch.audit).
+            watch (list): Globs of files that --dispatch-watch re-runs the
+                command for, on top of the files given as arguments (see
+                dispatch.watch).
         '''
         super().__init__(**kwrgs)
 
@@ -54,15 +127,85 @@ class Command(_CliBase):
             instance=kwrgs.pop('__instance__', None) # for commands that are part of a group
         )
         self._usage = kwrgs.pop('usage', f'{self._meta.name} [options]')
-        self._help = kwrgs.pop('help', self._meta.helpstr)
+        self._helpstr = kwrgs.pop('help', None)
+
+        self._fanout = None
+        parallel = kwrgs.pop('parallel', None)
+        fanout_opts = {
+            k: kwrgs.pop(k) for k in
+            ('workers', 'chunksize', 'ordered', 'errors', 'retries', 'address',
+             'token', 'connect_timeout')
+            if k in kwrgs
+        }
+        for k in fanout_opts:
+            if not parallel:
+                raise DeveloperException(f'{k!r} needs parallel')
+            if parallel in _FANOUT_OPTIONS and k not in _FANOUT_OPTIONS[parallel]:
+                raise DeveloperException(
+                    f'{k!r} does not apply to parallel={parallel!r}')
+        if parallel:
+            if not self._meta.has_variadic_param():
+                raise DeveloperException(
+                    'parallel commands need a variadic (*args) parameter')
+            if parallel == 'tcp':
+                from ._distributed import _Cluster
+                self._fanout = _Cluster(self, **fanout_opts)
+            else:
+                from ._parallel import _FanOut
+                self._fanout = _FanOut(parallel, **fanout_opts)
+
+        self._cache = None
+        cache = kwrgs.pop('cache', None)
+        if cache:
+            if self._fanout is not None:
+                raise DeveloperException(
+                    'cannot cache the results of a parallel command')
+            from .cache import _new_cache
+            self._cache = _new_cache(cache, self._meta.name)
+
+        self._config = None
+        config = kwrgs.pop('config', None)
+        if config:
+            from .config import _new_config
+            self._config = _new_config(config, self._meta.name)
+
+        self._timeout = kwrgs.pop('timeout', None)
+
+        decompress = kwrgs.pop('decompress', None)
+        self._decompress = File if decompress is True else decompress
+        if self._decompress is not None and not self._meta.has_variadic_param():
+            raise DeveloperException(
+                'decompress needs a variadic (*args) parameter')
+        if self._decompress is not None and self._fanout is not None:
+            raise DeveloperException(
+                'cannot decompress the arguments of a parallel command')
+
+        self.args: list = []
+        self.results: list = []
+        self._loop = None  # event loop for async callbacks, set by groups
+        names = self._meta.params()
+        dataclasses = self._meta.dataclass_params()
+        if dataclasses:
+            names = tuple(n for n in names if n not in dataclasses)
+            prefix = kwrgs.pop('dataclass_prefix', None)
+            settings = {
+                k: kwrgs.get(k) for k in
+                ('shorthands', 'docs', 'defaults', 'hidden') if k in kwrgs
+            }
 
-        self.args: List[str] = []
         self.flags = FlagSet(
-            names=self._meta.params(),
+            names=names,
             __command_meta__=self._meta,
             **kwrgs,
         )
 
+        self._dataclasses = ()
+        if dataclasses:
+            from ._dataclass import _expand
+            self._dataclasses = _expand(
+                self.flags, self._meta, dataclasses, prefix, **settings)
+        self._built()
+
     @property
     def usage(self):
         return self._usage
@@ -78,15 +221,75 @@ class Command(_CliBase):
     def __call__(self, argv=sys.argv):
         if argv is sys.argv:
             argv = argv[1:]
+        return self._call(argv)
+
+    def _main(self, argv: list):
         if '--help' in argv or 'help' in argv or '-h' in argv:
             return self.help()
+        self._phase('parse')
 
-        fn_args = self.parse_args(argv)
+        if getattr(self._fanout, 'mode', None) == 'tcp':
+            argv = self._fanout.options(argv)
+            if self._fanout.worker is not None:
+                return self._fanout.work(argv)
 
-        if self._meta.has_variadic_param():
-            res = self._meta.run(*self.args, **fn_args)
+        use_cache = self._cache is not None
+        if use_cache and 'no_cache' not in self.flags:
+            argv, no_cache = _CliBase._pop_option(argv, 'no-cache')
+            use_cache = not no_cache
+
+        if self._config is not None:
+            argv = self._load_config(argv)
+
+        fn_args = self.parse_args(argv)
+        self._phase('callback')
+        return self._execute(fn_args, use_cache)
+
+    def _main_kwargs(self, args: tuple, flags: dict):
+        use_cache = self._cache is not None
+        if 'no_cache' not in self.flags:
+            use_cache = use_cache and not flags.pop('no_cache', False)
+        if self._config is not None:
+            self._load_config([])
+        self._reset_values()
+        self.args = list(args)
+        self._set_flags(flags)
+        return self._execute(self._flag_values(), use_cache)
+
+    def _takes_no_cache(self, name: str) -> bool:
+        '''Whether name is the --no-cache option rather than a flag.'''
+        return name == 'no_cache' and self._cache is not None and \
+            'no_cache' not in self.flags
+
+    def _execute(self, fn_args: dict, use_cache: bool = True):
+        '''
+        Run the callback with arguments that have already been parsed.
+        '''
+        if self._fanout is not None:
+            # items that have not started are cancelled by a timeout
+            self.results, code = _run_callback(
+                lambda: self._fanout.run(self._meta.run, self.args, fn_args),
+                self._timeout)
+            return code
+
+        use_cache = use_cache and self._cache is not None and \
+            not self._no_cache
+
+        if use_cache:
+            key = self._cache.key(
+                self._meta.code, fn_args, self.args, self.flags,
+                self.args if self._decompress is not None else ())
+            use_cache = key is not None
+
+        if use_cache:
+            hit, res = self._cache.get(key)
+            if hit:
+                self._close_inputs(self.args)
+            else:
+                res = self._run(fn_args)
+                self._cache.set(key, res)
         else:
-            res = self._meta.run(**fn_args)
+            res = self._run(fn_args)
 
         if isinstance(res, int):
             # sys.exit(res)
@@ -95,6 +298,61 @@ class Command(_CliBase):
             print(res)
         return res
 
+    def _produce(self, fn_args: dict):
+        '''
+        Run as a step in the middle of a pipeline. The result is returned
+        without being printed or cached.
+        '''
+        if self._fanout is not None:
+            import io
+            self.results, _ = self._fanout.run(
+                self._meta.run, self.args, fn_args, out=io.StringIO())
+            return self.results
+        return self._run(fn_args)
+
+    def _feed(self, fn_args: dict, data):
+        '''
+        Pass the result of the previous step of a pipeline to this command,
+        either as the pipe parameter or as the positional arguments.
+        '''
+        if self.pipe is not None:
+            fn_args[self.pipe] = data
+        elif isinstance(data, (str, bytes, dict)) or not hasattr(data, '__iter__'):
+            self.args.append(data)
+        else:
+            self.args.extend(data)
+
+    def _run(self, fn_args: dict):
+        args = self.args
+        if self._decompress is not None:
+            args = [self._decompress(a) for a in args]
+        res = None
+        try:
+            res = _run_callback(
+                lambda: self._callback(args, fn_args), self._timeout, self._loop)
+            return res
+        finally:
+            # generators are still reading their input
+            if not hasattr(res, '__next__'):
+                self._close_inputs(args)
+
+    def _callback(self, args: list, fn_args: dict):
+        if self._meta.has_variadic_param():
+            return self._meta.run(*args, **fn_args)
+        return self._meta.run(**fn_args)
+
+    def _close_inputs(self, args: list):
+        '''Close the files opened for File flags and decompressed args.'''
+        # positional args that were already open files are left alone
+        files = [a for a, arg in zip(args, self.args) if a is not arg]
+        for f in self.flags.values():
+            typ = f._type
+            if isinstance(typ, type) and issubclass(typ, File):
+                files.append(f._value)
+        for f in files:
+            if hasattr(f, 'close'):
+                f.close()
+
     def __repr__(self):
         return f'{self.__class__.__name__}({self._meta.name}{self._meta.signature})'
 
@@ -108,6 +366,7 @@ class Command(_CliBase):
         to the Command's callback function.
         '''
         self.args = []
+        self._reset_values()
         args = args[:]
         while args:
             arg = args.pop(0)
@@ -119,10 +378,17 @@ class Command(_CliBase):
             flag = self.flags.get(arg)
 
             if not flag:
-                raise UserException(f'could not find flag {arg!r}')
+                raise BadFlagError(
+                    f'could not find flag {arg!r}' + self._flag_hint(arg))
 
             self._setflag_from_args(args, arg, val, flag)
-        return {n: f.value for n, f in self.flags.items()}
+        return self._flag_values()
+
+    def _flag_values(self) -> dict:
+        vals = {n: f.value for n, f in self.flags.items()}
+        for param in self._dataclasses:
+            vals[param.name] = param.build(vals)
+        return vals
 
     def run(self, argv=sys.argv):
         return self.__call__(argv)
@@ -166,7 +432,10 @@ class SubCommand(Command):
     The second purpose of this class is for Group's internal sub-command use.
     '''
 
-    def __init__(self, callback, hidden=False, **kwrgs):
+    _profile_build = False
+
+    def __init__(self, callback, hidden=False, pipe: str = None,
+                 needs=(), **kwrgs):
         if isinstance(callback, staticmethod):
             callback = callback.__func__
             kwrgs.pop('__instance__')  # static methods do not need an instance
@@ -174,6 +443,22 @@ class SubCommand(Command):
         self.group = kwrgs.pop('__command_group__', None)
         super().__init__(callback, **kwrgs)
         self.hidden = hidden
+        self.needs = tuple(needs)
+
+        self.pipe = pipe
+        if pipe is not None:
+            if pipe not in self._meta.params():
+                raise DeveloperException(
+                    f'{self.name!r} has no parameter named {pipe!r} to pipe to')
+            # the parameter is filled in by the pipeline, not a flag
+            del self.flags[pipe]
+            self._pipe_default = self._meta.defaults().get(pipe)
+
+    def _flag_values(self) -> dict:
+        vals = super()._flag_values()
+        if self.pipe is not None:
+            vals[self.pipe] = self._pipe_default
+        return vals
 
     @property
     def usage(self):
@@ -199,11 +484,35 @@ class Group(_CliBase):
             help: Give a custom description for the help message.
             silent: 'True' to stop the help message from printing when no arguments are given.
             doc_help:
+            reuse: 'True' to create the class instance once and use it for
+                every call so that its resources are only initialized once.
+                Resources are closed by Group.close or at exit.
+            plugins: Name of an entry point group. Every entry point in the
+                group is added as a sub-command (see dispatch.plugins).
+            plugin_cache: Directory for the cached plugin manifest.
+            config: Read flag defaults for the group and its sub-commands
+                from config files, see Command.
+            pipeline: True or a separator (default '+') to allow running
+                several sub-commands in one call, 'cli a + b + c'. The
+                result of each one is passed to the next as its pipe
+                parameter (see subcommand) or as its positional arguments.
+            timeout: Seconds a call to the group may run for, this includes
+                the instance's context manager and every step of a
+                pipeline. Sub-commands may have a timeout of their own.
+            metrics: Record metrics for every sub-command, see Command.
+            audit: Log every call to the group, see Command.
+            watch: Globs of files to watch with --dispatch-watch, see
+                Command.
         '''
         super().__init__(**kwrgs)
         self._usage = kwrgs.pop('usage', None)
         self.silent = kwrgs.pop('silent', False)
         self.init = kwrgs.pop('init', dict())
+        self.reuse = kwrgs.pop('reuse', False)
+        self._loop = None
+        self._timeout = kwrgs.pop('timeout', None)
+        pipeline = kwrgs.pop('pipeline', None)
+        self._pipeline = '+' if pipeline is True else pipeline
 
         if isinstance(obj, type):
             self.inst = None
@@ -215,17 +524,42 @@ class Group(_CliBase):
         self.args = []
         self.name = self.type.__name__
 
+        self._config = None
+        self._config_values = {}
+        config = kwrgs.pop('config', None)
+        if config:
+            from .config import _new_config
+            self._config = _new_config(config, self.name)
+
         self.commands, self.aliases = _retrieve_commands(self.type)
+        self._subcommands: dict = {}
         for k, alias in self.aliases.items():
             self.commands[alias] = self.commands[k]
 
+        plugins = kwrgs.pop('plugins', None)
+        plugin_cache = kwrgs.pop('plugin_cache', None)
+        if plugins:
+            from .plugins import _load_plugins
+            for name, plugin in _load_plugins(plugins, plugin_cache).items():
+                self.commands.setdefault(name, plugin)
+
+        self._command_index = None  # built when a name is mistyped
+        self._graph = None
+        self._done = (None, set())
+        if any(getattr(c, 'needs', None) for c in self.commands.values()):
+            from ._dag import graph, _runner
+            self._graph = graph(self.commands)
+            if 'run' not in self.commands:
+                self.commands['run'] = SubCommand(
+                    _runner(self), __command_group__=self)
+
         self._hidden = kwrgs.pop('hidden', set())
         for c in self.commands.values():
             if isinstance(c, SubCommand) and c.hidden:
                 self._hidden.add(c.name)
 
         self._meta = _GroupMeta(self.type)
-        self._help = kwrgs.pop('help', self._meta.helpstr)
+        self._helpstr = kwrgs.pop('help', None)
         self.flags = FlagSet(
             names=tuple(self._meta.flagnames()),
             __command_meta__=self._meta,
@@ -256,13 +590,25 @@ class Group(_CliBase):
         self.type.__getattr__ = new_getattr
         self.type.__setattr__ = new_setattr
 
+        if self.reuse:
+            import atexit
+            atexit.register(self.close)
+        self._built()
+
     @property
     def usage(self):
         return self._usage or f'{self.name} [options] [command]'
 
-    def __call__(self, argv: List[str] = sys.argv):
+    def __call__(self, argv: list = sys.argv):
         if argv is sys.argv:
             argv = argv[1:]
+        ret = self._call(argv)
+        if isinstance(ret, int):
+            sys.exit(ret)
+        else:
+            return ret
+
+    def _main(self, argv: list):
         if argv:
             if 'help' in argv[0]:
                 if argv[1:] and self.iscommand(argv[1]):
@@ -271,32 +617,199 @@ class Group(_CliBase):
                     return self.help()
             elif argv[0] == '-h':
                 return self.help()
+            name = self._help_target(argv)
+            if name is not None:
+                return self._get_command(name).help()
+
+        # group flags set by the class's __init__ are kept
+        self._reset_values()
+        self._phase('init')
+        self._instance()
+
+        self._phase('parse')
+        if self._config is not None:
+            argv = self._load_config(argv)
+
+        if self._pipeline and self._pipeline in argv:
+            cmd, cur_flags = self._parse_pipeline(argv)
+        else:
+            cmd, cur_flags = self.parse_args(argv)
+        self._phase('callback')
+        return self._run_parsed(cmd, cur_flags)
+
+    def _parse_pipeline(self, argv: list) -> tuple:
+        '''
+        Parse each step of a pipeline. Returns a list of (sub-command,
+        function arguments, positional arguments) and the group flags.
+        '''
+        segments = [[]]
+        for arg in argv:
+            if arg == self._pipeline:
+                segments.append([])
+            else:
+                segments[-1].append(arg)
+
+        steps = []
+        cur_flags = {}
+        for i, seg in enumerate(segments):
+            cmd, flags = self.parse_args(seg)
+            if cmd is None:
+                raise CommandNotFound(
+                    f'step {i + 1} of the pipeline has no command')
+            if i and cmd.pipe is None and not cmd._meta.has_variadic_param():
+                raise UserException(
+                    f'{cmd.name!r} cannot take the output of another command')
+            cur_flags.update(flags)
+            # a sub-command can be used more than once so its values are
+            # saved now instead of being read from its flags later
+            steps.append((cmd, cmd._flag_values(), cmd.args))
+        return steps, cur_flags
+
+    def _run_pipeline(self, steps: list):
+        data = None
+        for i, (cmd, fn_args, args) in enumerate(steps):
+            cmd.args = args
+            cmd._loop = self._loop
+            if i:
+                cmd._feed(fn_args, data)
+            if i == len(steps) - 1:
+                return cmd._execute(fn_args)
+            data = cmd._produce(fn_args)
+
+    def _main_kwargs(self, args: tuple, flags: dict):
+        self._reset_values()
+        self._instance()
+
+        if self._config is not None:
+            self._load_config([])
+
+        args = list(args)
+        self.args = []
+        cmd = None
+        if args and self.iscommand(args[0]):
+            cmd = self._start_command(args.pop(0))
+        self.args.extend(args)
+
+        cur_flags = {}
+        for name, val in flags.items():
+            flag = self.flags.get(name)
+            if flag is not None:
+                flag.setval(val)
+                cur_flags[flag.name] = flag.value
+            elif cmd is not None and cmd._takes_no_cache(name):
+                cmd._no_cache = bool(val)
+            elif cmd is not None:
+                cmd._set_flags({name: val})
+            else:
+                raise BadFlagError(
+                    f'--{name} is not a flag' + self._flag_hint(name))
+        return self._run_parsed(cmd, cur_flags)
+
+    def _run_parsed(self, cmd, cur_flags: dict):
+        '''
+        Set the group flags on the instance and run the sub-command.
+        '''
+        if self._config_values:
+            # group flags are attributes of the instance, the defaults from
+            # the config files need to be set like the flags that were given
+            cur_flags = {
+                **{
+                    n: self.flags[n].value for n, v in self._config_values.items()
+                    if not isinstance(v, dict)
+                },
+                **cur_flags,
+            }
+        for name, val in cur_flags.items():
+            setattr(self.inst, name, val)
+
+        try:
+            res = _run_callback(
+                lambda: self._run_in_context(cmd), self._timeout)
+        except BaseException as e:
+            if not self.reuse:
+                self._close(e)
+            raise
+        if not self.reuse:
+            self.close()
+        return res
 
+    def _instance(self):
+        if self.reuse and self.inst is not None:
+            return self.inst
         try:
             self.inst = self.type(**self.init)
         except TypeError:
             raise TypeError(
                 f"""can't call __init__ for a {self.type.__name__},
         try passing the 'init' dict as an argument to @command.""")
+        return self.inst
 
-        cmd, cur_flags = self.parse_args(argv)
-        for name, val in cur_flags.items():
-            setattr(self.inst, name, val)
-
+    def _run_in_context(self, cmd):
+        '''
+        Run the sub-command inside the instance's context manager (sync or
+        async) if the group's class defines one.
+        '''
+        if hasattr(self.type, '__aenter__'):
+            import asyncio
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+            loop = self._loop
+            loop.run_until_complete(self.inst.__aenter__())
+            try:
+                ret = self._run_command(cmd)
+            except BaseException as e:
+                if not loop.run_until_complete(
+                        self.inst.__aexit__(type(e), e, e.__traceback__)):
+                    raise
+                return None
+            loop.run_until_complete(self.inst.__aexit__(None, None, None))
+            return ret
+        elif hasattr(self.type, '__enter__'):
+            with self.inst:
+                return self._run_command(cmd)
+        return self._run_command(cmd)
+
+    def _run_command(self, cmd):
+        if isinstance(cmd, list):
+            return self._run_pipeline(cmd)
         if callable(self.inst) and cmd is None:
-            ret = self.inst()
+            return _run_callback(self.inst, loop=self._loop)
         elif cmd is None:
+            hint = self._command_hint(self.args[0]) if self.args else ''
+            if hint:
+                raise CommandNotFound(
+                    f'{self.args[0]!r} is not a command' + hint)
             if not self.silent:
                 self.help()
-            ret = None  # my tests monkey patch the exit function
-            sys.exit(1)
-        else:
-            ret = cmd(argv=self.args)
+            return 1
+        cmd._loop = self._loop
+        return cmd._execute(cmd._flag_values())
 
-        if isinstance(ret, int):
-            sys.exit(ret)
-        else:
-            return ret
+    def shell(self, argv: list = (), lines=None, **kwrgs) -> int:
+        '''
+        Start an interactive shell that runs each line as a sub-command of
+        one long lived instance. argv holds group flags for the whole
+        session and lines replaces the prompt. Keyword arguments are passed
+        on to dispatch.shell.Shell.
+        '''
+        from .shell import Shell
+        return Shell(self, **kwrgs).run(argv, lines)
+
+    def close(self):
+        '''
+        Close the resources of the group's instance. This is only needed
+        for groups created with reuse=True, other groups close their
+        resources after every call.
+        '''
+        self._close()
+
+    def _close(self, exc: BaseException = None):
+        try:
+            close_resources(self.inst, exc)
+        finally:
+            if self._loop is not None:
+                self._loop.close()
+                self._loop = None
 
     # this is only really used while testing
     def _reset(self):
@@ -311,58 +824,133 @@ class Group(_CliBase):
             name in self.commands
         )
 
+    def _command_hint(self, name: str) -> str:
+        '''The end of the error message for a sub-command that isn't one.'''
+        from ._suggest import command_index, hint
+        if self._command_index is None:
+            self._command_index = command_index(self)
+        return hint(self._command_index.suggest(name))
+
     def _get_command(self, name: str) -> SubCommand:
         fn = self.commands[name.replace('-', '_')]
 
+        if getattr(fn, '_is_plugin', False):
+            return fn.command(self)
         if isinstance(fn, SubCommand):
             fn._meta.set_instance(self.inst)
             fn.group = self
             return fn
-        return SubCommand(fn, __instance__=self.inst, __command_group__=self)
 
-    def parse_args(self, args: List[str]):  # -> Optional[SubCommand]:
+        # sub-commands are created once per group, only the instance
+        # changes between calls
+        cmd = self._subcommands.get(fn)
+        if cmd is None:
+            cmd = self._subcommands[fn] = SubCommand(
+                fn, __instance__=self.inst, __command_group__=self)
+        elif cmd._meta.needs_self:
+            cmd._meta.instance = self.inst
+        return cmd
+
+    def parse_args(self, args: list):  # -> Optional[SubCommand]:
+        '''
+        Parse the group's arguments and the arguments of its sub-command in
+        a single pass. Group flags may be given before or after the
+        sub-command's name, any other flag after the name is set on the
+        sub-command directly and positional arguments are shared with the
+        sub-command's args.
+
+        Returns the sub-command (None if there isn't one) and a dict of the
+        group flags that were given.
+        '''
         # TODO: add support for multiple flag shorthands (-vxcf instead of -v -x -c -f)
         nextcmd = None
         flags = {}
+        self.args = []
+        args = args[:]
         while args:
             # Need to find either a command or a flag
             # otherwise, add an argument an move on.
             raw_arg = args.pop(0)
             # we only want to find the first command it the args
             if nextcmd is None and self.iscommand(raw_arg):
-                nextcmd = self._get_command(raw_arg)
+                nextcmd = self._start_command(raw_arg)
                 continue
 
-            if raw_arg[0] != '-':
+            if not raw_arg.startswith('-'):
                 self.args.append(raw_arg)
                 continue
 
             arg, val = _CliBase.process_arg(raw_arg)
             flag = self.flags.get(arg)
 
-            if flag is None:
-                if nextcmd is None:
-                    # if we have not found a sub-command yet then the unkown
-                    # flag should not be passed on to any other commands we
-                    # should throw and error for an unknown flag
-                    if self.args:
-                        raise CommandNotFound(f'{self.args[0]!r} is not a command')
-                    else:
-                        raise BadFlagError(f'{raw_arg!r} is not a flag')
-
-                # if the flag is not in the group, then it might be
-                # for the next command (self.args is eventually passed
-                # to the next command).
-                self.args.append(raw_arg)
+            if flag is not None:
+                self._setflag_from_args(args, arg, val, flag)
+                flags[flag.name] = flag.value
+            elif nextcmd is not None:
+                flag = nextcmd.flags.get(arg)
+                if flag is None and not val and nextcmd._takes_no_cache(arg):
+                    nextcmd._no_cache = True
+                    continue
+                if flag is None:
+                    raise BadFlagError(
+                        f'{raw_arg!r} is not a flag for {nextcmd.name!r}' +
+                        nextcmd._flag_hint(arg))
+                nextcmd._setflag_from_args(args, arg, val, flag)
+            elif self.args:
+                # if we have not found a sub-command yet then the unkown
+                # flag does not belong to anything
+                raise CommandNotFound(
+                    f'{self.args[0]!r} is not a command' +
+                    self._command_hint(self.args[0]))
+            else:
+                raise BadFlagError(
+                    f'{raw_arg!r} is not a flag' + self._flag_hint(arg))
+        return nextcmd, flags
+
+    def _start_command(self, name: str) -> SubCommand:
+        '''
+        Get a sub-command ready to have its flags set.
+        '''
+        cmd = self._get_command(name)
+        cmd.args = self.args
+        cmd._reset_values()
+        cmd._no_cache = False
+        self._started(cmd)
+        section = self._config_values.get(cmd.name)
+        if section:
+            self._config.apply(cmd.flags, section, reset=False)
+        return cmd
+
+    def _all_flagsets(self) -> list:
+        '''
+        The flag sets of every sub-command, building the ones that have
+        not been used yet.
+        '''
+        res = []
+        for name in self.commands:
+            if name.startswith('_'):
                 continue
+            try:
+                res.append(self._get_command(name).flags)
+            except Exception:
+                continue  # a plugin that can't be loaded
+        return res
 
-            self._setflag_from_args(args, arg, val, flag)
-            flags[flag.name] = flag.value
-            # setattr(self.inst, flag.name, flag.value)
-        return nextcmd, flags
+    def _help_target(self, argv: list):
+        '''
+        Find the command that a help flag given after a sub-command's name
+        refers to. Returns None if there is no such help flag.
+        '''
+        for i, arg in enumerate(argv):
+            if self.iscommand(arg):
+                rest = argv[i + 1:]
+                if '--help' in rest or '-h' in rest or 'help' in rest:
+                    return arg
+                return None
+        return None
 
     # TODO: this is a totol mess, please, someone fix this.
-    def _command_help(self) -> Optional[str]:
+    def _command_help(self):
         '''
         returns the command part of the help text as a string.
         '''
@@ -395,6 +983,8 @@ class Group(_CliBase):
                 continue
             if isinstance(c, SubCommand):
                 docs.append(c._meta.helpstr)
+            elif getattr(c, '_is_plugin', False):
+                docs.append(c.entry['help'])
             elif c.__doc__:
                 for line in c.__doc__.split('\n'):
                     if line:
@@ -430,6 +1020,36 @@ def command(_obj=None, **kwrgs):
         help_template (str): template used for the help text
             to have a value of None. This would mean that none of the
             command's flags are required.
+
+        parallel (str): Either 'process', 'thread' or 'tcp'. Call the
+            callback once for each positional argument using a pool of
+            workers, 'tcp' workers are other processes on any host.
+        workers (int): Number of workers used by parallel.
+        chunksize (int): Number of positional arguments sent to a worker
+            at a time.
+        ordered (bool): If False, print parallel results as they finish.
+        errors (str): Either 'raise' or 'continue' when a parallel call
+            fails.
+        retries (int): Times a failed argument is retried with 'tcp'.
+        address (str): HOST:PORT the 'tcp' coordinator listens on.
+        cache: True, a directory, or a dispatch.cache.Cache used to store
+            the command's results on disk.
+        decompress: True or a dispatch.types.File type to open positional
+            arguments as (decompressed) input files.
+        pipeline: True or a separator to run several sub-commands of a
+            group in one call, see Group.
+        config: True, an application name, a list of paths or a
+            dispatch.config.Config to read flag defaults from.
+        dataclass_prefix: Prefix for the flags of dataclass parameters,
+            True for '<param>_', a string or a dict of {<param>: <prefix>}.
+        timeout (float): Seconds the callback may run for before it is
+            stopped with CommandTimeout, see dispatch.deadline.
+        metrics: True, a directory or a dispatch.metrics.Registry to count
+            runs, errors and phase latencies, see dispatch.metrics.
+        audit: A path or a dispatch.audit.AuditLog to log every run to,
+            see dispatch.audit.
+        watch (list): Globs of extra files that --dispatch-watch re-runs
+            the command for, see dispatch.watch.
     '''
     def cmd(obj):
         if _isgroup(obj):
@@ -448,6 +1068,15 @@ def subcommand(_obj=None, **kwrgs):
 
     Keyword Args:
         hidden `bool`: will hide the entire command if set to True
+        pipe `str`: name of the parameter that gets the result of the
+            previous command when the sub-command is used in a pipeline
+            (see Group's pipeline option). Generators are passed on as
+            they are so the pipeline streams.
+        timeout `float`: seconds the sub-command may run for, see
+            dispatch.deadline.
+        needs `list`: names of the sub-commands that have to run before
+            this one. The group gets a 'run' sub-command that runs the
+            graph in parallel, see dispatch._dag.
     '''
     def subcmd(obj):
         return SubCommand(obj, **kwrgs)
@@ -15,3 +15,7 @@ class BadFlagError(UserException):
 
 class CommandNotFound(UserException):
     pass
+
+
+class CommandTimeout(UserException):
+    pass
@@ -1,59 +1,113 @@
 import sys
-from typing import Dict, Optional
-from collections.abc import Iterable
-from dataclasses import is_dataclass
 
 from .exceptions import DeveloperException
+from .types import lazy
 from ._meta import _FunctionMeta, _GroupMeta, _CliMeta
 
 
-class Option:
+class _Spec:
+    '''
+    The parts of an Option that stay the same between runs. Equal specs are
+    shared (see _intern) so that CLIs that repeat the same flags across
+    many commands only store each one once.
+    '''
 
-    __slots__ = ('name', 'type', 'shorthand', 'help', '_value',
-                 'hidden', '_default', 'has_default', 'f_len', 'hide_default')
+    __slots__ = ('name', 'type', 'ns', 'shorthand', 'help', 'hidden',
+                 'default', 'has_default', 'hide_default')
 
-    def __init__(self, name, typ, *,
-                 shorthand: str = None, help: str = None, value=None,
-                 hidden=False, has_default=False, hide_default=False):
+    def __init__(self, name, typ, ns, shorthand, help, hidden,
+                 default, has_default, hide_default):
         self.name = name
-        self.type = typ if typ is not None else bool
-
+        self.type = typ
+        self.ns = ns
         self.shorthand = shorthand
-        self.help = help or ''
-        self.value = value  # will infer and set the type
-
+        self.help = help
         self.hidden = hidden
-        self._default = value
-        self.has_default = has_default or value is not None
+        self.default = default
+        self.has_default = has_default
         self.hide_default = hide_default
-        self.f_len = len(self.name)  # len(name) is temp, will be set when formatting
 
-        if self.shorthand == 'h' and self.name != 'help':
+    def replace(self, **changes) -> '_Spec':
+        '''Returns an unshared copy of the spec with some fields changed.'''
+        vals = {k: getattr(self, k) for k in self.__slots__}
+        vals.update(changes)
+        vals['typ'] = vals.pop('type')
+        return _Spec(**vals)
+
+
+# {spec key: spec}, the oldest specs are dropped once there are MAX_SPECS
+# (weakref is not imported by the cli). A dropped spec is only not shared.
+_specs: dict = {}
+MAX_SPECS = 4096
+
+
+def _intern(name, typ, ns, shorthand, help, hidden,
+            default, has_default, hide_default) -> _Spec:
+    try:
+        key = (name, typ, id(ns), shorthand, help, hidden,
+               default.__class__, default, has_default, hide_default)
+        spec = _specs.get(key)
+    except TypeError:
+        # unhashable defaults (lists, dicts) are not shared
+        return _Spec(name, typ, ns, shorthand, help, hidden,
+                     default, has_default, hide_default)
+    if spec is None:
+        if len(_specs) >= MAX_SPECS:
+            del _specs[next(iter(_specs))]
+        spec = _specs[key] = _Spec(
+            sys.intern(name), typ, ns, shorthand, help, hidden,
+            default, has_default, hide_default)
+    return spec
+
+
+class Option:
+
+    # everything that is the same between runs is in _spec, an Option only
+    # stores the flag's current value and where its help text comes from
+    __slots__ = ('_spec', '_value', '_docs', '_help')
+
+    def __init__(self, name, typ, *,
+                 shorthand: str = None, help: str = None, value=None,
+                 hidden=False, has_default=False, hide_default=False,
+                 namespace: dict = None, docs=None):
+        # the type of the default value takes precedence over the annotation
+        if value is not None and value.__class__ is not lazy:
+            typ = value.__class__
+        elif typ is None:
+            typ = bool
+
+        if shorthand == 'h' and name != 'help':
             raise DeveloperException(
                 "cannot use 'h' as shorthand (reserved for --help)")
 
+        # string annotations are resolved in the namespace the first time
+        # the flag's type is needed
+        self._spec = _intern(
+            name, typ, namespace, shorthand, help, hidden,
+            value, has_default or value is not None, hide_default,
+        )
+        self._value = value
+        # when help is None it is looked up in the command's docstring
+        # (docs is the command's _CliMeta) the first time it is needed
+        self._docs = docs
+        self._help = help
+
     def __format__(self, spec: str):
-        name_spec = f'<{self.f_len}'
-        prefix = ''
-        if spec:
-            if '<' in spec:
-                name_spec = '<' + spec[spec.index('<') + 1]
-            elif '>' in spec:
-                name_spec = '>' + spec[spec.index('>') + 1]
-            if '+' in spec:
-                prefix = ' ' * int(spec[spec.index('+')+1])
+        align, width, indent = _parse_spec(spec, len(self.name))
 
         if self.shorthand:
             short = f'-{self.shorthand}, '
         else:
             short = ' ' * 4
 
-        return '{0}{short}--{name:{1}}{help}{default}'.format(
-            prefix, name_spec, short=short,
-            name=self.name.replace('_', '-'),
-            help=self.help,
-            default=self.show_default(),
-        )
+        # the width is the width of the name, the shorthand and dashes are
+        # aligned with it
+        flag = '{0}--{1}'.format(short, self.name.replace('_', '-'))
+        flag = f'{flag:{align}{width + len(short) + 2}}'
+        rest = f'{self.help}{self.show_default()}'
+        if rest and not flag.endswith(' '):
+            flag += ' '  # a name that fills its column
+        return ' ' * indent + flag + rest
 
     def __repr__(self):
         return "{}('{}', {})".format(
@@ -65,9 +119,93 @@ class Option:
         else:
             return '     --{}'.format(self.name)
 
+    def _replace(self, **changes):
+        self._spec = self._spec.replace(**changes)
+
+    @property
+    def name(self) -> str:
+        return self._spec.name
+
+    @property
+    def shorthand(self) -> str:
+        return self._spec.shorthand
+
+    @shorthand.setter
+    def shorthand(self, val):
+        self._replace(shorthand=val)
+
+    @property
+    def hidden(self) -> bool:
+        return self._spec.hidden
+
+    @hidden.setter
+    def hidden(self, val):
+        self._replace(hidden=val)
+
+    @property
+    def _default(self):
+        return self._spec.default
+
+    @_default.setter
+    def _default(self, val):
+        self._replace(default=val)
+
+    @property
+    def has_default(self) -> bool:
+        return self._spec.has_default
+
+    @has_default.setter
+    def has_default(self, val):
+        self._replace(has_default=val)
+
+    @property
+    def hide_default(self) -> bool:
+        return self._spec.hide_default
+
+    @hide_default.setter
+    def hide_default(self, val):
+        self._replace(hide_default=val)
+
+    @property
+    def help(self) -> str:
+        if self._help is None:
+            if self._docs is not None:
+                self._help = self._docs.flagdoc(self.name)
+            else:
+                self._help = ''
+        return self._help
+
+    @help.setter
+    def help(self, val):
+        self._help = val
+
+    @property
+    def _type(self):
+        return self._spec.type
+
+    @property
+    def type(self):
+        spec = self._spec
+        if isinstance(spec.type, str):
+            # resolving is the same for every option that shares the spec
+            spec.type = _resolve_type(spec.type, spec.ns, spec.name)
+        return spec.type
+
+    @type.setter
+    def type(self, typ):
+        if typ is not self._spec.type:
+            self._replace(type=typ)
+
     @property
     def value(self):
-        return self._value
+        val = self._value
+        if val.__class__ is lazy:
+            # the default is computed the first time the value of a flag
+            # that was not given is needed
+            self._value = None
+            self.setval(val())
+            val = self._value
+        return val
 
     @value.setter
     def value(self, val):
@@ -76,12 +214,15 @@ class Option:
             self.type = val.__class__
 
     def show_default(self) -> str:
-        if self.has_default and not self.hide_default and self.value:
-            if self.help:
-                return f' (default: {self.value!r})'
-            else:
-                return f'default: {self.value!r}'
-        return ''
+        # the default, not the value, which is left over from the last run
+        default = self._default
+        if self.hide_default or not (
+            default.__class__ is lazy or (self.has_default and default)
+        ):
+            return ''
+        if self.help:
+            return f' (default: {default!r})'
+        return f'default: {default!r}'
 
     def setval(self, val):
         '''
@@ -127,6 +268,8 @@ class Option:
         If there is a default value, that will be returned.
         '''
         if self.has_default:
+            if self._default.__class__ is lazy:
+                return self._default()
             return self._default
 
         try:
@@ -140,13 +283,25 @@ class Option:
         self._value = self._getnull()
 
 
+class _HelpFlag:
+    '''
+    Creates the default help flag the first time it is used and then
+    replaces itself with the flag on the class it was accessed through.
+    '''
+
+    def __get__(self, inst, owner):
+        flag = Option('help', bool, shorthand='h', help='Get help.')
+        setattr(owner, 'DEFAULT_HELP_FLAG', flag)
+        return flag
+
+
 class FlagSet:
     '''A Set of cli Flags'''
 
-    DEFAULT_HELP_FLAG = Option('help', bool, shorthand='h', help='Get help.')
+    DEFAULT_HELP_FLAG = _HelpFlag()
     MIN_FMT_LEN = 3
 
-    __slots__ = ('_flags', '_flagnames', '_shorthands')
+    __slots__ = ('_flags', '_shorthands')
 
     def __init__(self, *, names: tuple = None, defaults: dict = None,
                  docs: dict = None, types: dict = None,
@@ -166,34 +321,40 @@ class FlagSet:
                 text of the FlagSet.
             hidden_defaults: `set` of flags that should not show their defauts
         '''
-        self._flags: Dict[str, Option] = {}
-        self._flagnames = names or ()
-        self._shorthands = shorthands or dict()
+        self._flags: dict = {}
+        self._shorthands = dict(shorthands or ())
 
         types = types or dict()
         defaults = defaults or dict()
         docs = docs or dict()
         hidden_defaults = kwrgs.pop('hidden_defaults', set())
 
-        cmd_meta: Optional[_CliMeta] = kwrgs.pop('__command_meta__')
+        cmd_meta = kwrgs.pop('__command_meta__')
         if cmd_meta:
             if not isinstance(cmd_meta, _CliMeta):
                 raise TypeError('__command_meta__ should inherit from _meta._CliMeta')
 
-            for key, val in cmd_meta.flagdocs.items():
-                self._shorthands[key] = val.get('shorthand')
-                docs[key] = val.get('doc')
+            # only the shorthands are parsed from the docstring here, the help
+            # text is parsed when it is first shown
+            for key, short in cmd_meta.shorthands().items():
+                self._shorthands.setdefault(key, short)
             types.update(cmd_meta.annotations())
             defaults.update(cmd_meta.defaults())
+            namespace = cmd_meta.namespace()
+        else:
+            namespace = None
 
-        for name in self._flagnames:
+        for name in names or ():
             opt = Option(
-                name, types.get(name, bool),
+                name, types.get(name, str if isinstance(
+                    defaults.get(name), lazy) else bool),
                 shorthand=self._shorthands.get(name),
-                help=docs.get(name, ''),
+                help=docs.get(name),
+                docs=cmd_meta,
                 value=defaults.get(name),
                 hidden=name in hidden,
                 hide_default=name in hidden_defaults,
+                namespace=namespace,
             )
             self[name] = opt
 
@@ -262,6 +423,64 @@ class FlagSet:
         yield self.DEFAULT_HELP_FLAG
 
 
+class _Padded:
+    '''
+    Formats a flag padded to the width of the longest flag name in its
+    help text, otherwise it behaves like the flag.
+    '''
+
+    __slots__ = ('flag', 'width')
+
+    def __init__(self, flag: Option, width: int):
+        self.flag = flag
+        self.width = width
+
+    def __format__(self, spec: str):
+        return self.flag.__format__(spec or f'<{self.width}')
+
+    def __str__(self):
+        return str(self.flag)
+
+    def __getattr__(self, name):
+        return getattr(self.flag, name)
+
+
+def _parse_spec(spec: str, width: int) -> tuple:
+    '''
+    Parse an Option format spec such as '<20' or '>12+4' into the alignment
+    and width of the flag name and the number of spaces to indent by.
+    '''
+    align, indent = '<', 0
+    for ch in '<>':
+        i = spec.find(ch)
+        if i != -1:
+            align = ch
+            width = int(_digits(spec, i + 1) or width)
+    i = spec.find('+')
+    if i != -1:
+        indent = int(_digits(spec, i + 1) or 0)
+    return align, width, indent
+
+
+def _digits(s: str, i: int) -> str:
+    j = i
+    while j < len(s) and s[j].isdigit():
+        j += 1
+    return s[i:j]
+
+
+def _resolve_type(annotation: str, namespace: dict, name: str):
+    '''
+    Evaluate a postponed (string) annotation for the flag 'name'.
+    '''
+    try:
+        return eval(annotation, namespace if namespace is not None else {})
+    except Exception as e:
+        raise DeveloperException(
+            f'could not resolve the type {annotation!r} of flag --{name}: {e}'
+        ) from e
+
+
 def _from_typing_module(t) -> bool:
     if hasattr(t, '__module__'):
         mod = t.__module__
@@ -271,6 +490,7 @@ def _from_typing_module(t) -> bool:
 
 
 def _is_iterable(t) -> bool:
+    from collections.abc import Iterable
     if _from_typing_module(t):
         return issubclass(t.__origin__, Iterable)
     return isinstance(t, Iterable) or issubclass(t, Iterable)
@@ -0,0 +1,82 @@
+'''
+Running commands in-process.
+
+    res = cli.invoke(['deploy', '--region', 'eu'])
+    assert res.exit_code == 0
+    assert 'deployed' in res.stdout
+
+The keyword form skips command line parsing altogether:
+
+    res = cli.invoke_kwargs('deploy', region='eu')
+
+Neither one calls sys.exit, so they are much cheaper than running the CLI
+in a subprocess.
+'''
+import io
+import sys
+from contextlib import redirect_stdout, redirect_stderr
+
+from .exceptions import UserException
+
+
+class InvocationResult:
+    '''
+    The result of Command.invoke or Group.invoke. stdout and stderr are
+    None when output was not captured.
+    '''
+
+    __slots__ = ('value', 'exit_code', 'stdout', 'stderr', 'exception')
+
+    def __init__(self, value=None, exit_code: int = 0, stdout: str = None,
+                 stderr: str = None, exception: BaseException = None):
+        self.value = value
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+        self.exception = exception
+
+    def __repr__(self):
+        return (
+            f'{self.__class__.__name__}(value={self.value!r}, '
+            f'exit_code={self.exit_code}, exception={self.exception!r})'
+        )
+
+
+def _invoke(run, capture: bool) -> InvocationResult:
+    if not capture:
+        return _run(run)
+    out, err = io.StringIO(), io.StringIO()
+    with redirect_stdout(out), redirect_stderr(err):
+        res = _run(run)
+    res.stdout = out.getvalue()
+    res.stderr = err.getvalue()
+    return res
+
+
+def _run(run) -> InvocationResult:
+    res = InvocationResult()
+    try:
+        res.value = run()
+    except SystemExit as e:
+        res.exit_code = _exit_code(e.code)
+    except UserException as e:
+        # the same as dispatch.handle
+        print('Error:', e, file=sys.stderr)
+        res.exception = e
+        res.exit_code = 1
+    except Exception as e:
+        res.exception = e
+        res.exit_code = 1
+    else:
+        if isinstance(res.value, int):
+            res.exit_code = res.value
+    return res
+
+
+def _exit_code(code) -> int:
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
@@ -0,0 +1,397 @@
+'''
+Checking a command line against a manifest of the CLI before importing it.
+
+A CLI whose module is slow to import can be started through a launcher
+that only reads a JSON manifest of its commands, flags and help text:
+
+    # mycli/__main__.py
+    import sys
+    from dispatch import handle
+    from dispatch.launcher import launch
+
+    sys.exit(handle(lambda: launch('mycli.cli:main', 'mycli/cli.json')))
+
+--help and command lines with unknown commands or flags are answered from
+the manifest in a few milliseconds, with the same output and exceptions as
+the real command. The module is only imported once the command line is
+known to be valid. The manifest is written with
+
+    $ python -m dispatch.launcher mycli.cli:main mycli/cli.json
+
+(or with write) and it is rewritten by the launcher when the file of any
+module that defines one of its commands or flag types has changed since. Anything the manifest can't answer (plugins, nested
+groups, pipelines, --dispatch-watch) is passed to the real command.
+'''
+import os
+import sys
+import json
+
+from ._base import _CliBase
+from .exceptions import UserException, BadFlagError, CommandNotFound
+
+MANIFEST_VERSION = 2
+
+
+def _jsonable(val):
+    try:
+        json.dumps(val)
+    except (TypeError, ValueError):
+        return str(val)
+    return val
+
+
+def _flag(f) -> dict:
+    return {
+        'name': f.name,
+        'type': getattr(f._type, '__name__', str(f._type)),
+        'default': _jsonable(f._default),
+        'shorthand': f.shorthand,
+        'help': f.help,
+        'hidden': f.hidden,
+    }
+
+
+def _has_call(typ) -> bool:
+    return any('__call__' in vars(k) for k in typ.__mro__ if k is not object)
+
+
+def describe(cli) -> dict:
+    '''Describe a Command or Group, its flags and sub-commands.'''
+    from .dispatch import Group, SubCommand
+    res = {
+        'name': cli.name,
+        'help': cli.helptext(),
+        'flags': [_flag(f) for f in cli.flags.values()],
+    }
+    if not isinstance(cli, Group):
+        res.update({
+            'kind': 'command',
+            'cache': cli._cache is not None,
+            'config': cli._config is not None,
+            'tcp': getattr(cli._fanout, 'mode', None) == 'tcp',
+        })
+        return res
+
+    commands = {}
+    for name, fn in cli.commands.items():
+        if name.startswith('_'):
+            continue
+        if getattr(fn, '_is_plugin', False) or (
+            isinstance(fn, _CliBase) and not isinstance(fn, SubCommand)
+        ):
+            commands[name] = None  # only known once it is imported
+        else:
+            commands[name] = describe(cli._get_command(name))
+    res.update({
+        'kind': 'group',
+        'config': cli._config is not None,
+        'silent': cli.silent,
+        'callable': _has_call(cli.type),
+        'pipeline': cli._pipeline,
+        'hidden': sorted(cli._hidden),
+        'commands': commands,
+    })
+    return res
+
+
+def _modules(cli, names: set):
+    '''Add the names of the modules that define cli to names.'''
+    from .dispatch import Group, SubCommand
+    for f in cli.flags.values():
+        names.add(getattr(f._type, '__module__', None))
+    if not isinstance(cli, Group):
+        names.add(getattr(cli.callback, '__module__', None))
+        return
+    names.update(k.__module__ for k in cli.type.__mro__)
+    for name, fn in cli.commands.items():
+        if name.startswith('_') or getattr(fn, '_is_plugin', False) or (
+            isinstance(fn, _CliBase) and not isinstance(fn, SubCommand)
+        ):
+            continue
+        _modules(cli._get_command(name), names)
+
+
+def _source(path: str) -> dict:
+    st = os.stat(path)
+    return {
+        'path': os.path.abspath(path),
+        'mtime_ns': st.st_mtime_ns,
+        'size': st.st_size,
+    }
+
+
+def manifest(cli, target: str = None) -> dict:
+    '''The manifest of a Command or Group, see write.'''
+    names = set()
+    if target:
+        names.add(target.partition(':')[0].strip())
+    _modules(cli, names)
+    paths = {getattr(sys.modules.get(n), '__file__', None) for n in names}
+    return {
+        'version': MANIFEST_VERSION,
+        'target': target,
+        'sources': [_source(p) for p in sorted(filter(None, paths))],
+        'command': describe(cli),
+    }
+
+
+def _import(target: str):
+    from .plugins import load_object
+    from .dispatch import command
+    obj = load_object(target)
+    return obj if isinstance(obj, _CliBase) else command(obj)
+
+
+def write(target: str, path: str) -> dict:
+    '''Import the CLI named by target ('module:attr') and save its manifest.'''
+    from .plugins import _write
+    res = manifest(_import(target), target)
+    _write(path, res)
+    return res
+
+
+def load(path: str, target: str = None):
+    '''
+    Returns the manifest at path, None if there isn't one or if a module
+    that defines part of the CLI has changed since it was written.
+    '''
+    try:
+        with open(path) as f:
+            res = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if res.get('version') != MANIFEST_VERSION:
+        return None
+    if target is not None and res.get('target') != target:
+        return None
+    for src in res.get('sources', ()):
+        try:
+            st = os.stat(src['path'])
+        except OSError:
+            return None
+        if (st.st_mtime_ns, st.st_size) != (src['mtime_ns'], src['size']):
+            return None
+    return res
+
+
+class _Flags:
+    '''The flags of a command in a manifest, looked up like a FlagSet.'''
+
+    __slots__ = ('flags', 'shorthands')
+
+    def __init__(self, flags: list):
+        self.flags = {f['name']: f for f in flags}
+        self.shorthands = {
+            f['shorthand']: f['name'] for f in flags if f['shorthand']}
+
+    def __contains__(self, key) -> bool:
+        return key in self.flags or key in self.shorthands
+
+    def get(self, key: str):
+        if len(key) == 1 and key in self.shorthands:
+            key = self.shorthands[key]
+        return self.flags.get(key)
+
+
+def _flag_hint(name: str, *commands) -> str:
+    from ._suggest import Index, hint
+    names = {}
+    for cmd in commands:
+        for f in cmd['flags']:
+            if f['hidden']:
+                continue
+            names.setdefault(f['name'], '--' + f['name'].replace('_', '-'))
+            if f['shorthand']:
+                names.setdefault(f['shorthand'], '-' + f['shorthand'])
+    names.setdefault('help', '--help')
+    return hint(Index(names).suggest(name))
+
+
+def _command_hint(group: dict, name: str) -> str:
+    from ._suggest import Index, hint
+    hidden = set(group['hidden'])
+    return hint(Index({
+        n: n for n in group['commands'] if n not in hidden
+    }).suggest(name))
+
+
+# check returns RUN when the command line has to be given to the real CLI
+RUN = None
+
+
+def _take_value(flag: dict, args: list, val):
+    '''Check a flag's value like _CliBase._setflag_from_args.'''
+    if flag['type'] != 'bool':
+        if not val:
+            if not args or args[0].startswith('-'):
+                raise UserException(f'no value given for --{flag["name"]}')
+            args.pop(0)
+    elif val:
+        raise UserException(f'cannot give {flag["name"]!r} flag a value')
+
+
+def _pop_common(cmd: dict, flags: _Flags, argv: list, no_cache: bool) -> list:
+    if no_cache and 'no_cache' not in flags:
+        argv, _ = _CliBase._pop_option(argv, 'no-cache')
+    if cmd['config'] and 'config' not in flags:
+        argv, path = _CliBase._pop_option(argv, 'config', True)
+        if path is True:
+            raise UserException('no value given for --config')
+    return argv
+
+
+def _check_command(cmd: dict, argv: list):
+    if '--help' in argv or 'help' in argv or '-h' in argv:
+        return cmd['help'], None
+    flags = _Flags(cmd['flags'])
+    if cmd['tcp']:
+        argv, worker = _CliBase._pop_option(argv, 'dispatch-worker', True)
+        if worker is not None:
+            return RUN
+        argv, _ = _CliBase._pop_option(argv, 'dispatch-listen', True)
+    args = _pop_common(cmd, flags, argv, cmd['cache'])
+    while args:
+        arg = args.pop(0)
+        if not arg:
+            return RUN
+        if arg[0] != '-':
+            continue
+        arg, val = _CliBase.process_arg(arg)
+        flag = flags.get(arg)
+        if not flag:
+            raise BadFlagError(
+                f'could not find flag {arg!r}' + _flag_hint(arg, cmd))
+        _take_value(flag, args, val)
+    return RUN
+
+
+def _iscommand(group: dict, name: str) -> bool:
+    name = name.replace('-', '_')
+    return not name.startswith('_') and name in group['commands']
+
+
+def _check_group(group: dict, argv: list):
+    commands = group['commands']
+    if argv:
+        # the same help flags as Group._main
+        target = None
+        if 'help' in argv[0]:
+            if argv[1:] and _iscommand(group, argv[1]):
+                target = argv[1]
+            else:
+                return group['help'], None
+        elif argv[0] == '-h':
+            return group['help'], None
+        else:
+            for i, arg in enumerate(argv):
+                if _iscommand(group, arg):
+                    rest = argv[i + 1:]
+                    if '--help' in rest or '-h' in rest or 'help' in rest:
+                        target = arg
+                    break
+        if target is not None:
+            sub = commands[target.replace('-', '_')]
+            return RUN if sub is None else (sub['help'], None)
+
+    flags = _Flags(group['flags'])
+    args = _pop_common(group, flags, argv, False)
+    if group['pipeline'] and group['pipeline'] in args:
+        return RUN
+
+    # the same as Group.parse_args
+    sub = sub_flags = None
+    positional = []
+    while args:
+        raw_arg = args.pop(0)
+        if sub is None and _iscommand(group, raw_arg):
+            sub = commands[raw_arg.replace('-', '_')]
+            if sub is None:
+                return RUN
+            sub_flags = _Flags(sub['flags'])
+            continue
+        if not raw_arg.startswith('-'):
+            positional.append(raw_arg)
+            continue
+        arg, val = _CliBase.process_arg(raw_arg)
+        flag = flags.get(arg)
+        if flag is not None:
+            _take_value(flag, args, val)
+        elif sub is not None:
+            flag = sub_flags.get(arg)
+            if flag is None and not val and arg == 'no_cache' and \
+                    sub.get('cache'):
+                continue  # like Command._takes_no_cache
+            if flag is None:
+                raise BadFlagError(
+                    f'{raw_arg!r} is not a flag for {sub["name"]!r}' +
+                    _flag_hint(arg, sub, group))
+            _take_value(flag, args, val)
+        elif positional:
+            raise CommandNotFound(
+                f'{positional[0]!r} is not a command' +
+                _command_hint(group, positional[0]))
+        else:
+            raise BadFlagError(
+                f'{raw_arg!r} is not a flag' + _flag_hint(arg, group))
+
+    if sub is None and not group['callable']:
+        # the same as Group._run_command without a sub-command
+        hint = _command_hint(group, positional[0]) if positional else ''
+        if hint:
+            raise CommandNotFound(f'{positional[0]!r} is not a command' + hint)
+        return (None if group['silent'] else group['help']), 1
+    return RUN
+
+
+def check(manifest: dict, argv: list):
+    '''
+    Check argv against a manifest. Returns RUN if the CLI has to be run
+    with argv. Otherwise returns the help text to print (or None) and the
+    value the CLI would have returned. Raises the same UserExceptions as
+    the CLI for command lines that are not valid.
+    '''
+    argv = list(argv)
+    argv, watch = _CliBase._pop_option(argv, 'dispatch-watch')
+    if watch is not None:
+        return RUN
+    argv, _ = _CliBase._pop_option(argv, 'dispatch-timeout', True)
+    argv, _ = _CliBase._pop_option(argv, 'dispatch-memprofile')
+    cmd = manifest['command']
+    if cmd['kind'] == 'group':
+        return _check_group(cmd, argv)
+    return _check_command(cmd, argv)
+
+
+def launch(target: str, path: str, argv=sys.argv):
+    '''
+    Run the CLI named by target ('module:attr') with argv, using the
+    manifest at path to answer help and errors without importing it. The
+    manifest is written again if it is missing or out of date.
+    '''
+    if argv is sys.argv:
+        argv = argv[1:]
+    argv = list(argv)
+    man = load(path, target)
+    if man is not None:
+        res = check(man, argv)
+        if res is not RUN:
+            text, ret = res
+            if text is not None:
+                print(text)
+            if isinstance(ret, int) and man['command']['kind'] == 'group':
+                sys.exit(ret)  # like Group.__call__
+            return ret
+
+    cli = _import(target)
+    if man is None:
+        from .plugins import _write
+        _write(path, manifest(cli, target))
+    return cli(argv)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print(f'usage: python -m {__package__}.launcher <module:attr> <manifest>',
+              file=sys.stderr)
+        sys.exit(2)
+    write(sys.argv[1], sys.argv[2])
@@ -0,0 +1,221 @@
+'''
+Memory profiles of commands.
+
+Run any command with --dispatch-memprofile to print how much memory each
+phase of the run allocated, its peak and the lines that allocated the most
+to stderr. Give it a path to write the profile as JSON instead:
+
+    $ mycli deploy --dispatch-memprofile
+    $ mycli deploy --dispatch-memprofile=before.json
+
+The phases are:
+
+    build       creating the Command or Group (only with $DISPATCH_MEMPROFILE)
+    init        creating the instance of a group's class
+    parse       parsing the command line and config files
+    callback    running the command
+
+Commands are built when the module defining them is imported, before the
+command line has been seen, so the build phase is only profiled when
+$DISPATCH_MEMPROFILE is set (to 1 for stderr or a path for JSON). Compare
+two JSON profiles with:
+
+    $ python -m dispatch.memprofile before.json after.json
+'''
+import os
+import sys
+import json
+import tracemalloc
+
+ENV = 'DISPATCH_MEMPROFILE'
+
+
+# the number of profiles in a phase, tracing is stopped once the last of
+# them ends if a profile started it
+_active = 0
+_started = False
+
+
+def _acquire():
+    global _active, _started
+    if _active == 0 and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started = True
+    _active += 1
+
+
+def _release():
+    global _active, _started
+    _active -= 1
+    if _active == 0 and _started:
+        tracemalloc.stop()
+        _started = False
+
+
+class MemProfile:
+    '''
+    Records the memory allocated by each phase of a command with
+    tracemalloc snapshots taken at the phase boundaries.
+    '''
+
+    def __init__(self, name: str = '', top: int = 10):
+        self.name = name
+        self.top = top
+        self.phases: list = []
+        self._current = None
+
+    def begin(self, phase: str):
+        '''End the current phase (if any) and start the next one.'''
+        _acquire()  # before end so tracing goes on between phases
+        self.end()
+        tracemalloc.reset_peak()
+        size, _ = tracemalloc.get_traced_memory()
+        self._current = (phase, size, _snapshot())
+
+    def end(self):
+        if self._current is None:
+            return
+        phase, start, before = self._current
+        self._current = None
+        size, peak = tracemalloc.get_traced_memory()
+        stats = _snapshot().compare_to(before, 'lineno')
+        stats.sort(key=lambda s: s.size_diff, reverse=True)
+        self.phases.append({
+            'phase': phase,
+            'allocated': size - start,
+            'peak': peak,
+            'peak_increase': peak - start,
+            'top': [
+                {
+                    'file': s.traceback[0].filename,
+                    'line': s.traceback[0].lineno,
+                    'size': s.size_diff,
+                    'count': s.count_diff,
+                }
+                for s in stats[:self.top] if s.size_diff > 0
+            ],
+        })
+        _release()
+
+    def finish(self):
+        '''
+        End the last phase. Tracing is stopped once no profile is in a
+        phase, if a profile started it.
+        '''
+        self.end()
+
+    def to_dict(self) -> dict:
+        return {'command': self.name, 'phases': self.phases}
+
+    def report(self, output=True):
+        '''
+        Write the profile as text to stderr (output is True or '1') or as
+        JSON to the path output.
+        '''
+        if output is True or output in ('1', ''):
+            print(format_profile(self.to_dict()), file=sys.stderr)
+        else:
+            with open(output, 'w') as f:
+                json.dump(self.to_dict(), f, indent=2)
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+
+
+def _size(n: int) -> str:
+    sign = '-' if n < 0 else ''
+    n = abs(n)
+    for unit in ('B', 'KiB', 'MiB'):
+        if n < 1024:
+            return f'{sign}{n:.1f} {unit}' if unit != 'B' else f'{sign}{n} B'
+        n /= 1024
+    return f'{sign}{n:.1f} GiB'
+
+
+def format_profile(profile: dict) -> str:
+    lines = [
+        f'memory profile: {profile["command"]}',
+        f'    {"phase":<10}{"allocated":>14}{"peak":>14}',
+    ]
+    for p in profile['phases']:
+        lines.append(
+            f'    {p["phase"]:<10}{_size(p["allocated"]):>14}'
+            f'{_size(p["peak"]):>14}')
+    for p in profile['phases']:
+        if not p['top']:
+            continue
+        lines.append(f'top allocations ({p["phase"]}):')
+        for t in p['top']:
+            lines.append(
+                f'    {_size(t["size"]):>12}  {t["file"]}:{t["line"]}')
+    return '\n'.join(lines)
+
+
+def _load(profile) -> dict:
+    if isinstance(profile, dict):
+        return profile
+    with open(profile) as f:
+        return json.load(f)
+
+
+def compare(old, new, top: int = 10) -> str:
+    '''
+    Compare two profiles (dicts or paths to JSON files) phase by phase and
+    list the lines whose allocations changed the most.
+    '''
+    old, new = _load(old), _load(new)
+    before = {p['phase']: p for p in old['phases']}
+    after = {p['phase']: p for p in new['phases']}
+    lines = [
+        f'memory profile: {old["command"]} -> {new["command"]}',
+        f'    {"phase":<10}{"allocated":>14}{"change":>14}'
+        f'{"peak":>14}{"change":>14}',
+    ]
+    for name in list(before) + [n for n in after if n not in before]:
+        a = before.get(name, {'allocated': 0, 'peak': 0})
+        b = after.get(name, {'allocated': 0, 'peak': 0})
+        lines.append(
+            f'    {name:<10}{_size(b["allocated"]):>14}'
+            f'{_size(b["allocated"] - a["allocated"]):>14}'
+            f'{_size(b["peak"]):>14}{_size(b["peak"] - a["peak"]):>14}')
+
+    sites: dict = {}
+    for sign, prof in ((-1, old), (1, new)):
+        for p in prof['phases']:
+            for t in p['top']:
+                key = (p['phase'], t['file'], t['line'])
+                sites[key] = sites.get(key, 0) + sign * t['size']
+    changed = sorted(sites.items(), key=lambda kv: abs(kv[1]), reverse=True)
+    changed = [kv for kv in changed[:top] if kv[1]]
+    if changed:
+        lines.append('largest changes:')
+        for (phase, file, line), diff in changed:
+            lines.append(f'    {_size(diff):>12}  {phase:<10}{file}:{line}')
+    return '\n'.join(lines)
+
+
+def _from_env(name: str):
+    '''A profile for the build phase of a command if $DISPATCH_MEMPROFILE is set.'''
+    if not os.environ.get(ENV):
+        return None
+    prof = MemProfile(name)
+    prof.begin('build')
+    return prof
+
+
+def main(argv: list = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print('usage: python -m dispatch.memprofile <old.json> <new.json>',
+              file=sys.stderr)
+        return 2
+    print(compare(*argv))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
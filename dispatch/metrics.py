@@ -0,0 +1,320 @@
+'''
+Invocation counters and latency histograms for commands.
+
+Set $DISPATCH_METRICS_DIR (or give a command metrics=<directory>) to the
+textfile directory of the Prometheus node exporter and every run of the
+command is counted in <directory>/dispatch_<name>.prom:
+
+    dispatch_invocations_total{command="mycli deploy"} 1042
+    dispatch_errors_total{command="mycli deploy",exception="BadFlagError"} 3
+    dispatch_phase_seconds_bucket{command="mycli deploy",phase="parse",le="0.001"} 1040
+
+The phases are the same as the ones in dispatch.memprofile: init, parse
+and callback. Short lived processes add their counts to the file when
+they exit, the file is locked while it is updated and replaced atomically
+so the exporter never reads half of it. Long running processes write the
+counts of the runs that have finished when they get SIGUSR1 (they are
+printed to stderr if there is no directory). The signal handler only wakes
+a thread that writes the counts of every registry.
+'''
+import os
+import sys
+import time
+import threading
+from bisect import bisect_left
+
+ENV = 'DISPATCH_METRICS_DIR'
+
+# upper bounds of the latency buckets in seconds
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+FAMILIES = {
+    'dispatch_invocations_total': (
+        'counter', 'Number of times a command was run.'),
+    'dispatch_errors_total': (
+        'counter', 'Number of runs that raised an exception, by type.'),
+    'dispatch_phase_seconds': (
+        'histogram', 'Time spent in each phase of a command.'),
+}
+
+# {path: Registry} so commands writing to the same file share counts
+_registries: dict = {}
+# the registries that have counted a run, flushed at exit and on SIGUSR1
+_installed: list = []
+_flush_requested = threading.Event()
+_signal_installed = False
+
+
+class Histogram:
+
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    '''
+    Registry holds the counters and histograms of one or more commands and
+    writes them to path (if it is not None) in the Prometheus text format.
+    '''
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.counters: dict = {}  # {(name, labels): count}
+        self.histograms: dict = {}  # {(name, labels): Histogram}
+        self._installed = False
+        # taken by runs that finish while the flush thread is writing
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path!r})'
+
+    def inc(self, name: str, labels: tuple, n: int = 1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, name: str, labels: tuple, value: float):
+        key = (name, labels)
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = Histogram()
+        hist.observe(value)
+
+    def observer(self, command: str) -> '_Observer':
+        if not self._installed:
+            self._installed = True
+            _install(self)
+        return _Observer(self, command)
+
+    def samples(self) -> dict:
+        '''The counts as {sample: value}, sample is 'name{labels}'.'''
+        res = {}
+        for (name, labels), n in self.counters.items():
+            res[_sample(name, labels)] = n
+        for (name, labels), hist in self.histograms.items():
+            total = 0
+            for le, n in zip(BUCKETS + ('+Inf',), hist.counts):
+                total += n
+                le = le if isinstance(le, str) else f'{le:g}'
+                res[_sample(name + '_bucket', labels + (('le', le),))] = total
+            res[_sample(name + '_sum', labels)] = hist.sum
+            res[_sample(name + '_count', labels)] = total
+        return res
+
+    def render(self, samples: dict = None) -> str:
+        samples = self.samples() if samples is None else samples
+        lines = []
+        for family, (kind, doc) in FAMILIES.items():
+            names = [s for s in samples if _family(s) == family]
+            if not names:
+                continue
+            lines.append(f'# HELP {family} {doc}')
+            lines.append(f'# TYPE {family} {kind}')
+            lines.extend(
+                f'{s} {_num(samples[s])}' for s in sorted(names, key=_order))
+        return ''.join(line + '\n' for line in lines)
+
+    def flush(self):
+        '''
+        Add the counts to the file and start counting from zero, or print
+        them to stderr if there is no file.
+        '''
+        with self._lock:
+            samples = self.samples()
+            self.counters, self.histograms = {}, {}
+        if not samples:
+            return
+        if self.path is None:
+            sys.stderr.write(self.render(samples))
+        else:
+            _merge_into(self.path, samples, self.render)
+
+
+def _install(reg: Registry):
+    '''Flush reg at exit and on SIGUSR1.'''
+    global _signal_installed
+    if not _installed:
+        import atexit
+        atexit.register(_flush_all)
+    _installed.append(reg)
+
+    import signal
+    if (
+        not _signal_installed and
+        hasattr(signal, 'SIGUSR1') and
+        threading.current_thread() is threading.main_thread() and
+        signal.getsignal(signal.SIGUSR1) == signal.SIG_DFL
+    ):
+        _signal_installed = True
+        threading.Thread(
+            target=_flusher, name='dispatch-metrics', daemon=True).start()
+        signal.signal(signal.SIGUSR1, _on_usr1)
+
+
+def _on_usr1(signum, frame):
+    # no I/O or locks here, the signal might have interrupted a flush
+    _flush_requested.set()
+
+
+def _flusher():
+    while True:
+        _flush_requested.wait()
+        _flush_requested.clear()
+        _flush_all()
+
+
+def _flush_all():
+    for reg in list(_installed):
+        try:
+            reg.flush()
+        except Exception as e:
+            print(f'dispatch: could not write metrics to {reg.path}: {e}',
+                  file=sys.stderr)
+
+
+class _Observer:
+    '''
+    Times the phases of one run of a command. They are recorded when the
+    run finishes, once the sub-command it ran is known.
+    '''
+
+    __slots__ = ('registry', 'command', 'subcommands', 'phase', 'start',
+                 'times')
+
+    def __init__(self, registry: Registry, command: str):
+        self.registry = registry
+        self.command = command
+        self.subcommands: list = []  # more than one for a pipeline
+        self.phase = None
+        self.start = 0.0
+        self.times: list = []
+
+    def begin(self, phase: str):
+        now = time.perf_counter()
+        if self.phase is not None:
+            self.times.append((self.phase, now - self.start))
+        self.phase = phase
+        self.start = now
+
+    def finish(self, exc: BaseException = None):
+        if self.phase is not None:
+            self.times.append((self.phase, time.perf_counter() - self.start))
+        reg = self.registry
+        command = self.command
+        if self.subcommands:
+            command += ' ' + ' + '.join(self.subcommands)
+        labels = (('command', command),)
+        with reg._lock:
+            for phase, secs in self.times:
+                reg.observe(
+                    'dispatch_phase_seconds', labels + (('phase', phase),), secs)
+            reg.inc('dispatch_invocations_total', labels)
+            if exc is not None and not isinstance(exc, SystemExit):
+                reg.inc(
+                    'dispatch_errors_total',
+                    labels + (('exception', exc.__class__.__name__),))
+
+
+def _num(val) -> str:
+    if val == int(val):
+        return str(int(val))
+    return repr(float(val))
+
+
+def _escape(val: str) -> str:
+    return val.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _sample(name: str, labels: tuple) -> str:
+    if not labels:
+        return name
+    inner = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return f'{name}{{{inner}}}'
+
+
+def _order(sample: str) -> tuple:
+    # buckets go in increasing order of le, which is always the last label
+    head, sep, le = sample.partition(',le="')
+    if not sep:
+        return (sample, 0.0)
+    return (head, float(le.rstrip('"}')))
+
+
+def _family(sample: str) -> str:
+    name = sample.partition('{')[0]
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in FAMILIES:
+            return name[:-len(suffix)]
+    return name
+
+
+def parse(text: str) -> dict:
+    '''Read the samples of a file written by a Registry.'''
+    res = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        sample, _, val = line.rpartition(' ')
+        try:
+            res[sample] = float(val)
+        except ValueError:
+            continue
+    return res
+
+
+def _merge_into(path: str, samples: dict, render):
+    '''
+    Add samples to the ones in path. Every sample is a counter or part of a
+    histogram so merging is adding.
+    '''
+    import tempfile
+    try:
+        import fcntl
+    except ImportError:  # windows
+        fcntl = None
+    d = os.path.dirname(path) or '.'
+    os.makedirs(d, exist_ok=True)
+    with open(path + '.lock', 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path) as f:
+                merged = parse(f.read())
+        except FileNotFoundError:
+            merged = {}
+        for sample, val in samples.items():
+            merged[sample] = merged.get(sample, 0) + val
+        # the exporter ignores files that don't end in .prom
+        fd, tmp = tempfile.mkstemp(dir=d, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(render(merged))
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def _new_registry(setting, name: str):
+    if isinstance(setting, Registry):
+        return setting
+    if setting is True or setting is None:
+        directory = os.environ.get(ENV) or None
+    else:
+        directory = os.fspath(setting)
+    path = None
+    if directory is not None:
+        path = os.path.join(directory, f'dispatch_{name}.prom')
+    reg = _registries.get(path)
+    if reg is None:
+        reg = _registries[path] = Registry(path)
+    return reg
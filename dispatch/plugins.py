@@ -0,0 +1,190 @@
+'''
+Sub-commands for a Group that are installed by other packages.
+
+A package adds a sub-command by declaring an entry point in the group's
+entry point group:
+
+    [options.entry_points]
+    mycli.commands =
+        deploy = mycli_deploy.cli:deploy
+
+Scanning the installed distributions for entry points and importing every
+plugin to read its help text is slow, so the result is stored in a
+manifest that is only rebuilt when the set of installed distributions
+changes. With an up to date manifest, listing the commands imports none of
+the plugins and running one only imports that plugin's module.
+'''
+import os
+import sys
+import json
+import hashlib
+import tempfile
+
+from .cache import default_dir
+
+MANIFEST_VERSION = 1
+
+
+def fingerprint(path: list = None) -> str:
+    '''
+    Returns a hash of the names (which include the versions) of every
+    distribution installed on the path. Only directories are listed, no
+    metadata files are read.
+    '''
+    h = hashlib.sha1()
+    for entry in path if path is not None else sys.path:
+        h.update(entry.encode())
+        try:
+            with os.scandir(entry or '.') as it:
+                names = sorted(
+                    e.name for e in it
+                    if e.name.endswith(('.dist-info', '.egg-info'))
+                )
+        except OSError:
+            continue
+        for name in names:
+            h.update(name.encode())
+    return h.hexdigest()
+
+
+def manifest_path(group: str, cache_dir: str = None) -> str:
+    return os.path.join(cache_dir or default_dir('plugins'), f'{group}.json')
+
+
+def load_manifest(group: str, cache_dir: str = None) -> dict:
+    '''
+    Returns the manifest for an entry point group, rebuilding it if the
+    installed distributions have changed since it was written.
+    '''
+    fp = fingerprint()
+    path = manifest_path(group, cache_dir)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+        if (
+            manifest.get('version') == MANIFEST_VERSION and
+            manifest.get('fingerprint') == fp
+        ):
+            return manifest
+    except (OSError, ValueError):
+        pass
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'group': group,
+        'fingerprint': fp,
+        'plugins': scan(group),
+    }
+    _write(path, manifest)
+    return manifest
+
+
+def _write(path: str, manifest: dict):
+    d = os.path.dirname(path)
+    try:
+        os.makedirs(d, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=d, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass  # not being able to cache the manifest is not an error
+
+
+def _entry_points(group: str):
+    from importlib import metadata
+    eps = metadata.entry_points()
+    if hasattr(eps, 'select'):
+        return eps.select(group=group)
+    return eps.get(group, [])
+
+
+def scan(group: str) -> dict:
+    '''
+    Import every plugin in the entry point group and describe it.
+    '''
+    plugins = {}
+    for ep in _entry_points(group):
+        dist = getattr(ep, 'dist', None)
+        entry = {
+            'name': ep.name,
+            'value': ep.value,
+            'dist': getattr(dist, 'name', None),
+            'dist_version': getattr(dist, 'version', None),
+            'help': '',
+            'flags': [],
+        }
+        try:
+            entry.update(_describe(load_object(ep.value)))
+        except Exception as e:
+            entry['error'] = f'{e.__class__.__name__}: {e}'
+        plugins[ep.name.replace('-', '_')] = entry
+    return plugins
+
+
+def _describe(obj) -> dict:
+    from .dispatch import Command
+    cmd = obj if isinstance(obj, Command) else Command(obj)
+    return {
+        'help': cmd._help.split('\n')[0].strip(),
+        'flags': [
+            {
+                'name': f.name,
+                'shorthand': f.shorthand,
+                'help': f.help,
+                'type': getattr(f._type, '__name__', str(f._type)),
+            }
+            for f in cmd.flags.values()
+        ],
+    }
+
+
+def load_object(value: str):
+    '''Import the object named by an entry point value ('module:attr').'''
+    from importlib import import_module
+    modname, _, attrs = value.partition(':')
+    obj = import_module(modname.strip())
+    attrs = attrs.split('[')[0].strip()
+    for attr in attrs.split('.') if attrs else ():
+        obj = getattr(obj, attr)
+    return obj
+
+
+class _Plugin:
+    '''
+    A placeholder in Group.commands for a sub-command that has not been
+    imported yet.
+    '''
+
+    __slots__ = ('entry', '_cmd')
+    _is_plugin = True
+
+    def __init__(self, entry: dict):
+        self.entry = entry
+        self._cmd = None
+
+    def command(self, group):
+        from .dispatch import Command, SubCommand
+        if self._cmd is None:
+            obj = load_object(self.entry['value'])
+            if isinstance(obj, Command):
+                cmd = obj
+            else:
+                cmd = SubCommand(obj, __command_group__=group)
+            cmd.name = self.entry['name']
+            self._cmd = cmd
+        cmd = self._cmd
+        if isinstance(cmd, SubCommand):
+            cmd.group = group
+            if cmd._meta.needs_self:
+                cmd._meta.set_instance(group.inst)
+        return cmd
+
+
+def _load_plugins(group: str, cache_dir: str = None) -> dict:
+    manifest = load_manifest(group, cache_dir)
+    return {
+        name: _Plugin(entry)
+        for name, entry in manifest['plugins'].items()
+        if 'error' not in entry
+    }
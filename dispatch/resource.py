@@ -0,0 +1,98 @@
+'''
+Lazily initialized attributes for command groups.
+'''
+import _thread  # threading is not imported by the cli
+
+_CLEANUP = '__dispatch_cleanup__'
+
+
+class resource:
+    '''
+    resource is a decorator for group methods that create expensive shared
+    objects like connection pools. The method is only called the first time
+    the attribute is used and the result is stored on the instance.
+
+    If the method is a generator, the value it yields is used and the rest
+    of the generator is run when the group closes its resources. If the
+    command failed, its exception is raised at the yield.
+
+        @command
+        class cli:
+            @resource
+            def db(self):
+                pool = connect()
+                try:
+                    yield pool
+                finally:
+                    pool.close()
+    '''
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.name = fn.__name__
+        self.__doc__ = fn.__doc__
+        # steps of a group can run at the same time in threads
+        self._lock = _thread.allocate_lock()
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, inst, owner):
+        if inst is None:
+            return self
+        with self._lock:
+            if self.name in inst.__dict__:
+                return inst.__dict__[self.name]  # made by another thread
+            val = self.fn(inst)
+            if hasattr(val, '__next__') and hasattr(val, 'throw'):
+                gen = val
+                val = next(gen)
+                inst.__dict__.setdefault(_CLEANUP, []).append((self.name, gen))
+            else:
+                inst.__dict__.setdefault(_CLEANUP, []).append((self.name, None))
+            # the instance dict takes precedence over this (non-data)
+            # descriptor so the method is not called again.
+            inst.__dict__[self.name] = val
+            return val
+
+
+def initialized(inst) -> list:
+    '''Returns the names of the resources that have been created.'''
+    return [name for name, _ in getattr(inst, '__dict__', {}).get(_CLEANUP, ())]
+
+
+def close_resources(inst, exc: BaseException = None):
+    '''
+    Tear down every resource created on inst in the reverse order they were
+    created. All resources are closed even if one of them fails, the first
+    error is raised once they are all closed. If the run failed with exc it
+    is raised in the generators at their yield, like contextlib does, so a
+    resource can tell that it should roll back.
+    '''
+    if inst is None or not hasattr(inst, '__dict__'):
+        return
+    created = inst.__dict__.pop(_CLEANUP, [])
+    err = None
+    while created:
+        name, gen = created.pop()
+        inst.__dict__.pop(name, None)
+        if gen is None:
+            continue
+        try:
+            if exc is None:
+                next(gen)
+            else:
+                gen.throw(exc)
+        except StopIteration:
+            pass
+        except Exception as e:
+            # re-raising exc is not an error of the resource
+            if e is not exc:
+                err = err or e
+        except BaseException as e:
+            if e is not exc:
+                raise
+        else:
+            gen.close()
+    if err is not None:
+        raise err
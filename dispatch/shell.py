@@ -0,0 +1,198 @@
+'''
+An interactive shell for a Group.
+
+Every line is run as a sub-command against the same instance of the
+group's class, so anything expensive done by __init__ or by a resource is
+only done once per session:
+
+    >>> mycli.shell(['--verbose'])
+    mycli> deploy --region eu
+    mycli> status
+    mycli> set --dry-run
+    mycli> exit
+
+Group flags given when the shell starts (or added with 'set') are used for
+every line, group flags given on a line only apply to that line.
+'''
+import os
+import sys
+import shlex
+
+from .exceptions import UserException
+
+BUILTINS = ('set', 'help', 'exit', 'quit')
+
+
+class Shell:
+
+    def __init__(self, group, *, prompt: str = None, history=True):
+        '''
+        Args:
+            group: the Group that lines are run against.
+
+        Keyword Args:
+            prompt (str): defaults to '<group name>> '
+            history: True to keep the readline history in
+                ~/.<group name>_history, a path, or False for no history
+                file.
+        '''
+        self.group = group
+        self.prompt = prompt if prompt is not None else f'{group.name}> '
+        if history is True:
+            history = os.path.join(
+                os.path.expanduser('~'), f'.{group.name}_history')
+        self.history = history or None
+        self.session_flags: list = []
+        self._saved: dict = {}
+
+    def run(self, argv: list = (), lines=None) -> int:
+        '''
+        Start the session with the group flags in argv and run lines until
+        'exit' or the end of input. lines is any iterable of strings, by
+        default they are read from the prompt.
+        '''
+        group = self.group
+        reuse = group.reuse
+        readline = None
+        try:
+            group.reuse = True  # one instance for the whole session
+            self._set(list(argv))
+            self._start()
+            if lines is None:
+                readline = self._readline()
+            for line in lines if lines is not None else self._prompt():
+                if not self.onecmd(line):
+                    break
+        finally:
+            if readline is not None and self.history:
+                try:
+                    readline.write_history_file(self.history)
+                except OSError:
+                    pass
+            group.reuse = reuse
+            if not reuse:
+                group.close()
+                group.inst = None
+        return 0
+
+    def onecmd(self, line: str) -> bool:
+        '''Run one line, returns False when the session should end.'''
+        try:
+            argv = shlex.split(line)
+        except ValueError as e:
+            print('Error:', e, file=sys.stderr)
+            return True
+        if not argv:
+            return True
+
+        name = argv[0]
+        if name in ('exit', 'quit'):
+            return False
+        try:
+            if name == 'set':
+                if argv[1:]:
+                    self._set(self.session_flags + argv[1:])
+                else:
+                    print(shlex.join(self.session_flags))
+                return True
+            self._restore()
+            if name == 'help':
+                # the session flags would hide 'help' from Group._main
+                self.group._main(argv)
+                return True
+            ret = self.group._main(self.session_flags + argv)
+            if isinstance(ret, int) and ret:
+                print(f'exit code {ret}', file=sys.stderr)
+        except UserException as e:
+            print('Error:', e, file=sys.stderr)
+        except KeyboardInterrupt:
+            print()  # stop the command, not the session
+        except Exception:
+            import traceback
+            traceback.print_exc()
+        return True
+
+    def _set(self, argv: list):
+        '''Parse and keep the session's group flags.'''
+        cmd, flags = self.group.parse_args(argv)
+        if cmd is not None or self.group.args:
+            raise UserException("only group flags can be given to 'set'")
+        self.session_flags = argv
+
+    def _start(self):
+        '''
+        Create the instance and remember the flag attributes set by
+        __init__ so that flags given on one line don't stick around.
+        '''
+        group = self.group
+        group._reset_values()
+        inst = group._instance()
+        self._saved = {
+            name: inst.__dict__[name] for name in group.flags
+            if name in inst.__dict__
+        }
+
+    def _restore(self):
+        inst = self.group.inst
+        for name in self.group.flags:
+            if name in self._saved:
+                object.__setattr__(inst, name, self._saved[name])
+            else:
+                inst.__dict__.pop(name, None)
+
+    def _prompt(self):
+        while True:
+            try:
+                yield input(self.prompt)
+            except EOFError:
+                print()
+                return
+            except KeyboardInterrupt:
+                print()  # clear the line like other shells
+
+    def _readline(self):
+        try:
+            import readline
+        except ImportError:  # not available on windows
+            return None
+        if self.history:
+            try:
+                readline.read_history_file(self.history)
+            except OSError:
+                pass
+        readline.set_completer(self.complete)
+        readline.set_completer_delims(' \t\n')
+        readline.parse_and_bind('tab: complete')
+        return readline
+
+    def complete(self, text: str, state: int):
+        '''readline completer.'''
+        import readline
+        words = readline.get_line_buffer()[:readline.get_endidx()].split()
+        if text:
+            words = words[:-1]
+        opts = self.completions(words, text)
+        return opts[state] if state < len(opts) else None
+
+    def completions(self, words: list, text: str) -> list:
+        '''
+        Complete text given the words before it on the line: a command name
+        for the first word and then the flags of the group and command.
+        '''
+        group = self.group
+        cmd = next((w for w in words if group.iscommand(w)), None)
+        if cmd is None and not text.startswith('-'):
+            names = [
+                n.replace('_', '-') for n in group.commands
+                if n not in group._hidden
+            ]
+            opts = names + list(BUILTINS)
+        else:
+            flags = list(group.flags.values())
+            if cmd is not None:
+                flags.extend(group._get_command(cmd).flags.values())
+            opts = [
+                '--' + f.name.replace('_', '-') for f in flags
+                if not f.hidden
+            ]
+        return sorted(o for o in set(opts) if o.startswith(text))
@@ -1,5 +1,44 @@
 import os
 
+
+class lazy:
+    '''
+    A flag default that is only computed when the flag is not given:
+
+        def status(repo: Path = lazy(find_repo_root)): ...
+
+    The help text shows the label (the factory's name by default) instead
+    of the value. As a group class attribute it is computed the first time
+    the attribute is read.
+    '''
+
+    __slots__ = ('factory', 'label', 'name')
+
+    def __init__(self, factory, label: str = None):
+        if not callable(factory):
+            raise TypeError('lazy needs a callable')
+        self.factory = factory
+        self.label = label or f'{getattr(factory, "__name__", "lazy")}()'
+        self.name = None
+
+    def __call__(self):
+        return self.factory()
+
+    def __repr__(self):
+        return self.label
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, inst, owner):
+        if inst is None:
+            return self
+        val = self.factory()
+        # the instance's dict hides the descriptor so this is only done once
+        inst.__dict__[self.name] = val
+        return val
+
+
 class Env:
     def __init__(self, name):
         if name.startswith('$'):
@@ -24,6 +63,47 @@ class Env:
     def _get(self) -> str:
         return os.getenv(str(self.name)) or self.name
 
+class File:
+    '''
+    A flag type for input files. The flag's value is a buffered binary
+    reader for the file ('-' is stdin) which is decompressed as it is read
+    if the file is gzip, bzip2 or xz compressed. Use File.options to read
+    text, change the buffer size or decompress in a background thread:
+
+        def count(data: File.options(threaded=True)): ...
+    '''
+
+    text = False
+    encoding = None
+    threaded = False
+    buffer_size = 1 << 20
+
+    def __new__(cls, path):
+        if hasattr(path, 'read'):
+            return path  # already open
+        from ._compress import open_input
+        return open_input(
+            path, text=cls.text, encoding=cls.encoding,
+            buffer_size=cls.buffer_size, threaded=cls.threaded,
+        )
+
+    @classmethod
+    def options(cls, **opts) -> type:
+        '''
+        Returns a File type with different options (text, encoding,
+        threaded or buffer_size).
+        '''
+        for k in opts:
+            if not hasattr(File, k) or k == 'options':
+                raise TypeError(f'{k!r} is not a File option')
+        return type(cls.__name__, (cls,), opts)
+
+
+class TextFile(File):
+    '''A File that is read as text.'''
+    text = True
+
+
 # TODO: when used as an annotaion, should accept json input
 # and convert to dict
 Json = None
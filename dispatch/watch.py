@@ -0,0 +1,302 @@
+'''
+Re-running a command when its input files change.
+
+    $ mycli build --src src/ config.toml --dispatch-watch
+    $ mycli build --dispatch-watch='templates/**/*.html,*.toml'
+
+The command is run and then run again, in the same process, every time
+one of the files it was given changes. Every argument (or --flag=value)
+that names an existing file or directory is watched, plus the files
+matched by the globs given to --dispatch-watch or to the command's watch
+option. A run that is still going when something changes is cancelled
+and started over.
+
+On Linux changes are found with inotify, anywhere else (or if inotify is
+not available) the files are polled. Changes are debounced, editors that
+save a file in several steps only cause one run.
+'''
+import os
+import sys
+import glob
+import time
+import threading
+from fnmatch import fnmatch
+
+# events that mean a file was written, replaced or removed
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+        IN_CREATE | IN_DELETE)
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+class _Targets:
+    '''The directories to watch and the names in them that matter.'''
+
+    def __init__(self, paths, globs=()):
+        self.globs = [os.path.abspath(g) for g in globs]
+        self.dirs: dict = {}  # {dir: set of names, or None for any name}
+        for p in paths:
+            self._add(p)
+        for g in self.globs:
+            for match in glob.glob(g, recursive=True):
+                self._add(match)
+            base = _glob_base(g)
+            if os.path.isdir(base):
+                self.dirs.setdefault(base, set())  # for new matches
+
+    def _add(self, path: str):
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            self.dirs[path] = None
+            return
+        d, name = os.path.split(path)
+        names = self.dirs.setdefault(d, set())
+        if names is not None:
+            names.add(name)
+
+    def __len__(self):
+        return len(self.dirs)
+
+    def matches(self, d: str, name: str) -> bool:
+        names = self.dirs.get(d, ())
+        if names is None or name in names:
+            return True
+        full = os.path.join(d, name)
+        return any(fnmatch(full, g) for g in self.globs)
+
+    def files(self) -> list:
+        res = []
+        for d, names in self.dirs.items():
+            if names is None or self.globs:
+                try:
+                    listed = os.listdir(d)
+                except OSError:
+                    listed = []
+                res.extend(
+                    os.path.join(d, n) for n in listed if self.matches(d, n))
+            if names:
+                res.extend(os.path.join(d, n) for n in names)
+        return res
+
+
+def _glob_base(pattern: str) -> str:
+    '''The directory part of a glob pattern before the first wildcard.'''
+    parts = []
+    for part in pattern.split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    else:
+        parts = parts[:-1]
+    return os.sep.join(parts) or os.sep
+
+
+class _Poller:
+    '''Finds changes by comparing the mtime and size of every file.'''
+
+    def __init__(self, targets: _Targets, interval: float = 0.5):
+        self.targets = targets
+        self.interval = interval
+        self._stamps = self._scan()
+
+    def _scan(self) -> dict:
+        stamps = {}
+        for path in self.targets.files():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stamps[path] = (st.st_mtime_ns, st.st_size)
+        return stamps
+
+    def wait(self, timeout: float) -> set:
+        '''Returns the paths that changed within timeout seconds.'''
+        end = time.monotonic() + timeout
+        while True:
+            stamps = self._scan()
+            changed = {
+                p for p in stamps.keys() | self._stamps.keys()
+                if stamps.get(p) != self._stamps.get(p)
+            }
+            self._stamps = stamps
+            left = end - time.monotonic()
+            if changed or left <= 0:
+                return changed
+            time.sleep(min(self.interval, left))
+
+    def close(self):
+        pass
+
+
+class _Inotify:
+    '''Finds changes with inotify, watching the directory of every file.'''
+
+    def __init__(self, targets: _Targets):
+        import ctypes
+        import ctypes.util
+        self.targets = targets
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._wds: dict = {}
+        for d in targets.dirs:
+            wd = libc.inotify_add_watch(self._fd, os.fsencode(d), MASK)
+            if wd >= 0:
+                self._wds[wd] = d
+
+    def wait(self, timeout: float) -> set:
+        import select
+        import struct
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            buf = os.read(self._fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        off = 0
+        while off + 16 <= len(buf):
+            wd, _, _, size = struct.unpack_from('iIII', buf, off)
+            name = os.fsdecode(buf[off + 16:off + 16 + size].rstrip(b'\0'))
+            off += 16 + size
+            d = self._wds.get(wd)
+            if d is not None and self.targets.matches(d, name):
+                changed.add(os.path.join(d, name))
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+def _backend(targets: _Targets, poll: bool = False):
+    if not poll and sys.platform.startswith('linux'):
+        try:
+            return _Inotify(targets)
+        except (OSError, AttributeError, TypeError):
+            pass  # no libc or inotify, polling still works
+    return _Poller(targets)
+
+
+def _paths(argv: list) -> list:
+    '''The arguments and flag values that are existing files.'''
+    res = []
+    for arg in argv:
+        if arg.startswith('-'):
+            arg = arg.partition('=')[2]
+        if arg and arg != '-' and os.path.exists(arg):
+            res.append(arg)
+    return res
+
+
+class Watch:
+    '''
+    Watch runs a command with argv and again whenever one of its files
+    changes, until it is stopped with ctrl-c.
+    '''
+
+    def __init__(self, run, argv: list, globs=(), *, debounce: float = 0.2,
+                 poll: bool = False):
+        self.run = run
+        self.argv = list(argv)
+        self.globs = list(globs)
+        self.debounce = debounce
+        self.poll = poll
+        self.runs = 0
+        self._changed = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._running = False
+        self._cancelled = False
+        self._ready = threading.Event()  # set once the files are watched
+
+    def targets(self) -> _Targets:
+        return _Targets(_paths(self.argv), self.globs)
+
+    def loop(self, runs: int = None):
+        '''Run the command until ctrl-c, or runs times.'''
+        thread = threading.Thread(target=self._watch, daemon=True)
+        thread.start()
+        self._ready.wait()
+        try:
+            while runs is None or self.runs < runs:
+                try:
+                    self._once()
+                    if runs is not None and self.runs >= runs:
+                        break
+                    self._changed.wait()
+                except KeyboardInterrupt:
+                    if not self._take_cancel():
+                        raise
+                    print('dispatch: files changed, starting over',
+                          file=sys.stderr)
+        finally:
+            self._stop.set()
+            thread.join()
+
+    def _once(self):
+        with self._lock:
+            self._changed.clear()
+            self._running = True
+        self.runs += 1
+        try:
+            self.run(list(self.argv))
+        except KeyboardInterrupt:
+            raise
+        except SystemExit as e:
+            if e.code:
+                print(f'exit code {e.code}', file=sys.stderr)
+        except Exception as e:
+            from .exceptions import UserException
+            if isinstance(e, UserException):
+                print('Error:', e, file=sys.stderr)
+            else:
+                import traceback
+                traceback.print_exc()
+        finally:
+            with self._lock:
+                self._running = False
+            sys.stdout.flush()
+
+    def _take_cancel(self) -> bool:
+        with self._lock:
+            cancelled, self._cancelled = self._cancelled, False
+        return cancelled
+
+    def _watch(self):
+        backend = _backend(self.targets(), self.poll)
+        self._ready.set()
+        try:
+            while not self._stop.is_set():
+                if not backend.wait(0.1):
+                    continue
+                # wait for things to settle down
+                while backend.wait(self.debounce):
+                    pass
+                backend.close()
+                backend = _backend(self.targets(), self.poll)  # new glob matches
+                with self._lock:
+                    self._changed.set()
+                    if self._running:
+                        self._cancelled = True
+                        _interrupt_main()
+        finally:
+            backend.close()
+
+
+def _interrupt_main():
+    '''Stop whatever the main thread is doing with a KeyboardInterrupt.'''
+    import signal
+    if hasattr(signal, 'pthread_kill'):
+        # a real signal also wakes up sleeps and blocking reads
+        signal.pthread_kill(threading.main_thread().ident, signal.SIGINT)
+    else:
+        import _thread
+        _thread.interrupt_main()
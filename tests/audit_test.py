@@ -0,0 +1,115 @@
+import pytest
+
+import os
+import sys
+import json
+import subprocess
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command, UserException
+from dispatch.audit import AuditLog
+
+ROOT = dirname(dirname(os.path.abspath(__file__)))
+
+
+def read(path) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_group(tmp_path):
+    log = AuditLog(tmp_path / 'audit.jsonl', flush_interval=0.01)
+
+    @command(audit=log, hidden={'token'})
+    class cli:
+        token: str = ''
+        verbose: bool = False
+
+        def deploy(self, region: str = 'eu', force: bool = False):
+            return 'deployed'
+
+        def fail(self):
+            raise UserException('nope')
+
+    cli.invoke(['deploy', '--region', 'us', '--token', 's3cret', '--force'])
+    cli.invoke(['--token=s3cret', 'fail'])
+    cli.invoke(['deploy', '--not-a-flag'])
+    log.flush()
+
+    first, second, third = read(log.path)
+    assert first['command'] == 'cli deploy'
+    assert first['argv'] == [
+        'deploy', '--region', 'us', '--token', '***', '--force']
+    assert first['flags'] == {'region': 'us', 'token': '***', 'force': True}
+    assert first['exit_code'] == 0
+    assert first['error'] is None
+    assert first['pid'] == os.getpid()
+    assert first['duration'] >= 0
+
+    assert second['argv'] == ['--token=***', 'fail']
+    assert second['exit_code'] == 1
+    assert second['error'] == 'UserException'
+    assert third['error'] == 'BadFlagError'
+    assert 's3cret' not in open(log.path).read()
+
+def test_failed_before_subcommand(tmp_path):
+    log = AuditLog(tmp_path / 'audit.jsonl', flush_interval=0.01)
+
+    @command(audit=log)
+    class cli:
+        def deploy(self, api_key: str = ''):
+            return 'deployed'
+
+    cli._get_command('deploy').flags['api_key'].hidden = True
+    # the flag is given before the sub-command so parsing fails first
+    cli.invoke(['--api-key', 's3cret', 'deploy'])
+    cli.invoke(['--api-key=s3cret', 'deploy'])
+    cli.invoke(['--unknown=s3cret', 'deploy'])
+    log.flush()
+
+    first, second, third = read(log.path)
+    assert first['error'] == 'BadFlagError'
+    assert first['argv'] == ['--api-key', '***', 'deploy']
+    assert second['argv'] == ['--api-key=***', 'deploy']
+    assert third['argv'] == ['--unknown=***', 'deploy']
+    assert 's3cret' not in open(log.path).read()
+
+def test_command_exit_code(tmp_path):
+    path = tmp_path / 'audit.jsonl'
+
+    @command(audit=path)
+    def cli(n: int = 0):
+        return n
+
+    assert cli._audit.path == str(path)
+    cli([])
+    cli(['--n', '3'])
+    cli._audit.flush()
+    assert [r['exit_code'] for r in read(path)] == [0, 3]
+
+def test_rotation(tmp_path):
+    log = AuditLog(tmp_path / 'audit.jsonl', max_bytes=300, backups=2,
+                   batch_size=1, flush_interval=0)
+    for i in range(30):
+        log.write({'n': i, 'pad': 'x' * 40})
+    log.close()
+    names = sorted(os.listdir(tmp_path))
+    assert names == ['audit.jsonl', 'audit.jsonl.1', 'audit.jsonl.2']
+    for name in names:
+        assert os.path.getsize(tmp_path / name) <= 300
+    # the newest records are in the current file
+    assert read(log.path)[-1]['n'] == 29
+    assert read(str(log.path) + '.1')[-1]['n'] < read(log.path)[0]['n']
+
+def test_drained_at_exit(tmp_path):
+    path = tmp_path / 'audit.jsonl'
+    code = (
+        'from dispatch import command\n'
+        'from dispatch.audit import AuditLog\n'
+        f'log = AuditLog({str(path)!r}, flush_interval=60)\n'
+        '@command(audit=log)\n'
+        'def cli(name: str = "x"): return name\n'
+        'for i in range(5): cli(["--name", str(i)])\n'
+    )
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+    assert [r['flags']['name'] for r in read(path)] == list('01234')
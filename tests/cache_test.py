@@ -0,0 +1,158 @@
+import pytest
+
+import io
+import os
+import sys
+import time
+from pathlib import Path
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command
+from dispatch.cache import Cache
+from dispatch.exceptions import DeveloperException
+
+
+def test_cache_hits(tmp_path, capsys):
+    calls = []
+
+    @command(cache=str(tmp_path))
+    def cli(*args, name: str = 'x', loud: bool = False):
+        calls.append(args)
+        return f'{name}:{len(args)}'
+
+    assert cli(['--name', 'joe', 'a']) == 'joe:1'
+    assert cli(['--name', 'joe', 'a']) == 'joe:1'
+    assert len(calls) == 1
+    assert capsys.readouterr().out == 'joe:1\njoe:1\n'
+
+    cli(['--name', 'joe', 'a', 'b'])
+    cli(['--name', 'bob', 'a'])
+    assert len(calls) == 3
+
+    cli(['--name', 'joe', 'a', '--no-cache'])
+    assert len(calls) == 4
+    assert calls[-1] == ('a',)
+
+def test_cache_subcommand(tmp_path):
+    from dispatch import subcommand
+    calls = []
+
+    @command
+    class cli:
+        @subcommand(cache=str(tmp_path))
+        def build(self, name: str = 'x'):
+            calls.append(name)
+            return name
+
+    assert cli.invoke(['build']).value == 'x'
+    assert cli.invoke(['build']).value == 'x'
+    assert len(calls) == 1
+    assert cli.invoke(['build', '--no-cache']).value == 'x'
+    assert len(calls) == 2
+    assert cli.invoke_kwargs('build', no_cache=True).value == 'x'
+    assert len(calls) == 3
+    assert cli.invoke(['build']).value == 'x'
+    assert len(calls) == 3
+
+def test_cache_file_flags(tmp_path):
+    calls = []
+    data = tmp_path / 'input.txt'
+    data.write_text('one')
+
+    @command(cache=Cache(str(tmp_path / 'cache')))
+    def cli(src: Path):
+        calls.append(src)
+        return src.read_text()
+
+    assert cli(['--src', str(data)]) == 'one'
+    assert cli(['--src', str(data)]) == 'one'
+    assert len(calls) == 1
+    data.write_text('two')
+    assert cli(['--src', str(data)]) == 'two'
+    assert len(calls) == 2
+
+def test_cache_eviction(tmp_path):
+    c = Cache(str(tmp_path), max_entries=2)
+    for i, key in enumerate(('a', 'b', 'c')):
+        c.set(key, i)
+        os.utime(c._file(key), (i, i))
+    c.evict()
+    assert c.get('a') == (False, None)
+    assert c.get('b') == (True, 1)
+    assert c.get('c') == (True, 2)
+
+    c = Cache(str(tmp_path / 'size'), max_bytes=1)
+    c.set('big', 'x' * 100)
+    assert c.get('big') == (False, None)
+
+    c = Cache(str(tmp_path / 'ttl'), ttl=0.01)
+    c.set('k', 'v')
+    assert c.get('k') == (True, 'v')
+    time.sleep(0.02)
+    assert c.get('k') == (False, None)
+
+def test_cache_code_hash(tmp_path):
+    cache = Cache(str(tmp_path))
+
+    def f(): return 1
+    def g(): return 2
+    assert cache.key(f.__code__, {}, []) != cache.key(g.__code__, {}, [])
+    assert cache.key(f.__code__, {'a': 1}, []) == \
+        cache.key(f.__code__, {'a': 1}, [])
+
+def test_cache_input_files(tmp_path):
+    from dispatch.types import File
+    calls = []
+    opened = []
+    data = tmp_path / 'input.txt'
+    data.write_text('one')
+
+    @command(cache=str(tmp_path / 'cache'))
+    def cli(src: File):
+        calls.append(1)
+        opened.append(src)
+        return src.read().decode()
+
+    assert cli(['--src', str(data)]) == 'one'
+    assert cli(['--src', str(data)]) == 'one'
+    assert len(calls) == 1
+    # closed on a hit too
+    assert cli.flags['src']._value.closed
+    assert all(f.closed for f in opened)
+    data.write_text('two')
+    assert cli(['--src', str(data)]) == 'two'
+    assert len(calls) == 2
+
+    # stdin can't be hashed, so it is never cached
+    stdin = io.BytesIO(b'one')
+    stdin.path = '-'
+    assert Cache(str(tmp_path)).key(
+        cli._meta.code, {'src': stdin}, []) is None
+
+def test_cache_decompressed_args(tmp_path):
+    import gzip
+    calls = []
+    data = tmp_path / 'input.gz'
+    data.write_bytes(gzip.compress(b'one'))
+    opened = []
+
+    @command(cache=str(tmp_path / 'cache'), decompress=True)
+    def cli(*files):
+        calls.append(1)
+        opened.extend(files)
+        return b''.join(f.read() for f in files).decode()
+
+    assert cli([str(data)]) == 'one'
+    assert cli([str(data)]) == 'one'
+    assert len(calls) == 1
+    data.write_bytes(gzip.compress(b'two'))
+    assert cli([str(data)]) == 'two'
+    assert len(calls) == 2
+    assert all(f.closed for f in opened)
+
+def test_decompress_parallel():
+    with pytest.raises(DeveloperException, match='parallel'):
+        @command(parallel='thread', decompress=True)
+        def cli(*files):
+            pass
@@ -0,0 +1,113 @@
+import pytest
+from pytest import raises
+
+import bz2
+import sys
+import gzip
+import lzma
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command
+from dispatch.types import File, TextFile
+from dispatch._compress import detect
+from dispatch.exceptions import DeveloperException
+
+DATA = b''.join(b'line %d\n' % i for i in range(20000))
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = {}
+    for name, compress in (
+        ('plain', lambda b: b),
+        ('gzip', gzip.compress),
+        ('bz2', bz2.compress),
+        ('lzma', lzma.compress),
+    ):
+        # the names don't say how the files are compressed
+        p = tmp_path / f'{name}.data'
+        p.write_bytes(compress(DATA))
+        paths[name] = str(p)
+    return paths
+
+def test_detect(files):
+    for name, path in files.items():
+        with open(path, 'rb') as f:
+            assert detect(f.read(6)) == (None if name == 'plain' else name)
+
+def test_file_flags(files):
+    readers = []
+
+    @command
+    def cli(data: File, text: TextFile = None):
+        readers.append(data)
+        first = text.readline() if text else None
+        return data.read(), first
+
+    for name, path in files.items():
+        raw, first = cli(['--data', path, '--text', path])
+        assert raw == DATA
+        assert first == 'line 0\n'
+        assert readers[-1].closed
+        assert readers[-1].compression == (None if name == 'plain' else name)
+
+def test_threaded(files):
+    @command
+    def cli(data: File.options(threaded=True, buffer_size=4096)):
+        return sum(1 for _ in data)
+
+    for path in files.values():
+        assert cli(['--data', path]) == 20000
+
+    f = File.options(threaded=True)(files['gzip'])
+    assert f.read(7) == b'line 0\n'
+    f.close()  # stops the thread before it has read everything
+    with raises(TypeError):
+        File.options(colour=True)
+
+def test_threaded_close_blocked():
+    import io
+    import time
+    import threading
+    from dispatch._compress import _ThreadedReader
+
+    release = threading.Event()
+
+    class Stdin(io.RawIOBase):
+        def readable(self):
+            return True
+
+        def readinto(self, b):
+            release.wait()  # like a terminal nobody types into
+            return 0
+
+    stream = Stdin()
+    reader = _ThreadedReader(stream)
+    start = time.monotonic()
+    reader.close()
+    assert time.monotonic() - start < 2 * reader.CLOSE_TIMEOUT + 1
+    assert not stream.closed
+    release.set()  # the read returns, the thread closes the stream
+    reader._thread.join(5)
+    assert stream.closed
+
+def test_decompress_args(files):
+    @command(decompress=TextFile.options(threaded=True))
+    def count(*inputs):
+        return [sum(1 for _ in f) for f in inputs]
+
+    assert count(list(files.values())) == [20000] * 4
+
+    @command(decompress=True)
+    def lines(*inputs):
+        for f in inputs:
+            yield from f
+
+    # a generator keeps its inputs open until it is done
+    assert sum(1 for _ in lines([files['bz2'], files['lzma']])) == 40000
+
+    with raises(DeveloperException):
+        @command(decompress=True)
+        def bad(path: str):
+            pass
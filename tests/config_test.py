@@ -0,0 +1,97 @@
+import pytest
+from pytest import raises
+
+import os
+import sys
+import json
+from typing import List
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command, UserException
+from dispatch import config
+from dispatch.config import Config
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path / 'config'))
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.chdir(tmp_path)
+    config._parsed.clear()
+    return tmp_path
+
+def test_layers(dirs):
+    user = dirs / 'config' / 'cli'
+    user.mkdir(parents=True)
+    (user / 'config.toml').write_text(
+        'name = "user"\ncount = 2\nratio = 1\nnums = [1, 2]\n')
+    (dirs / '.cli.json').write_text(json.dumps({'name': 'project'}))
+    override = dirs / 'override.ini'
+    override.write_text('[cli]\ncount = 7\nloud = yes\n')
+
+    @command(config=True)
+    def cli(name: str = 'none', count: int = 0, ratio: float = 0.5,
+            nums: List[int] = None, loud: bool = False):
+        return name, count, ratio, nums, loud
+
+    assert cli([]) == ('project', 2, 1.0, [1, 2], False)
+    assert isinstance(cli([])[2], float)
+    assert cli(['--name', 'cli']) == ('cli', 2, 1.0, [1, 2], False)
+    assert cli(['--config', str(override)]) == \
+        ('project', 7, 1.0, [1, 2], True)
+    # defaults from --config are not kept for the next call
+    assert cli([]) == ('project', 2, 1.0, [1, 2], False)
+
+    with raises(UserException):
+        cli(['--config', str(dirs / 'missing.toml')])
+
+def test_group_sections(dirs):
+    path = dirs / 'cli.toml'
+    path.write_text(
+        'verbose = true\n\n[deploy]\nregion = "eu"\n\n[add-up]\nstart = "5"\n')
+
+    @command(config=[str(path)])
+    class cli:
+        verbose: bool = False
+
+        def deploy(self, region: str = 'us'):
+            return f'{region} {self.verbose}'
+
+        def add_up(self, *nums, start: int = 0):
+            return str(start + sum(int(n) for n in nums))
+
+    assert cli(['deploy']) == 'eu True'
+    assert cli(['deploy', '--region', 'asia']) == 'asia True'
+    assert cli(['add-up', '1', '2']) == '8'
+
+def test_unknown_flag(dirs):
+    path = dirs / 'cli.json'
+    path.write_text('{"nope": 1}')
+
+    @command(config=[str(path)])
+    def cli(name: str = ''):
+        pass
+    with raises(UserException, match='nope'):
+        cli([])
+
+def test_parse_cache(dirs, monkeypatch):
+    path = dirs / 'cli.toml'
+    path.write_text('name = "first"\n')
+    cfg = Config('cli', [str(path)])
+    assert cfg.load() == {'name': 'first'}
+    cached = cfg._cache_file(os.path.abspath(path))
+    assert os.path.exists(cached)
+
+    # a new process reads the marshal cache instead of the file
+    config._parsed.clear()
+    calls = []
+    parse = config.parse_file
+    monkeypatch.setattr(config, 'parse_file',
+                        lambda p: calls.append(p) or parse(p))
+    assert cfg.load() == {'name': 'first'}
+    assert calls == []
+
+    path.write_text('name = "second, longer"\n')
+    assert cfg.load() == {'name': 'second, longer'}
+    assert len(calls) == 1
@@ -0,0 +1,324 @@
+import pytest
+
+import os
+import sys
+import time
+import asyncio
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command, subcommand, CommandTimeout, deadline
+from dispatch.exceptions import DeveloperException
+from dispatch.resource import resource
+from dispatch import _dag, _parallel
+
+
+def make(log, **kw):
+    @command(**kw)
+    class cli:
+        def __init__(self):
+            self.shared = []
+
+        def fetch(self):
+            log.append(('fetch', time.monotonic()))
+            self.shared.append('fetch')
+            time.sleep(0.2)
+            log.append(('fetch done', time.monotonic()))
+
+        def build(self):
+            log.append(('build', time.monotonic()))
+            self.shared.append('build')
+            time.sleep(0.2)
+            log.append(('build done', time.monotonic()))
+
+        @subcommand(needs=['fetch', 'build'])
+        def test(self, verbose: bool = False):
+            log.append(('test', time.monotonic()))
+            self.shared.append('test')
+            assert not verbose
+
+        @subcommand(needs=['test'])
+        def release(self):
+            log.append(('release', time.monotonic()))
+            print('released', sorted(self.shared))
+
+    return cli
+
+
+def test_graph():
+    log = []
+    cli = make(log)
+    assert cli._graph == {
+        'fetch': (), 'build': (), 'test': ('fetch', 'build'),
+        'release': ('test',),
+    }
+    assert cli.iscommand('run')
+    assert _dag.plan(cli._graph, ['release'], {'fetch'}) == {
+        'release': {'test'}, 'test': {'build'}, 'build': set(),
+    }
+
+def test_run_in_order():
+    log = []
+    cli = make(log)
+    res = cli.invoke(['run', 'release', '--jobs', '2'])
+    assert res.exit_code == 0, res.stderr
+    assert res.stdout == "released ['build', 'fetch', 'test']\n"
+
+    times = dict(log)
+    # fetch and build run at the same time, the rest after them
+    assert abs(times['fetch'] - times['build']) < 0.15
+    assert times['test'] >= max(times['fetch done'], times['build done'])
+    assert times['release'] >= times['test']
+
+def test_jobs_limit():
+    log = []
+    cli = make(log)
+    res = cli.invoke(['run', 'fetch', 'build', '--jobs', '1'])
+    assert res.exit_code == 0, res.stderr
+    names = [n for n, _ in log]
+    assert names == ['build', 'build done', 'fetch', 'fetch done']
+
+def test_no_other_commands_run():
+    log = []
+    cli = make(log)
+    res = cli.invoke(['run', 'build'])
+    assert res.exit_code == 0, res.stderr
+    assert [n for n, _ in log] == ['build', 'build done']
+
+def test_skips_done_steps():
+    log = []
+    cli = make(log, reuse=True)
+    assert cli.invoke(['run', 'test']).exit_code == 0
+    assert len(log) == 5
+
+    del log[:]
+    res = cli.invoke(['run', 'release'])
+    assert res.exit_code == 0, res.stderr
+    assert [n for n, _ in log] == ['release']
+    assert res.stdout == "released ['build', 'fetch', 'test']\n"
+
+    del log[:]
+    res = cli.invoke(['run', 'release', '--force'])
+    assert res.exit_code == 0, res.stderr
+    assert len(log) == 6
+    cli.close()
+
+def test_new_instance_runs_everything():
+    log = []
+    cli = make(log)
+    assert cli.invoke(['run', 'test']).exit_code == 0
+    del log[:]
+    assert cli.invoke(['run', 'test']).exit_code == 0
+    assert len(log) == 5
+
+def test_failure_stops_dependents():
+    ran = []
+
+    @command
+    class cli:
+        def ok(self):
+            ran.append('ok')
+
+        def bad(self):
+            raise ValueError('no good')
+
+        @subcommand(needs=['ok', 'bad'])
+        def after(self):
+            ran.append('after')
+
+        @subcommand(needs=['after'])
+        def last(self):
+            ran.append('last')
+
+    res = cli.invoke(['run', 'last'])
+    assert res.exit_code == 1
+    assert 'Error: bad: no good' in res.stderr
+    assert 'after' not in ran and 'last' not in ran
+
+def test_exit_code_fails_step():
+    @command
+    class cli:
+        def first(self):
+            return 3
+
+        @subcommand(needs=['first'])
+        def second(self):
+            raise AssertionError('should not run')
+
+    res = cli.invoke(['run', 'second'])
+    assert res.exit_code == 1
+    assert 'Error: first: exit code 3' in res.stderr
+
+def test_async_pool():
+    log = []
+    active = []
+
+    @command
+    class cli:
+        async def a(self):
+            active.append(1)
+            log.append(('a', len(active)))
+            await asyncio.sleep(0.1)
+            active.pop()
+
+        async def b(self):
+            active.append(1)
+            log.append(('b', len(active)))
+            await asyncio.sleep(0.1)
+            active.pop()
+
+        @subcommand(needs=['a', 'b'])
+        def c(self):
+            log.append(('c', len(active)))
+            return 'c done'
+
+    res = cli.invoke(['run', 'c', '--pool', 'async', '--jobs', '2'])
+    assert res.exit_code == 0, res.stderr
+    assert res.stdout == 'c done\n'
+    assert sorted(log) == [('a', 1), ('b', 2), ('c', 0)] or \
+        sorted(log) == [('a', 2), ('b', 1), ('c', 0)]
+    assert log[-1] == ('c', 0)
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_process_pool(tmp_path):
+    out = tmp_path / 'out'
+
+    @command
+    class cli:
+        def a(self):
+            with open(out, 'a') as f:
+                f.write(f'a {os.getpid()}\n')
+
+        @subcommand(needs=['a'])
+        def b(self, word: str = 'b'):
+            with open(out, 'a') as f:
+                f.write(f'{word} {os.getpid()}\n')
+
+    res = cli.invoke(['run', 'b', '--pool', 'process', '--jobs', '2'])
+    assert res.exit_code == 0, res.stderr
+    lines = out.read_text().splitlines()
+    assert [l.split()[0] for l in lines] == ['a', 'b']
+    assert str(os.getpid()) not in out.read_text()
+    assert _parallel._registry == {}
+
+def test_process_pool_needs_fork(monkeypatch):
+    monkeypatch.setattr(_parallel, 'can_fork', lambda: False)
+    cli = make([])
+    res = cli.invoke(['run', 'build', '--pool', 'process'])
+    assert res.exit_code == 1
+    assert '--pool process needs the fork start method' in res.stderr
+
+def test_shared_instance_threads():
+    seen = []
+
+    @command
+    class cli:
+        def a(self):
+            seen.append(id(self))
+
+        def b(self):
+            seen.append(id(self))
+
+        @subcommand(needs=['a', 'b'])
+        def c(self):
+            seen.append(id(self))
+
+    assert cli.invoke(['run', 'c']).exit_code == 0
+    assert len(seen) == 3 and len(set(seen)) == 1
+
+def test_shared_resource_threads():
+    made = []
+
+    @command
+    class cli:
+        @resource
+        def db(self):
+            made.append(1)
+            time.sleep(0.1)
+            return object()
+
+        def a(self):
+            assert self.db is not None
+
+        def b(self):
+            assert self.db is not None
+
+        @subcommand(needs=['a', 'b'])
+        def c(self):
+            pass
+
+    res = cli.invoke(['run', 'c', '--jobs', '2'])
+    assert res.exit_code == 0, res.stderr
+    assert len(made) == 1
+
+def test_deadline_in_steps():
+    seen = []
+
+    @command(timeout=0.3)
+    class cli:
+        def a(self):
+            seen.append(deadline.current())
+            time.sleep(2)
+
+        def b(self):
+            seen.append(deadline.current())
+            time.sleep(2)
+
+        @subcommand(needs=['a', 'b'])
+        def c(self):
+            pass
+
+    start = time.monotonic()
+    res = cli.invoke(['run', 'c', '--jobs', '2'])
+    assert isinstance(res.exception, CommandTimeout)
+    assert time.monotonic() - start < 1.5
+    assert len(seen) == 2 and all(d is not None for d in seen)
+
+def test_bad_targets():
+    cli = make([])
+    res = cli.invoke(['run', 'nope'])
+    assert res.exit_code == 1
+    assert "'nope' is not a command" in res.stderr
+    res = cli.invoke(['run', 'test', '--pool', 'fiber'])
+    assert res.exit_code == 1
+    assert '--pool should be one of' in res.stderr
+    assert cli.invoke(['run']).exit_code == 1
+
+def test_own_run_command():
+    @command
+    class cli:
+        def a(self):
+            pass
+
+        @subcommand(needs=['a'])
+        def b(self):
+            pass
+
+        def run(self):
+            return 'mine'
+
+    res = cli.invoke(['run'])
+    assert res.stdout == 'mine\n'
+
+def test_unknown_need():
+    with pytest.raises(DeveloperException, match="'b' needs 'c'"):
+        @command
+        class cli:
+            def a(self):
+                pass
+
+            @subcommand(needs=['c'])
+            def b(self):
+                pass
+
+def test_cycle():
+    with pytest.raises(DeveloperException, match='a -> b -> a|b -> a -> b'):
+        @command
+        class cli:
+            @subcommand(needs=['b'])
+            def a(self):
+                pass
+
+            @subcommand(needs=['a'])
+            def b(self):
+                pass
@@ -0,0 +1,90 @@
+import pytest
+from pytest import raises
+
+import sys
+from typing import List
+from dataclasses import dataclass, field
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command
+from dispatch._dataclass import builder
+from dispatch.exceptions import DeveloperException
+
+
+@dataclass
+class RunOptions:
+    '''
+    :w workers: number of workers
+    :retries: how many times to retry
+    '''
+    workers: int = 4
+    retries: int = 0
+    verbose: bool = False
+    tags: List[str] = field(default_factory=list)
+
+
+@dataclass(slots=True, frozen=True)
+class Output:
+    path: str = '-'
+    ratio: float = 1.0
+
+
+def test_expand_fields():
+    @command
+    def run(name: str, opts: RunOptions):
+        return name, opts
+
+    assert 'opts' not in run.flags
+    assert {'name', 'workers', 'retries', 'verbose', 'tags'} == set(run.flags)
+    name, opts = run(['--name', 'x', '-w', '8', '--tags', 'a,b', '--verbose'])
+    assert name == 'x'
+    assert opts == RunOptions(workers=8, verbose=True, tags=['a', 'b'])
+
+    hlp = run.helptext()
+    assert '-w, --workers' in hlp
+    assert 'number of workers' in hlp
+    assert 'how many times to retry' in hlp
+
+    @command
+    def run2(opts: RunOptions):
+        return opts
+    assert run2([]).tags == []
+    assert run2([]).tags is not run2([]).tags
+
+def test_slots_and_prefix():
+    @command(dataclass_prefix=True)
+    def run(opts: RunOptions, out: Output):
+        return opts, out
+
+    assert 'out_path' in run.flags and 'opts_workers' in run.flags
+    opts, out = run(['--out-ratio', '0.5', '--opts-retries', '2'])
+    assert out == Output(ratio=0.5)
+    assert isinstance(out.ratio, float)
+    assert not hasattr(out, '__dict__')
+    assert opts.retries == 2
+
+    @command(dataclass_prefix={'out': 'o_'})
+    def run2(opts: RunOptions, out: Output):
+        return out
+    assert run2(['--o-path', 'file']).path == 'file'
+
+def test_name_clash():
+    with raises(DeveloperException):
+        @command
+        def run(ratio: int, out: Output):
+            pass
+
+def test_builder_cached():
+    assert builder(Output, 'o_') is builder(Output, 'o_')
+    vals = {'o_path': 'p', 'o_ratio': 2.0, 'other': 1}
+    assert builder(Output, 'o_')(vals) == Output('p', 2.0)
+    assert vals == {'other': 1}
+
+def test_group_subcommand():
+    @command
+    class cli:
+        def run(self, opts: RunOptions):
+            return str(opts.workers)
+
+    assert cli(['run', '--workers', '2']) == '2'
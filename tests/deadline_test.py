@@ -0,0 +1,135 @@
+import pytest
+
+import sys
+import time
+import asyncio
+import threading
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command, subcommand, CommandTimeout
+from dispatch import deadline
+
+
+def test_sync_timeout():
+    @command(timeout=0.1)
+    def cli(n: int = 0):
+        time.sleep(5)
+
+    start = time.monotonic()
+    with pytest.raises(CommandTimeout, match='timed out after 0.1s'):
+        cli([])
+    assert time.monotonic() - start < 2
+    assert deadline.current() is None
+
+    res = cli.invoke([])
+    assert res.exit_code == 1
+    assert 'timed out' in res.stderr
+
+def test_async_timeout():
+    cancelled = []
+
+    @command(timeout=0.1)
+    async def cli():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    with pytest.raises(CommandTimeout):
+        cli([])
+    assert cancelled == [True]
+
+def test_global_option():
+    @command
+    def cli(sleep: float = 0):
+        time.sleep(sleep)
+        return 'done'
+
+    assert cli(['--dispatch-timeout', '1']) == 'done'
+    with pytest.raises(CommandTimeout):
+        cli(['--sleep', '5', '--dispatch-timeout=0.1'])
+    with pytest.raises(deadline.UserException):
+        cli(['--dispatch-timeout', 'soon'])
+
+def test_nested():
+    @command(timeout=5)
+    def cli():
+        d = deadline.current()
+        assert d.remaining() <= 0.2
+        time.sleep(5)
+
+    start = time.monotonic()
+    with pytest.raises(CommandTimeout, match='0.2s'):
+        cli(['--dispatch-timeout', '0.2'])
+    assert time.monotonic() - start < 2
+
+def test_group():
+    @command(timeout=0.1)
+    class cli:
+        def slow(self):
+            time.sleep(5)
+
+        @subcommand(timeout=5)
+        def checked(self):
+            time.sleep(5)
+
+        def fast(self):
+            return 'fast'
+
+    assert cli.invoke(['fast']).value == 'fast'
+    for name in ('slow', 'checked'):
+        res = cli.invoke([name])
+        assert isinstance(res.exception, CommandTimeout)
+
+def test_cooperative():
+    checks = []
+
+    @command(timeout=0.1)
+    def cli():
+        while True:
+            checks.append(1)
+            deadline.check()
+            time.sleep(0.01)
+
+    err = []
+    def target():
+        try:
+            cli([])
+        except CommandTimeout as e:
+            err.append(e)
+
+    # no signals outside of the main thread
+    t = threading.Thread(target=target)
+    t.start()
+    t.join(5)
+    assert not t.is_alive()
+    assert len(err) == 1
+    assert len(checks) > 1
+
+def test_thread_fanout():
+    seen = []
+
+    @command(parallel='thread', workers=2, timeout=0.3)
+    def cli(*items):
+        seen.append(deadline.current())
+        time.sleep(1)
+
+    start = time.monotonic()
+    with pytest.raises(CommandTimeout):
+        cli(['a', 'b', 'c', 'd', 'e', 'f'])
+    # the items that have not started are cancelled, the running ones
+    # are not waited for
+    assert time.monotonic() - start < 0.9
+    assert len(seen) == 2
+    assert all(d is not None for d in seen)
+
+def test_cancel():
+    d = deadline.Deadline(10)
+    assert not d.expired
+    d.cancel()
+    with pytest.raises(CommandTimeout, match='cancelled'):
+        d.check()
+    inner = deadline.Deadline(20, parent=deadline.Deadline(1))
+    assert inner.remaining() <= 1
@@ -0,0 +1,199 @@
+import pytest
+
+import os
+import sys
+import time
+import socket
+import threading
+import subprocess
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command, UserException
+from dispatch import _distributed
+
+ROOT = dirname(dirname(os.path.abspath(__file__)))
+
+SCRIPT = '''
+import os, sys, time
+sys.path.insert(0, {root!r})
+from dispatch import command
+
+@command(parallel='tcp', chunksize=2, errors='continue', retries=1)
+def square(*nums, offset: int = 0):
+    for n in nums:
+        n = int(n)
+        if os.environ.get('CRASH_ON') == str(n):
+            os._exit(3)  # the worker dies halfway through a chunk
+        if os.environ.get('SLOW_ON') == str(n):
+            time.sleep(60)
+        if n == 13:
+            raise ValueError('unlucky')
+        return f'{{n}}:{{n * n + offset}}'
+
+if __name__ == '__main__':
+    sys.exit(square())
+'''
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+@pytest.fixture
+def cluster(tmp_path):
+    script = tmp_path / 'square.py'
+    script.write_text(SCRIPT.format(root=ROOT))
+    procs = []
+    addr = f'127.0.0.1:{free_port()}'
+
+    def worker(**env):
+        procs.append(subprocess.Popen(
+            [sys.executable, str(script), '--dispatch-worker', addr],
+            env={**os.environ, **env},
+        ))
+
+    def coordinator(*args, **env):
+        return subprocess.run(
+            [sys.executable, str(script), '--dispatch-listen', addr, *args],
+            capture_output=True, text=True, timeout=30,
+            env={**os.environ, **env},
+        )
+
+    yield worker, coordinator
+    for p in procs:
+        p.kill()
+        p.wait()
+
+def test_ordered_results(cluster):
+    worker, coordinator = cluster
+    for _ in range(3):
+        worker()
+    nums = [str(n) for n in range(12)]
+    res = coordinator('--offset', '1', *nums)
+    assert res.returncode == 0, res.stderr
+    assert res.stdout.split() == [f'{n}:{n * n + 1}' for n in range(12)]
+
+def test_lost_worker_is_retried(cluster):
+    worker, coordinator = cluster
+    worker(CRASH_ON='5')
+    worker()
+    res = coordinator(*[str(n) for n in range(10)])
+    assert res.returncode == 0, res.stderr
+    assert len(res.stdout.split()) == 10
+
+def test_slow_worker_is_stolen_from(cluster):
+    worker, coordinator = cluster
+    worker(SLOW_ON='3')
+    worker()
+    start = time.monotonic()
+    res = coordinator(*[str(n) for n in range(8)])
+    assert time.monotonic() - start < 30
+    assert res.stdout.split() == [f'{n}:{n * n}' for n in range(8)]
+
+def test_errors(cluster):
+    worker, coordinator = cluster
+    worker()
+    res = coordinator('1', '13', '3')
+    assert res.returncode == 1
+    assert res.stdout.split() == ['1:1', '3:9']
+    assert 'Error: 13: ValueError: unlucky' in res.stderr
+
+def test_frames():
+    a, b = socket.socketpair()
+    with a, b, b.makefile('rb') as f:
+        _distributed._send(a, {'type': 'task', 'items': [[0, 'x']]})
+        assert _distributed._recv(f) == {'type': 'task', 'items': [[0, 'x']]}
+        a.close()
+        assert _distributed._recv(f) is None
+
+def test_options():
+    @command(parallel='tcp')
+    def cli(*args):
+        pass
+
+    with pytest.raises(UserException):
+        cli(['--dispatch-worker'])
+    with pytest.raises(UserException):
+        _distributed._address('localhost')
+    assert _distributed._address('example.com:80') == ('example.com', 80)
+
+def test_token(cluster):
+    worker, coordinator = cluster
+    worker(DISPATCH_TOKEN='s3cret')
+    res = coordinator('1', '2', DISPATCH_TOKEN='s3cret')
+    assert res.returncode == 0, res.stderr
+    assert res.stdout.split() == ['1:1', '2:4']
+
+
+def start(cli, argv):
+    err = []
+    def target():
+        try:
+            cli(argv)
+        except Exception as e:
+            err.append(e)
+    t = threading.Thread(target=target)
+    t.start()
+    assert cli._fanout.listening.wait(5)
+    return t, err
+
+def handshake(addr, name, token):
+    sock = socket.create_connection(addr)
+    f = sock.makefile('rb')
+    challenge = _distributed._recv(f)
+    _distributed._send(sock, {
+        'type': 'hello', 'command': name, 'nonce': 'n',
+        'auth': _distributed._sign(token, challenge['nonce'], name)})
+    return sock, f, _distributed._recv(f)
+
+def test_authentication():
+    @command(parallel='tcp', token='s3cret', connect_timeout=1,
+             hidden={'api_key'})
+    def cli(*args, api_key: str = '', day: str = ''):
+        pass
+
+    t, err = start(cli, [
+        '--dispatch-listen', '127.0.0.1:0', '--api-key', 'xyz', '--day', 'mon',
+        'a'])
+    addr = cli._fanout.bound
+    sock, f, reply = handshake(addr, 'cli', 'wrong')
+    with sock, f:
+        assert reply == {'type': 'error',
+                         'message': 'the worker has the wrong token'}
+
+    sock, f, setup = handshake(addr, 'cli', 's3cret')
+    with sock, f:
+        assert setup['type'] == 'setup'
+        assert setup['auth'] == _distributed._sign('s3cret', 'n', 'cli')
+        assert setup['flags']['day'] == 'mon'
+        assert 'api_key' not in setup['flags']
+    # the only worker left, the run fails after connect_timeout
+    t.join(10)
+    assert not t.is_alive()
+    assert isinstance(err[0], UserException)
+
+def test_no_workers():
+    @command(parallel='tcp', connect_timeout=0.3)
+    def cli(*args):
+        pass
+
+    start_time = time.monotonic()
+    with pytest.raises(UserException, match='no workers connected'):
+        cli(['--dispatch-listen', '127.0.0.1:0', 'a'])
+    assert time.monotonic() - start_time < 5
+
+def test_needs_token_off_loopback(monkeypatch):
+    monkeypatch.delenv('DISPATCH_TOKEN', raising=False)
+
+    @command(parallel='tcp')
+    def cli(*args):
+        pass
+
+    with pytest.raises(UserException, match='DISPATCH_TOKEN'):
+        cli(['--dispatch-listen', '0.0.0.0:0', 'a'])
+    assert _distributed._loopback('127.0.0.1')
+    assert _distributed._loopback('::1')
+    assert _distributed._loopback('localhost')
+    assert not _distributed._loopback('example.com')
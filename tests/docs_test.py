@@ -0,0 +1,113 @@
+import pytest
+
+import sys
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command
+from dispatch import _docs
+
+
+def google(verbose: bool, out_file: str = '-', count: int = 1):
+    '''Copy things around.
+
+    This is the long description.
+
+    Args:
+        verbose (bool, -v): Print everything that
+            is being copied.
+        out-file (str): Where the output goes.
+        -c, --count: How many copies to make.
+
+    Returns:
+        Nothing: this is not a flag
+    '''
+
+def numpy(verbose: bool, out_file: str = '-', count: int = 1):
+    '''Copy things around.
+
+    Parameters
+    ----------
+    verbose : bool, -v
+        Print everything that
+        is being copied.
+    out_file : str
+        Where the output goes.
+    count : int, -c
+        How many copies to make.
+
+    Returns
+    -------
+    None
+    '''
+
+def test_google_and_numpy():
+    for fn in (google, numpy):
+        desc, flags = _docs.parse(fn, fn.__doc__)
+        assert desc.startswith('Copy things around.')
+        assert 'Args' not in desc and 'Parameters' not in desc
+        assert set(flags) == {'verbose', 'out_file', 'count'}
+        assert flags['verbose'] == {
+            'shorthand': 'v',
+            'doc': 'Print everything that is being copied.',
+        }
+        assert flags['out_file']['shorthand'] is None
+        assert flags['out_file']['doc'] == 'Where the output goes.'
+        assert flags['count']['shorthand'] == 'c'
+
+        cmd = command(fn)
+        hlp = cmd.helptext()
+        assert '-v, --verbose' in hlp
+        assert 'Print everything that is being copied.' in hlp
+        assert '-c, --count' in hlp
+        assert 'Nothing' not in hlp
+        assert cmd.flags['c'].name == 'count'
+
+def test_rest_style_unchanged():
+    def fn(verbose, tag: str = ''):
+        '''fn is a function.
+
+        Example:
+            fn --verbose
+
+        :v verbose: be loud
+        :t tag: a tag
+        '''
+    assert _docs.shorthands(fn, fn.__doc__) == {'verbose': 'v', 'tag': 't'}
+    desc, flags = _docs.parse(fn, fn.__doc__)
+    assert desc == 'fn is a function.\n\n        Example'
+    assert flags['tag']['doc'] == 'a tag'
+
+def test_help_is_lazy(monkeypatch):
+    def fn(verbose: bool, name: str = 'x'):
+        '''A command.
+
+        Args:
+            verbose (-v): be loud
+            name: who to greet
+        '''
+        assert verbose
+        return name
+
+    def fail(*args):
+        raise AssertionError('parsed the help text')
+    monkeypatch.setattr(_docs, 'parse', fail)
+
+    cmd = command(fn)
+    assert cmd(['-v', '--name', 'joe']) == 'joe'
+    monkeypatch.undo()
+    assert cmd.flags['name'].help == 'who to greet'
+    assert 'A command.' in cmd.helptext()
+
+def test_doc_cache():
+    first = _docs.parse(google, google.__doc__)
+    assert _docs.parse(google, google.__doc__) is first
+    assert _docs.shorthands(google, google.__doc__) is \
+        _docs.shorthands(google, google.__doc__)
+
+def test_settings_override_docs():
+    @command(shorthands={'verbose': 'x'}, docs={'verbose': 'from settings'})
+    def cli(verbose: bool):
+        ''':v verbose: from the docstring'''
+    assert cli.flags['verbose'].shorthand == 'x'
+    assert cli.flags['verbose'].help == 'from settings'
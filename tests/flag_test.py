@@ -98,3 +98,22 @@ def testFromTypingModule():
     class A: pass # noqa
     assert not _from_typing_module(A)
 
+
+def testFormatWidth():
+    o = Option('name', str, shorthand='n', help='a name')
+    assert f'{o:<12}' == '-n, --name        a name'
+    assert f'{o:>12+2}' == '          -n, --name a name'
+    assert f'{o:<4}' == '-n, --name a name'
+    assert '{0:<{1}}'.format(o, 10) == '-n, --name      a name'
+    fset = command(lambda name='x': None).flags
+    assert fset.help.startswith('        --name   ')
+
+def testSharedSpecsBounded(monkeypatch):
+    from dispatch import flags
+    monkeypatch.setattr(flags, '_specs', {})
+    monkeypatch.setattr(flags, 'MAX_SPECS', 8)
+    assert Option('a', str)._spec is Option('a', str)._spec
+    for i in range(20):
+        Option(f'opt{i}', str)
+    assert len(flags._specs) == 8
+    assert Option('opt19', str)._spec is Option('opt19', str)._spec
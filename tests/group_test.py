@@ -265,17 +265,14 @@ def test_group_parseargs():
     assert cmd.args == []
 
 def test_group_err(capsys):
-    def f(a): ...
-
-    sysexit = sys.exit
-    sys.exit = f
     @command(silent=True)
     class cmd:
         verbose: bool
 
-    cmd([])
+    with raises(SystemExit):
+        cmd([])
+    assert cmd.invoke([]).exit_code == 1
 
-    sys.exit = sysexit
     hlp = cmd.helptext()
     assert 'Commands:' not in hlp
     with raises(BadFlagError, match="'--notaflag' is not a flag"):
@@ -384,3 +381,58 @@ def test_flags_in_init():
             assert self.path == 'the/other/correct/path'
     cmd(['--path', 'the/correct/path'])
     cmd(['subcmd', '--path', 'the/other/correct/path'])
+
+def test_single_pass_parsing(monkeypatch):
+    @command
+    class cli:
+        verbose: bool
+        name: str = 'nobody'
+
+        def greet(self, *args, loud: bool, times: int = 1):
+            assert self.verbose
+            assert self.name == 'joe'
+            assert args == ('one', 'two')
+            assert loud
+            assert times == 3
+
+    def fail(*args):
+        raise AssertionError('arguments parsed twice')
+    monkeypatch.setattr(SubCommand, 'parse_args', fail)
+
+    cli(['--verbose', 'greet', 'one', '--loud', '--name', 'joe', 'two', '--times=3'])
+    cli._reset()
+    cli(['one', '--name=joe', 'greet', 'two', '--times', '3', '--loud', '--verbose'])
+    cli._reset()
+    with raises(BadFlagError, match="'--nope' is not a flag for 'greet'"):
+        cli(['greet', '--nope'])
+    cli._reset()
+    with raises(UserException):
+        cli(['greet', '--times'])
+
+def test_subcommand_no_cache_flag():
+    @command
+    class cli:
+        def build(self, no_cache: bool = False):
+            return f'no_cache={no_cache}'
+
+    assert cli.invoke(['build', '--no-cache']).value == 'no_cache=True'
+    assert cli.invoke(['build']).value == 'no_cache=False'
+    assert cli.invoke_kwargs('build', no_cache=True).value == 'no_cache=True'
+    with raises(BadFlagError):
+        cli(['--no-cache', 'build'])
+
+def test_subcommand_help(capsys):
+    @command
+    class cli:
+        verbose: bool
+        def greet(self, loud: bool):
+            '''say hello
+
+            :l loud: be loud
+            '''
+            raise AssertionError('should not run')
+
+    cli(['greet', '--help'])
+    cli(['--verbose', 'greet', '-h'])
+    out = capsys.readouterr().out
+    assert out.count('-l, --loud') == 2
@@ -0,0 +1,92 @@
+import pytest
+
+import os
+import sys
+import subprocess
+from os.path import dirname
+
+ROOT = dirname(dirname(os.path.abspath(__file__)))
+
+# 'import dispatch' takes 2-4ms. Wall clock budgets are flaky on loaded
+# machines so the import is checked by the modules it loads, the only ones
+# besides its own are these (with -S, so without the ones site loads).
+ALLOWED_MODULES = {
+    'abc', 'types', 'os', 'os.path', 'posixpath', 'ntpath', 'genericpath',
+    'stat', '_stat', '_collections_abc', 'nt', 'posix',
+}
+
+# Maximum cumulative time in microseconds for 'import dispatch' as reported
+# by 'python -X importtime', only checked when $DISPATCH_IMPORT_BUDGET_US
+# is set.
+IMPORT_BUDGET_US = os.getenv('DISPATCH_IMPORT_BUDGET_US')
+
+HEAVY_MODULES = ('jinja2', 'inspect', 'typing', 'dataclasses')
+
+
+def run(code: str, *args):
+    return subprocess.run(
+        [sys.executable, *args, '-c', code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+
+def import_time(stderr: str) -> int:
+    '''Sum the cumulative times of the top level dispatch imports.'''
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        top_level = not name[1:].startswith(' ')
+        if top_level and name.strip().split('.')[0] == 'dispatch':
+            total += int(cumulative)
+    assert total, 'dispatch not found in importtime output'
+    return total
+
+def test_import_modules():
+    code = (
+        'import sys\n'
+        'before = set(sys.modules)\n'
+        'import dispatch\n'
+        'from dispatch import command\n'
+        'print(" ".join(set(sys.modules) - before))\n'
+    )
+    mods = set(run(code, '-S').stdout.split())
+    assert 'dispatch.flags' in mods
+    extra = {m for m in mods if m.split('.')[0] != 'dispatch'}
+    assert extra <= ALLOWED_MODULES, \
+        f'import dispatch loaded {sorted(extra - ALLOWED_MODULES)}'
+
+@pytest.mark.skipif(IMPORT_BUDGET_US is None,
+                    reason='set $DISPATCH_IMPORT_BUDGET_US to time the import')
+def test_import_budget():
+    budget = int(IMPORT_BUDGET_US)
+    # take the best of a few runs, the first one might be compiling
+    times = [
+        import_time(run('import dispatch; from dispatch import command',
+                        '-X', 'importtime').stderr)
+        for _ in range(3)
+    ]
+    assert min(times) <= budget, \
+        f'import dispatch took {min(times)}us (budget {budget}us)'
+
+def test_lazy_imports():
+    code = (
+        'import sys\n'
+        'from dispatch import command\n'
+        '@command\n'
+        'def cli(verbose: bool, name: str = "x"): return name\n'
+        'cli(["--verbose", "--name", "y"])\n'
+        'print(" ".join(sys.modules))\n'
+    )
+    mods = set(run(code).stdout.split())
+    for name in HEAVY_MODULES:
+        assert name not in mods, f'{name} was imported by a plain command'
+    assert 'dispatch.flags' in mods
+
+def test_lazy_exports():
+    import dispatch
+    from dispatch.dispatch import Command
+    assert dispatch.Command is Command
+    assert 'Group' in dir(dispatch)
+    with pytest.raises(AttributeError):
+        dispatch.not_a_name
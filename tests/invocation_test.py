@@ -0,0 +1,75 @@
+import pytest
+
+import sys
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command, InvocationResult
+from dispatch.exceptions import BadFlagError
+
+
+@command
+class cli:
+    '''A test cli.'''
+    verbose: bool
+
+    def greet(self, name: str = 'world', times: int = 1):
+        for _ in range(times):
+            print(f'hello {name}')
+        if self.verbose:
+            print('done', file=sys.stderr)
+
+    def status(self, *codes):
+        return int(codes[0]) if codes else 0
+
+    def fail(self):
+        raise ValueError('failed')
+
+
+def test_invoke():
+    res = cli.invoke(['greet', '--name', 'joe', '--times', '2', '--verbose'])
+    assert isinstance(res, InvocationResult)
+    assert res.exit_code == 0
+    assert res.stdout == 'hello joe\nhello joe\n'
+    assert res.stderr == 'done\n'
+    assert res.exception is None
+
+    assert cli.invoke(['status', '3']).exit_code == 3
+    assert cli.invoke(['status']).value == 0
+
+    res = cli.invoke(['fail'])
+    assert res.exit_code == 1
+    assert isinstance(res.exception, ValueError)
+
+    res = cli.invoke(['greet', '--nope'])
+    assert res.exit_code == 1
+    assert isinstance(res.exception, BadFlagError)
+    assert res.stderr.startswith('Error:')
+
+    res = cli.invoke([])
+    assert res.exit_code == 1
+    assert 'A test cli.' in res.stdout
+
+def test_invoke_kwargs(capsys):
+    res = cli.invoke_kwargs('greet', name='bob', times='2', verbose=True)
+    assert res.stdout == 'hello bob\nhello bob\n'
+    assert res.stderr == 'done\n'
+    assert cli.invoke_kwargs('status', '4').exit_code == 4
+
+    # values from the last call are not kept
+    res = cli.invoke_kwargs('greet', capture=False)
+    assert res.stdout is None
+    assert capsys.readouterr().out == 'hello world\n'
+
+    res = cli.invoke_kwargs('greet', color='red')
+    assert isinstance(res.exception, BadFlagError)
+
+def test_command_invoke():
+    @command
+    def add(*nums, start: int = 0):
+        return str(start + sum(int(n) for n in nums))
+
+    assert add.invoke(['1', '2', '--start', '3']).stdout == '6\n'
+    res = add.invoke_kwargs('1', start=10)
+    assert res.value == '11'
+    assert res.exit_code == 0
@@ -0,0 +1,233 @@
+import pytest
+
+import os
+import sys
+import json
+import itertools
+import subprocess
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import handle
+from dispatch.launcher import RUN, check, launch, load, write
+
+ROOT = dirname(dirname(os.path.abspath(__file__)))
+
+GROUP = '''
+from dispatch import command
+
+@command(pipeline=True, hidden={'secret'})
+class app:
+    """
+    :v verbose: talk more
+    """
+    verbose: bool = False
+    level: int = 1
+
+    def deploy(self, region: str = 'eu', dry_run: bool = False):
+        """Deploy the thing.
+
+        :r region: where to deploy
+        """
+        return f'deploy {region} {dry_run} {self.verbose}'
+
+    def status(self, *names):
+        return 'status ' + ' '.join(names)
+
+    def secret(self):
+        pass
+'''
+
+COMMAND = '''
+from dispatch import command
+
+@command
+def tool(*files, count: int = 1, quiet: bool = False):
+    """Count things.
+
+    :c count: how many
+    """
+    return f'tool {count} {quiet} {list(files)}'
+'''
+
+BASE = '''
+class Base:
+    def deploy(self, region: str = 'eu'):
+        return region
+'''
+
+_ids = itertools.count()
+
+
+@pytest.fixture
+def module(tmp_path, monkeypatch):
+    '''Write a module to import, a new name every time.'''
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    def make(source: str, attr: str):
+        name = f'launched_{next(_ids)}'
+        (tmp_path / f'{name}.py').write_text(source)
+        return name, f'{name}:{attr}', str(tmp_path / f'{name}.json')
+    return make
+
+
+def run(fn, capsys):
+    try:
+        code = handle(fn)
+    except SystemExit as e:
+        code = ('exit', e.code)
+    out, err = capsys.readouterr()
+    return code, out, err
+
+
+def test_manifest(module):
+    name, target, path = module(GROUP, 'app')
+    man = write(target, path)
+    assert load(path, target) == json.loads(json.dumps(man))
+
+    cli = sys.modules[name].app
+    group = man['command']
+    assert group['kind'] == 'group'
+    assert group['help'] == cli.helptext()
+    assert group['pipeline'] == '+'
+    assert 'secret' in group['hidden']
+    assert {f['name']: (f['type'], f['default'], f['shorthand'])
+            for f in group['flags']} == {
+        'verbose': ('bool', False, 'v'),
+        'level': ('int', 1, None),
+    }
+
+    deploy = group['commands']['deploy']
+    assert deploy['help'] == cli._get_command('deploy').helptext()
+    region = [f for f in deploy['flags'] if f['name'] == 'region'][0]
+    assert region == {
+        'name': 'region', 'type': 'str', 'default': 'eu', 'shorthand': 'r',
+        'help': 'where to deploy', 'hidden': False,
+    }
+    assert cli.manifest()['command'] == group
+
+@pytest.mark.parametrize('argv', [
+    ['--help'],
+    ['help', 'deploy'],
+    ['deploy', '--help'],
+    ['-h'],
+    [],
+    ['deplyo'],
+    ['deplyo', '--region', 'us'],
+    ['deploy', '--regin', 'us'],
+    ['deploy', '--verbos'],
+    ['--levl', '2'],
+    ['deploy', '--region'],
+    ['deploy', '--dry-run=yes'],
+    ['zzzz'],
+    ['--config', 'x'],
+])
+def test_same_as_cli(module, capsys, argv):
+    name, target, path = module(GROUP, 'app')
+    write(target, path)
+    cli = sys.modules.pop(name).app
+
+    want = run(lambda: cli(list(argv)), capsys)
+    got = run(lambda: launch(target, path, argv), capsys)
+    assert got == want
+    # answered from the manifest
+    assert name not in sys.modules
+
+@pytest.mark.parametrize('argv', [
+    ['deploy', '--region', 'us', '-v'],
+    ['--level=3', 'status', 'a', 'b'],
+    ['status', 'a', '+', 'status'],
+])
+def test_valid_runs_cli(module, argv):
+    name, target, path = module(GROUP, 'app')
+    write(target, path)
+    cli = sys.modules.pop(name).app
+
+    want = cli(list(argv))
+    assert check(load(path), argv) is RUN
+    assert launch(target, path, argv) == want
+    assert name in sys.modules
+
+def test_command(module, capsys):
+    name, target, path = module(COMMAND, 'tool')
+    man = write(target, path)
+    assert man['command']['kind'] == 'command'
+    cli = sys.modules.pop(name).tool
+
+    for argv in (['--help'], ['a', '--cont', '2'], ['-c'], ['--quiet=1']):
+        want = run(lambda: cli(list(argv)), capsys)
+        got = run(lambda: launch(target, path, argv), capsys)
+        assert got == want
+        assert name not in sys.modules
+
+    assert launch(target, path, ['a', '-c', '3', 'b']) == "tool 3 False ['a', 'b']"
+
+def test_stale_manifest(module, tmp_path):
+    name, target, path = module(COMMAND, 'tool')
+    write(target, path)
+    assert load(path, target) is not None
+    assert load(path, 'other:tool') is None
+
+    src = tmp_path / f'{name}.py'
+    src.write_text(COMMAND.replace('count: int = 1', 'count: int = 5'))
+    assert load(path, target) is None
+    sys.modules.pop(name)
+
+    # the launcher runs the cli and writes the manifest again
+    assert launch(target, path, []) == 'tool 5 False []'
+    man = load(path, target)
+    assert man is not None
+    count = [f for f in man['command']['flags'] if f['name'] == 'count'][0]
+    assert count['default'] == 5
+
+def test_stale_other_module(module, tmp_path):
+    base, _, _ = module(BASE, 'Base')
+    name, target, path = module(
+        f'from dispatch import command\nfrom {base} import Base\n\n'
+        '@command\nclass app(Base):\n    pass\n', 'app')
+    man = write(target, path)
+    assert str(tmp_path / f'{base}.py') in {s['path'] for s in man['sources']}
+    assert load(path, target) is not None
+
+    # only the module that defines the sub-command changes
+    (tmp_path / f'{base}.py').write_text(
+        BASE.replace("region: str = 'eu'", "region: str = 'us', force: bool = False"))
+    assert load(path, target) is None
+
+def test_missing_manifest(module):
+    name, target, path = module(COMMAND, 'tool')
+    assert not os.path.exists(path)
+    assert launch(target, path, ['x']) == "tool 1 False ['x']"
+    assert load(path, target) is not None
+
+def test_passed_to_cli():
+    man = {'command': {
+        'kind': 'group', 'name': 'g', 'help': '', 'flags': [],
+        'config': False, 'silent': False, 'callable': False,
+        'pipeline': None, 'hidden': [], 'commands': {'plugged': None},
+    }}
+    assert check(man, ['plugged', '--anything']) is RUN
+    assert check(man, ['plugged', '--help']) is RUN
+    assert check(man, ['--dispatch-watch', 'x']) is RUN
+
+def test_main(module, tmp_path):
+    name, target, path = module(COMMAND, 'tool')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(tmp_path), ROOT]))
+    subprocess.run(
+        [sys.executable, '-m', 'dispatch.launcher', target, path],
+        check=True, env=env, cwd=ROOT)
+    assert load(path, target)['command']['name'] == 'tool'
+
+    # help without importing the module (or jinja2)
+    code = (
+        'import sys\n'
+        'from dispatch.launcher import launch\n'
+        f'launch({target!r}, {path!r}, ["--help"])\n'
+        f'assert {name!r} not in sys.modules\n'
+        'assert "jinja2" not in sys.modules\n'
+    )
+    res = subprocess.run(
+        [sys.executable, '-c', code], env=env, cwd=ROOT,
+        capture_output=True, text=True)
+    assert res.returncode == 0, res.stderr
+    assert res.stdout.startswith('Count things.')
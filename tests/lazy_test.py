@@ -0,0 +1,65 @@
+import pytest
+
+import sys
+from pathlib import Path
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command, lazy
+
+
+calls = []
+
+def find_root():
+    calls.append('root')
+    return '/repo'
+
+def test_lazy_default(capsys):
+    calls.clear()
+
+    @command
+    def status(root: Path = lazy(find_root), depth: int = lazy(lambda: '3')):
+        return root, depth
+
+    assert status.flags['root'].type is Path
+    hlp = status.helptext()
+    assert 'default: find_root()' in hlp
+    assert 'default: <lambda>()' in hlp
+    assert calls == []
+
+    assert status(['--root', '/other']) == (Path('/other'), 3)
+    assert calls == []
+    assert status([]) == (Path('/repo'), 3)
+    assert calls == ['root']
+    status([])
+    assert calls == ['root', 'root']
+
+def test_lazy_label():
+    @command
+    def cli(user: str = lazy(find_root, label='$USER')):
+        return user
+    assert 'default: $USER' in cli.helptext()
+
+def test_group_attribute():
+    calls.clear()
+
+    @command
+    class cli:
+        root = lazy(find_root)
+        count: int = lazy(lambda: 2)
+
+        def show(self):
+            return f'{self.root} {self.root} {self.count}'
+
+    assert cli.flags['root'].type is str
+    assert cli(['show', '--root', 'x']) == 'x x 2'
+    assert calls == []
+    assert cli(['show']) == '/repo /repo 2'
+    assert calls == ['root']
+
+    # help after a run shows the defaults, not the values of the run
+    cli(['show', '--root', 'x', '--count', '5'])
+    hlp = cli.helptext()
+    assert 'default: find_root()' in hlp
+    assert 'default: <lambda>()' in hlp
+    assert "default: 'x'" not in hlp
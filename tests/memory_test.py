@@ -0,0 +1,72 @@
+import pytest
+
+import gc
+import sys
+import tracemalloc
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command, Command
+
+# Bytes allocated per flag by a command in a wide, generated CLI. Before
+# options shared their specs this was about 195.
+MAX_BYTES_PER_FLAG = 160
+
+
+def generated_commands(n_cmds: int, n_flags: int) -> list:
+    ns: dict = {}
+    params = ', '.join(f'opt_{i}: int = {i}' for i in range(n_flags))
+    for c in range(n_cmds):
+        exec(f'def cmd{c}(verbose: bool, {params}): pass', ns)
+    return [ns[f'cmd{c}'] for c in range(n_cmds)]
+
+def allocated(fn) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        res = fn()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    return res, sum(s.size_diff for s in after.compare_to(before, 'filename'))
+
+def test_wide_cli_memory():
+    fns = generated_commands(50, 40)
+    Command(fns[0])  # warm up the docstring and spec caches
+    cmds, size = allocated(lambda: [Command(f) for f in fns[1:]])
+    per_flag = size / (49 * 41)
+    assert per_flag < MAX_BYTES_PER_FLAG, f'{per_flag:.0f} bytes per flag'
+
+    a, b = cmds[0].flags['opt_3'], cmds[1].flags['opt_3']
+    assert a._spec is b._spec
+    assert cmds[0](['--opt-3', '7']) is None
+    assert a.value == 7 and b.value == 3
+
+def test_subcommands_reused():
+    @command
+    class cli:
+        verbose: bool
+
+        def run(self, count: int = 1, name: str = 'x'):
+            return f'{name}{count}'
+
+    assert cli(['run', '--count', '2']) == 'x2'
+    first = cli._get_command('run')
+
+    def calls():
+        for _ in range(200):
+            cli(['run', '--verbose', '--name', 'y'])
+
+    _, size = allocated(calls)
+    assert cli._get_command('run') is first
+    assert first.flags['count'].value == 1
+    assert size < 20_000, f'{size} bytes for 200 calls'
+
+def test_values_reset():
+    @command
+    def cli(count: int = 1, tags: list = None):
+        return count, tags
+
+    assert cli(['--count', '5', '--tags', 'a,b']) == (5, ['a', 'b'])
+    assert cli([]) == (1, None)
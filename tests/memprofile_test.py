@@ -0,0 +1,84 @@
+import pytest
+
+import sys
+import json
+import tracemalloc
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command, subcommand
+from dispatch import memprofile
+
+
+kept = []
+
+def new_command():
+    @command
+    def cli(size: int = 1000):
+        # kept alive so it is still allocated when the phase ends
+        kept.append([str(i) * 10 for i in range(size)])
+        return len(kept[-1])
+    return cli
+
+def test_stderr_report(capsys):
+    cli = new_command()
+    assert cli(['--size', '20000', '--dispatch-memprofile']) == 20000
+    err = capsys.readouterr().err
+    assert err.startswith('memory profile: cli')
+    assert 'parse' in err and 'callback' in err
+    assert 'top allocations (callback):' in err
+    assert f'{__file__}:' in err
+    assert not tracemalloc.is_tracing()
+
+    # nothing is profiled without the option
+    cli(['--size', '10'])
+    assert capsys.readouterr().err == ''
+
+def test_json_and_compare(tmp_path, capsys):
+    cli = new_command()
+    small, big = tmp_path / 'small.json', tmp_path / 'big.json'
+    cli(['--size', '1000', f'--dispatch-memprofile={small}'])
+    cli(['--size', '50000', f'--dispatch-memprofile={big}'])
+
+    prof = json.loads(big.read_text())
+    assert prof['command'] == 'cli'
+    phases = {p['phase']: p for p in prof['phases']}
+    assert set(phases) == {'parse', 'callback'}
+    callback = phases['callback']
+    assert callback['peak_increase'] > 50000 * 50
+    assert callback['top'][0]['file'] == __file__
+    assert callback['peak'] >= callback['peak_increase']
+
+    report = memprofile.compare(str(small), str(big))
+    assert 'callback' in report
+    assert 'largest changes:' in report
+    assert memprofile.main([str(small), str(big)]) == 0
+    assert capsys.readouterr().out.strip() == report
+
+def test_build_phase(tmp_path, monkeypatch):
+    out = tmp_path / 'prof.json'
+    monkeypatch.setenv('DISPATCH_MEMPROFILE', str(out))
+
+    @command
+    def never_run():
+        pass
+
+    @command
+    class cli:
+        verbose: bool
+
+        def run(self):
+            return 'ok'
+
+        @subcommand
+        def other(self):
+            pass
+
+    assert not tracemalloc.is_tracing()
+    assert cli.invoke(['run']).value == 'ok'
+    phases = [p['phase'] for p in json.loads(out.read_text())['phases']]
+    assert phases == ['build', 'init', 'parse', 'callback']
+    # sub-commands don't start profiles of their own
+    assert cli._get_command('run')._memprof is None
+    assert cli._get_command('other')._memprof is None
+    assert not tracemalloc.is_tracing()
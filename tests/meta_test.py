@@ -82,4 +82,10 @@ def test_multi_name_flag_docs():
         '''
     c = Command(f)
     assert '-f, --flag-name' in c.helptext()
-    assert '-a, --another-flag' in c.helptext()
\ No newline at end of file
+    assert '-a, --another-flag' in c.helptext()
+def test_abstract_meta():
+    class Incomplete(_CliMeta):
+        def run(self): ...
+
+    with pytest.raises(TypeError):
+        Incomplete()
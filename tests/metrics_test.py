@@ -0,0 +1,140 @@
+import pytest
+
+import os
+import sys
+import time
+import signal
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command, UserException
+from dispatch import metrics
+
+
+def new_group(reg):
+    @command(metrics=reg)
+    class cli:
+        def deploy(self, region: str = 'eu'):
+            return region
+
+        def fail(self):
+            raise UserException('no')
+    return cli
+
+def test_counts(tmp_path):
+    path = str(tmp_path / 'dispatch_cli.prom')
+    reg = metrics.Registry(path)
+    cli = new_group(reg)
+    for _ in range(3):
+        assert cli.invoke(['deploy']).value == 'eu'
+    cli.invoke(['deploy', '--zone', 'x'])
+    cli.invoke(['not-a-command', '--x'])
+    cli.invoke(['fail'])
+    reg.flush()
+    assert reg.counters == {}
+
+    text = open(path).read()
+    assert '# TYPE dispatch_phase_seconds histogram' in text
+    samples = metrics.parse(text)
+    assert samples['dispatch_invocations_total{command="cli deploy"}'] == 4
+    assert samples['dispatch_errors_total{command="cli deploy",exception="BadFlagError"}'] == 1
+    assert samples['dispatch_errors_total{command="cli",exception="CommandNotFound"}'] == 1
+    assert samples['dispatch_errors_total{command="cli fail",exception="UserException"}'] == 1
+    # the run with a bad flag never got to the callback
+    for phase, n in (('init', 4), ('parse', 4), ('callback', 3)):
+        assert samples[
+            f'dispatch_phase_seconds_count{{command="cli deploy",phase="{phase}"}}'] == n
+        assert samples[
+            f'dispatch_phase_seconds_bucket{{command="cli deploy",phase="{phase}",le="+Inf"}}'] == n
+
+    # a second process adds to the file
+    cli.invoke(['deploy'])
+    reg.flush()
+    samples = metrics.parse(open(path).read())
+    assert samples['dispatch_invocations_total{command="cli deploy"}'] == 5
+    assert not [f for f in os.listdir(tmp_path) if f.endswith('.tmp')]
+
+def test_histogram_buckets():
+    reg = metrics.Registry()
+    for secs in (0.0001, 0.001, 0.7, 100):
+        reg.observe('dispatch_phase_seconds', (('command', 'x'),), secs)
+    samples = reg.samples()
+    bucket = 'dispatch_phase_seconds_bucket{{command="x",le="{}"}}'
+    assert samples[bucket.format('0.0005')] == 1
+    assert samples[bucket.format('0.001')] == 2
+    assert samples[bucket.format('1')] == 3
+    assert samples[bucket.format('+Inf')] == 4
+    lines = [l for l in reg.render().splitlines() if '_bucket' in l]
+    assert lines[0].startswith(bucket.format('0.0005'))
+    assert lines[-1].startswith(bucket.format('+Inf'))
+
+def test_env(tmp_path, monkeypatch):
+    monkeypatch.setenv('DISPATCH_METRICS_DIR', str(tmp_path))
+
+    @command
+    def tool():
+        return 'ok'
+
+    assert tool._metrics.path == str(tmp_path / 'dispatch_tool.prom')
+
+    @command(metrics=False)
+    def quiet():
+        pass
+
+    assert quiet._metrics is None
+
+def wait_for(path):
+    for _ in range(500):
+        if os.path.exists(path):
+            return
+        time.sleep(0.01)
+    raise AssertionError(f'{path} was not written')
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGUSR1'), reason='no SIGUSR1')
+def test_sigusr1(tmp_path, monkeypatch):
+    prev = signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+    monkeypatch.setattr(metrics, '_installed', [])
+    monkeypatch.setattr(metrics, '_signal_installed', False)
+    try:
+        path = str(tmp_path / 'long.prom')
+        other = str(tmp_path / 'other.prom')
+        reg = metrics.Registry(path)
+
+        @command(metrics=reg)
+        def long_running(signal_self: bool = False):
+            if signal_self:
+                os.kill(os.getpid(), signal.SIGUSR1)
+                wait_for(path)
+            return 'done'
+
+        @command(metrics=metrics.Registry(other))
+        def second():
+            pass
+
+        second.invoke([])
+        key = 'dispatch_invocations_total{command="long_running"}'
+        long_running.invoke([])
+        long_running.invoke(['--signal-self'])
+        # the second run was still going when the counts were written
+        assert metrics.parse(open(path).read())[key] == 1
+        reg.flush()
+        assert metrics.parse(open(path).read())[key] == 2
+        # every registry is written, not only the first one
+        wait_for(other)
+        assert metrics.parse(open(other).read())[
+            'dispatch_invocations_total{command="second"}'] == 1
+    finally:
+        signal.signal(signal.SIGUSR1, prev)
+
+def test_overhead():
+    reg = metrics.Registry()
+    n = 10000
+    start = time.perf_counter()
+    for _ in range(n):
+        obs = reg.observer('cli')
+        obs.begin('parse')
+        obs.begin('callback')
+        obs.finish()
+    per_run = (time.perf_counter() - start) / n
+    reg.counters, reg.histograms = {}, {}  # don't print them at exit
+    assert per_run < 50e-6, f'{per_run * 1e6:.1f}us per run'
@@ -0,0 +1,109 @@
+import pytest
+from pytest import raises
+
+import sys
+import time
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command
+from dispatch.exceptions import DeveloperException
+from dispatch import _parallel
+
+
+@command(parallel='process', workers=2)
+def upper(*args, suffix: str = ''):
+    return args[0].upper() + suffix
+
+def test_process_fanout(capsys):
+    code = upper(['a', 'b', 'c', '--suffix', '!'])
+    assert code == 0
+    assert upper.results == ['A!', 'B!', 'C!']
+    assert capsys.readouterr().out == 'A!\nB!\nC!\n'
+
+def test_thread_fanout_order(capsys):
+    @command(parallel='thread', workers=4, chunksize=2)
+    def cli(*args):
+        time.sleep(0.01 * (5 - int(args[0])))
+        return args[0]
+
+    assert cli(['1', '2', '3', '4', '5']) == 0
+    assert capsys.readouterr().out.split() == ['1', '2', '3', '4', '5']
+
+    @command(parallel='thread', workers=5, ordered=False)
+    def unordered(*args):
+        time.sleep(0.02 * (5 - int(args[0])))
+        return args[0]
+
+    assert unordered(['1', '2', '3', '4', '5']) == 0
+    assert unordered.results == ['1', '2', '3', '4', '5']
+    assert capsys.readouterr().out.split() == ['5', '4', '3', '2', '1']
+
+def test_fanout_errors(capsys):
+    @command(parallel='thread', errors='continue')
+    def cli(*args):
+        if args[0] == 'bad':
+            raise ValueError('bad input')
+        return 3 if args[0] == 'three' else None
+
+    assert cli(['ok', 'bad', 'ok']) == 1
+    assert isinstance(cli.results[1], ValueError)
+    assert 'Error: bad: bad input' in capsys.readouterr().err
+    assert cli(['ok', 'three']) == 3
+    assert cli([]) == 0
+
+    @command(parallel='process', workers=2)
+    def failing(*args):
+        raise ValueError(args[0])
+
+    with raises(ValueError, match='x'):
+        failing(['x', 'y'])
+
+def test_fanout_shared_memory(monkeypatch):
+    monkeypatch.setattr(_parallel, 'SHM_THRESHOLD', 16)
+
+    @command(parallel='process', workers=2)
+    def blob(*args):
+        return args[0].encode() * 64
+
+    assert blob(['ab', 'cd']) == 0
+    assert blob.results == [b'ab' * 64, b'cd' * 64]
+
+def test_fanout_settings():
+    def fn(name: str): ...
+    with raises(DeveloperException):
+        command(parallel='thread')(fn)
+    def fn(*args): ...
+    with raises(DeveloperException):
+        command(parallel='gpu')(fn)
+    with raises(DeveloperException):
+        command(parallel='thread', errors='ignore')(fn)
+    with raises(DeveloperException, match="'workers' does not apply to parallel='tcp'"):
+        command(parallel='tcp', workers=4)(fn)
+    with raises(DeveloperException, match="'retries' does not apply to parallel='thread'"):
+        command(parallel='thread', retries=3)(fn)
+    with raises(DeveloperException, match="'address' does not apply"):
+        command(parallel='process', address='127.0.0.1:7600')(fn)
+    with raises(DeveloperException, match="'workers' needs parallel"):
+        command(workers=4)(fn)
+    command(parallel='tcp', chunksize=2, retries=0)(fn)
+    command(parallel='thread', workers=2, chunksize=2, ordered=False)(fn)
+
+def test_fork_required(monkeypatch):
+    monkeypatch.setattr(_parallel, 'can_fork', lambda: False)
+    def fn(*args): ...
+    with raises(DeveloperException, match='fork'):
+        command(parallel='process')(fn)
+    command(parallel='thread')(fn)
+
+@pytest.mark.parametrize('mode', ['thread', 'process'])
+def test_async_callback(mode):
+    import asyncio
+
+    @command(parallel=mode, workers=2)
+    async def cli(*args):
+        await asyncio.sleep(0.01)
+        return int(args[0]) * 2
+
+    assert cli(['1', '2', '3']) == 6
+    assert cli.results == [2, 4, 6]
@@ -0,0 +1,93 @@
+import pytest
+from pytest import raises
+
+import sys
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command, subcommand
+from dispatch.exceptions import UserException, DeveloperException, CommandNotFound
+
+
+def new_group(events):
+    @command(pipeline=True)
+    class cli:
+        verbose: bool
+
+        def extract(self, *srcs, count: int = 3):
+            for i in range(count):
+                events.append(f'extract {i}')
+                yield {'src': srcs[0] if srcs else 'x', 'n': i}
+
+        @subcommand(pipe='records')
+        def transform(self, records, fast: bool = False):
+            for r in records:
+                events.append(f'transform {r["n"]}')
+                yield dict(r, n=r['n'] * (10 if fast else 2))
+
+        def load(self, *records):
+            events.append('load')
+            out = ','.join(str(r['n']) for r in records)
+            return out + ('!' if self.verbose else '')
+
+        def total(self, *nums):
+            return sum(nums)
+
+        def numbers(self):
+            return [1, 2, 3]
+
+        def plain(self):
+            return 'plain'
+    return cli
+
+def test_pipeline():
+    events = []
+    cli = new_group(events)
+    res = cli(['extract', 'db', '--count', '2', '+', 'transform', '--fast',
+               '+', 'load', '--verbose'])
+    assert res == '0,10!'
+    # generators are chained, each record passes through before the next
+    assert events == [
+        'extract 0', 'transform 0', 'extract 1', 'transform 1', 'load']
+
+def test_streaming():
+    events = []
+    cli = new_group(events)
+    assert cli.invoke(['extract', '+', 'transform']).exit_code == 0
+    # the last step's generator was never consumed
+    assert events == []
+
+def test_live_objects():
+    cli = new_group([])
+    res = cli.invoke(['numbers', '+', 'total'])
+    assert res.value == 6
+    res = cli.invoke(['numbers', '+', 'transform', '+', 'load'])
+    assert isinstance(res.exception, TypeError)  # ints are not records
+
+def test_same_command_twice():
+    cli = new_group([])
+    res = cli.invoke(['extract', '--count', '1', '+', 'transform', '--fast',
+                      '+', 'transform', '+', 'load'])
+    assert res.value == '0'
+    res = cli.invoke(['extract', '--count', '2', '+', 'transform', '--fast',
+                      '+', 'transform', '+', 'load'])
+    assert res.value == '0,20'
+
+def test_errors():
+    cli = new_group([])
+    with raises(UserException, match='cannot take the output'):
+        cli(['numbers', '+', 'plain'])
+    with raises(CommandNotFound):
+        cli(['numbers', '+', '+', 'total'])
+    assert cli(['plain']) == 'plain'
+    # + is a plain argument without pipeline=True
+    @command
+    class other:
+        def echo(self, *args):
+            return ' '.join(args)
+    assert other(['echo', 'a', '+', 'b']) == 'a + b'
+
+    with raises(DeveloperException):
+        @subcommand(pipe='nope')
+        def bad(records):
+            pass
@@ -0,0 +1,113 @@
+import pytest
+
+import os
+import sys
+import importlib
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command
+from dispatch import plugins
+
+ENTRY_POINTS = '''
+[testcli.commands]
+hello = testcli_hello:hello
+add-up = testcli_math:add_up
+broken = testcli_missing:nope
+'''
+
+HELLO = '''
+def hello(name: str = 'world'):
+    """Say hello.
+
+    :n name: who to greet
+    """
+    return f'hello {name}'
+'''
+
+MATH = '''
+from dispatch import command
+
+@command
+def add_up(*args):
+    """Add numbers together."""
+    return str(sum(int(a) for a in args))
+'''
+
+
+@pytest.fixture
+def plugin_env(tmp_path, monkeypatch):
+    site = tmp_path / 'site'
+    dist = site / 'testcli_plugins-1.0.dist-info'
+    dist.mkdir(parents=True)
+    (dist / 'METADATA').write_text(
+        'Metadata-Version: 2.1\nName: testcli-plugins\nVersion: 1.0\n')
+    (dist / 'entry_points.txt').write_text(ENTRY_POINTS)
+    (site / 'testcli_hello.py').write_text(HELLO)
+    (site / 'testcli_math.py').write_text(MATH)
+    monkeypatch.syspath_prepend(str(site))
+    importlib.invalidate_caches()
+    yield site, str(tmp_path / 'cache')
+    for mod in ('testcli_hello', 'testcli_math'):
+        sys.modules.pop(mod, None)
+
+def new_group(cache):
+    @command(plugins='testcli.commands', plugin_cache=cache)
+    class cli:
+        verbose: bool
+
+        def builtin(self):
+            '''A normal command.'''
+            return 'builtin'
+    return cli
+
+def test_plugin_commands(plugin_env, capsys):
+    site, cache = plugin_env
+    cli = new_group(cache)
+    assert os.path.exists(plugins.manifest_path('testcli.commands', cache))
+    assert 'broken' not in cli.commands
+    assert cli(['hello', '--name', 'joe']) == 'hello joe'
+    assert cli(['hello', '-n', 'bob']) == 'hello bob'
+    assert cli(['add-up', '1', '2', '3']) == '6'
+    assert cli(['builtin']) == 'builtin'
+
+    hlp = cli.helptext()
+    assert 'hello     Say hello.' in hlp
+    assert 'add_up    Add numbers together.' in hlp
+
+def test_manifest_avoids_imports(plugin_env, monkeypatch):
+    site, cache = plugin_env
+    new_group(cache)
+    for mod in ('testcli_hello', 'testcli_math'):
+        sys.modules.pop(mod, None)
+
+    def fail(group):
+        raise AssertionError('entry points were scanned again')
+    monkeypatch.setattr(plugins, 'scan', fail)
+
+    cli = new_group(cache)
+    assert 'Say hello.' in cli.helptext()
+    assert 'testcli_hello' not in sys.modules
+    cli(['hello'])
+    assert 'testcli_hello' in sys.modules
+    assert 'testcli_math' not in sys.modules
+
+    manifest = plugins.load_manifest('testcli.commands', cache)
+    entry = manifest['plugins']['hello']
+    assert entry['dist'] == 'testcli-plugins'
+    assert entry['dist_version'] == '1.0'
+    assert entry['flags'][0]['name'] == 'name'
+    assert entry['flags'][0]['shorthand'] == 'n'
+    assert 'error' in manifest['plugins']['broken']
+
+def test_manifest_rebuilt_on_change(plugin_env):
+    site, cache = plugin_env
+    before = plugins.fingerprint()
+    new_group(cache)
+    (site / 'testcli_plugins-1.0.dist-info').rename(
+        site / 'testcli_plugins-1.1.dist-info')
+    assert plugins.fingerprint() != before
+    importlib.invalidate_caches()
+    manifest = plugins.load_manifest('testcli.commands', cache)
+    assert manifest['plugins']['hello']['dist_version'] == '1.0'  # METADATA
+    assert manifest['fingerprint'] == plugins.fingerprint()
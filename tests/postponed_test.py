@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import pytest
+from pytest import raises
+
+import sys
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from typing import List, TYPE_CHECKING
+
+from dispatch import command
+from dispatch.exceptions import DeveloperException
+
+if TYPE_CHECKING:
+    from decimal import Decimal
+
+
+def test_string_annotations():
+    @command
+    def cli(num: int, ratio: float, names: List[str], verbose: bool):
+        assert num == 5
+        assert ratio == 0.5
+        assert names == ['a', 'b']
+        assert verbose is True
+
+    assert cli.flags['num']._type == 'int'
+    cli(['--num', '5', '--ratio=0.5', '--names', 'a,b', '--verbose'])
+    assert cli.flags['num']._type is int
+    assert cli.flags['verbose'].type is bool
+
+def test_lazy_resolution(monkeypatch):
+    @command
+    def cli(price: Decimal, name: str = 'x'):
+        return price
+
+    # the type is only needed once --price is converted
+    assert '--price' in cli.helptext()
+    cli(['--name', 'y'])
+    assert cli.flags['price']._type == 'Decimal'
+    with raises(DeveloperException, match="'Decimal' of flag --price"):
+        cli(['--price', '1.5'])
+
+    from decimal import Decimal as D
+    monkeypatch.setitem(globals(), 'Decimal', D)
+    assert cli(['--price', '1.5']) == D('1.5')
+    assert cli.flags['price']._type is D
+
+@command
+class group:
+    count: int
+    label: str = 'none'
+
+    def show(self):
+        assert self.count == 3
+        assert isinstance(self.count, int)
+        assert self.label == 'yes'
+
+def test_group_string_annotations():
+    group(['--count', '3', 'show', '--label', 'yes'])
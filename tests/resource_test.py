@@ -0,0 +1,189 @@
+import pytest
+from pytest import raises
+
+import sys
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command
+from dispatch.resource import resource, initialized, close_resources
+
+
+def test_lazy_resource():
+    events = []
+
+    @command
+    class cli:
+        verbose: bool
+
+        @resource
+        def db(self):
+            events.append('open')
+            yield 'connection'
+            events.append('close')
+
+        def version(self):
+            return 'v1'
+
+        def query(self):
+            assert self.db == 'connection'
+            assert self.db == 'connection'
+            return 'done'
+
+    assert 'db' not in cli.flags
+    assert cli(['version']) == 'v1'
+    assert events == []
+    assert cli(['query']) == 'done'
+    assert events == ['open', 'close']
+    cli(['query'])
+    assert events == ['open', 'close'] * 2
+
+def test_resource_cleanup_on_error():
+    events = []
+
+    @command
+    class cli:
+        @resource
+        def pool(self):
+            events.append('open')
+            try:
+                yield [1, 2, 3]
+            finally:
+                events.append('close')
+
+        @resource
+        def table(self):
+            return {'a': 1}
+
+        def fail(self):
+            assert self.table['a'] == 1
+            self.pool.append(4)
+            raise ValueError('failed')
+
+    with raises(ValueError):
+        cli(['fail'])
+    assert events == ['open', 'close']
+    assert initialized(cli.inst) == []
+    assert 'pool' not in cli.inst.__dict__
+
+def test_reuse_instance():
+    events = []
+
+    @command(reuse=True)
+    class cli:
+        def __init__(self):
+            events.append('init')
+
+        @resource
+        def db(self):
+            events.append('open')
+            yield f'conn{len(events)}'
+            events.append('close')
+
+        def query(self):
+            return self.db
+
+    first = cli(['query'])
+    assert cli(['query']) == first
+    assert events == ['init', 'open']
+    assert initialized(cli.inst) == ['db']
+    cli.close()
+    assert events == ['init', 'open', 'close']
+
+def test_context_manager():
+    events = []
+
+    @command
+    class cli:
+        def __enter__(self):
+            events.append('enter')
+            return self
+
+        def __exit__(self, *exc):
+            events.append(('exit', exc[0]))
+
+        def run(self):
+            events.append('run')
+
+        def fail(self):
+            raise KeyError('x')
+
+    cli(['run'])
+    assert events == ['enter', 'run', ('exit', None)]
+    events.clear()
+    with raises(KeyError):
+        cli(['fail'])
+    assert events == ['enter', ('exit', KeyError)]
+
+def test_async_context_manager():
+    events = []
+
+    @command
+    class cli:
+        async def __aenter__(self):
+            events.append('enter')
+            return self
+
+        async def __aexit__(self, *exc):
+            events.append('exit')
+
+        async def fetch(self, name: str):
+            events.append('fetch')
+            return f'hello {name}'
+
+    assert cli(['fetch', '--name', 'joe']) == 'hello joe'
+    assert events == ['enter', 'fetch', 'exit']
+
+def test_close_resources_errors():
+    class C:
+        @resource
+        def a(self):
+            yield 1
+            raise RuntimeError('a failed')
+
+        @resource
+        def b(self):
+            yield 2
+            self.closed_b = True
+
+    c = C()
+    assert c.a + c.b == 3
+    with raises(RuntimeError):
+        close_resources(c)
+    assert c.closed_b
+    assert initialized(c) == []
+
+def test_resource_sees_error():
+    events = []
+
+    @command
+    class cli:
+        @resource
+        def tx(self):
+            try:
+                yield 'tx'
+            except ValueError as e:
+                events.append(f'rollback {e}')
+                raise
+            else:
+                events.append('commit')
+
+        @resource
+        def handled(self):
+            try:
+                yield 'h'
+            except ValueError:
+                events.append('handled')
+
+        def ok(self):
+            return self.tx
+
+        def fail(self):
+            assert self.handled + self.tx == 'htx'
+            raise ValueError('failed')
+
+    assert cli(['ok']) == 'tx'
+    assert events == ['commit']
+    with raises(ValueError, match='failed'):
+        cli(['fail'])
+    assert events == ['commit', 'rollback failed', 'handled']
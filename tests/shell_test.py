@@ -0,0 +1,105 @@
+import pytest
+
+import sys
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command
+from dispatch.shell import Shell
+from dispatch.exceptions import BadFlagError
+
+
+def new_group(events):
+    @command
+    class cli:
+        verbose: bool
+        name: str = 'anon'
+
+        def __init__(self):
+            events.append('init')
+            self.seen = []
+
+        def greet(self, loud: bool = False):
+            msg = f'hello {self.name}'
+            if loud:
+                msg = msg.upper()
+            if self.verbose:
+                msg += '!'
+            self.seen.append(msg)
+            return msg
+
+        def count(self):
+            return str(len(self.seen))
+
+        def fail(self):
+            raise ValueError('broken')
+    return cli
+
+def test_session(capsys):
+    events = []
+    cli = new_group(events)
+    Shell(cli, history=False).run(['--name', 'joe'], [
+        'greet',
+        'greet --loud --verbose',
+        '',
+        'greet',
+        'count',
+        'set --verbose',
+        'greet',
+        'greet --nope',
+        'fail',
+        'exit',
+        'greet',
+    ])
+    out, err = capsys.readouterr()
+    assert out.split('\n')[:5] == [
+        'hello joe', 'HELLO JOE!', 'hello joe', '3', 'hello joe!']
+    assert events == ['init']
+    assert "Error: '--nope' is not a flag for 'greet'" in err
+    assert 'ValueError: broken' in err
+    assert cli.reuse is False
+    assert cli.inst is None
+
+def test_completion():
+    cli = new_group([])
+    sh = Shell(cli, history=False)
+    cli._instance()
+    assert sh.completions([], 'gr') == ['greet']
+    assert sh.completions([], '') == [
+        'count', 'exit', 'fail', 'greet', 'help', 'quit', 'set']
+    assert sh.completions(['greet'], '--l') == ['--loud']
+    assert sh.completions(['greet'], '--') == ['--loud', '--name', '--verbose']
+    assert sh.completions([], '--v') == ['--verbose']
+
+def test_group_shell_method(capsys):
+    cli = new_group([])
+    cli.shell(['--verbose'], iter(['greet', 'set']), history=False)
+    assert capsys.readouterr().out == 'hello anon!\n--verbose\n'
+
+def test_help_with_session_flags(capsys):
+    events = []
+    cli = new_group(events)
+    Shell(cli, history=False).run(['--verbose'], ['help', 'help greet'])
+    out, err = capsys.readouterr()
+    assert err == ''
+    assert 'Commands:' in out
+    assert '--loud' in out
+    assert 'hello' not in out  # greet was not run
+
+def test_bad_start_flag():
+    cli = new_group([])
+    with pytest.raises(BadFlagError):
+        Shell(cli, history=False).run(['--nope'], [])
+    assert cli.reuse is False
+
+def test_interrupted_command(capsys):
+    @command
+    class cli:
+        def stuck(self):
+            raise KeyboardInterrupt
+
+        def ok(self):
+            return 'still here'
+
+    assert Shell(cli, history=False).run([], ['stuck', 'ok']) == 0
+    assert capsys.readouterr().out == '\nstill here\n'
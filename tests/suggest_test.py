@@ -0,0 +1,146 @@
+import pytest
+from pytest import raises
+
+import sys
+import random
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command
+from dispatch.exceptions import BadFlagError, CommandNotFound
+from dispatch import _suggest
+from dispatch._suggest import Index, distance, hint
+
+
+def test_distance():
+    assert distance('', '') == 0
+    assert distance('build', 'build') == 0
+    assert distance('biuld', 'build') == 1
+    assert distance('buld', 'build') == 1
+    assert distance('kitten', 'sitting') == 3
+    assert distance('', 'abc') == 3
+    assert distance('kitten', 'sitting', 1) == 2
+    assert distance('a', 'abcdef', 2) == 3
+
+def test_index_matches_scan(monkeypatch):
+    rnd = random.Random(7)
+    words = {
+        ''.join(rnd.choice('abcdefghijklmnopqrstuvwxyz_') for _ in range(rnd.randint(4, 16)))
+        for _ in range(5000)
+    }
+    idx = Index({w: w for w in words})
+    assert len(idx) == len(words)
+
+    calls = []
+    def counted(a, b, limit=None):
+        calls.append(1)
+        return distance(a, b, limit)
+    monkeypatch.setattr(_suggest, 'distance', counted)
+
+    for word in rnd.sample(sorted(words), 20):
+        for typo in (word[:2] + word[3:], word[:1] + word[2] + word[1] + word[3:]):
+            limit = min(max(len(typo) // 3, 1), 3)
+            dists = {w: distance(typo, w, limit) for w in words}
+            best = min(dists.values())
+            want = sorted(w for w, d in dists.items() if d == best)
+            if best > limit:
+                want = []
+            del calls[:]
+            assert idx.suggest(typo) == want[:_suggest.MAX_SUGGESTIONS]
+            # only some of the names are compared with the word
+            assert len(calls) < len(words) / 10
+
+def test_index():
+    idx = Index({'deploy': 'deploy', 'destroy': 'destroy', 'status': 'status'})
+    assert idx.suggest('deplyo') == ['deploy']
+    assert idx.suggest('DEPLOY') == ['deploy']
+    assert idx.suggest('stats') == ['status']
+    assert idx.suggest('xyz') == []
+    assert idx.suggest('d') == []
+
+def test_hint():
+    assert hint([]) == ''
+    assert hint(['a']) == ", did you mean 'a'?"
+    assert hint(['a', 'b', 'c']) == ", did you mean 'a', 'b' or 'c'?"
+
+
+@command(hidden={'secret_thing'})
+class cli:
+    '''
+    :v verbose: talk more
+    '''
+    verbose: bool = False
+
+    def deploy(self, dry_run: bool = False, region: str = 'eu'):
+        '''
+        :r region: where to deploy
+        '''
+        return 'deployed'
+
+    def destroy(self):
+        pass
+
+    def build_all(self):
+        pass
+
+    def secret_thing(self):
+        pass
+
+
+def test_command_suggestions():
+    with raises(CommandNotFound,
+                match=r"'deplyo' is not a command, did you mean 'deploy'\?"):
+        cli(['deplyo', '--verbose'])
+
+    res = cli.invoke(['deplyo'])
+    assert res.exit_code == 1
+    assert "did you mean 'deploy'?" in res.stderr
+
+    res = cli.invoke(['build-al'])
+    assert "did you mean 'build_all'?" in res.stderr
+
+def test_no_suggestion_shows_help():
+    res = cli.invoke(['zzzzzz'])
+    assert res.exit_code == 1
+    assert 'Usage:' in res.stdout
+
+def test_hidden_not_suggested():
+    res = cli.invoke(['secret-thin'])
+    assert 'secret' not in res.stderr
+
+def test_flag_suggestions():
+    with raises(BadFlagError,
+                match=r"'--dry-rn' is not a flag for 'deploy', "
+                      r"did you mean '--dry-run'\?"):
+        cli(['deploy', '--dry-rn'])
+
+    # group flags can be given after the sub-command
+    with raises(BadFlagError, match=r"did you mean '--verbose'\?"):
+        cli(['deploy', '--verbos'])
+
+    with raises(BadFlagError, match=r"did you mean '--verbose'\?"):
+        cli(['--verbse'])
+
+    with raises(BadFlagError, match=r"did you mean '-r'\?"):
+        cli(['deploy', '-R'])
+
+    with raises(BadFlagError) as e:
+        cli(['deploy', '--zzzzzz'])
+    assert 'did you mean' not in str(e.value)
+
+def test_command_flag_suggestions():
+    @command
+    def single(name: str = '', count: int = 1):
+        pass
+
+    with raises(BadFlagError, match=r"did you mean '--count'\?"):
+        single(['--cuont'])
+
+def test_large_group():
+    names = {f'job_{i:04d}': (lambda self: None) for i in range(5000)}
+    group = command(type('generated', (), names))
+
+    res = group.invoke(['jbo-4999'])
+    assert res.exit_code == 1
+    assert "did you mean 'job_4999'?" in res.stderr
+    assert len(group._command_index) == 5000
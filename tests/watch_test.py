@@ -0,0 +1,101 @@
+import pytest
+
+import os
+import sys
+import time
+import signal
+import threading
+from os.path import dirname
+sys.path.insert(0, dirname(dirname(__file__)))
+
+from dispatch import command
+from dispatch import watch
+
+
+def wait_for(cond, timeout=10):
+    end = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < end, 'timed out'
+        time.sleep(0.01)
+
+def background(fn):
+    t = threading.Thread(target=fn, daemon=True)
+    t.start()
+    return t
+
+@pytest.mark.parametrize('poll', [False, True])
+def test_rerun(tmp_path, poll):
+    path = tmp_path / 'in.txt'
+    path.write_text('a')
+    seen = []
+
+    @command
+    def cli(*files):
+        seen.append(open(files[0]).read())
+
+    def edit():
+        for n, text in enumerate('bc', 1):
+            wait_for(lambda: len(seen) == n)
+            path.write_text(text)
+
+    t = background(edit)
+    w = watch.Watch(cli._call, [str(path)], poll=poll, debounce=0.05)
+    w.loop(runs=3)
+    t.join()
+    assert seen == ['a', 'b', 'c']
+
+def test_cancel(tmp_path):
+    path = tmp_path / 'in.txt'
+    path.write_text('slow')
+    started = threading.Event()
+    seen = []
+
+    @command
+    def cli(src: str = ''):
+        text = open(src).read()
+        started.set()
+        if text == 'slow':
+            time.sleep(30)
+        seen.append(text)
+
+    def edit():
+        started.wait()
+        path.write_text('fast')
+
+    start = time.monotonic()
+    t = background(edit)
+    w = watch.Watch(cli._call, ['--src', str(path)], debounce=0.05)
+    w.loop(runs=2)
+    t.join()
+    assert seen == ['fast']
+    assert time.monotonic() - start < 10
+
+@pytest.mark.skipif(not hasattr(signal, 'pthread_kill'), reason='no pthread_kill')
+def test_option_and_globs(tmp_path, capsys):
+    (tmp_path / 'a.tmpl').write_text('a')
+    seen = []
+
+    @command(watch=[str(tmp_path / 'never' / '*.x')])
+    def cli(*args):
+        seen.append(sorted(os.listdir(tmp_path)))
+
+    def edit():
+        wait_for(lambda: len(seen) == 1)
+        (tmp_path / 'b.tmpl').write_text('b')  # a new match for the glob
+        wait_for(lambda: len(seen) == 2)
+        signal.pthread_kill(threading.main_thread().ident, signal.SIGINT)
+
+    t = background(edit)
+    cli([f'--dispatch-watch={tmp_path}/*.tmpl'])
+    t.join()
+    assert seen == [['a.tmpl'], ['a.tmpl', 'b.tmpl']]
+
+def test_paths(tmp_path):
+    f = tmp_path / 'f'
+    f.write_text('')
+    assert watch._paths(['x', f'--in={f}', str(tmp_path), '-', '--v']) == [
+        str(f), str(tmp_path)]
+    targets = watch._Targets([str(f)], [str(tmp_path / '*.py')])
+    assert targets.matches(str(tmp_path), 'f')
+    assert targets.matches(str(tmp_path), 'new.py')
+    assert not targets.matches(str(tmp_path), 'other')